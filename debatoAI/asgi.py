@@ -2,6 +2,9 @@
 ASGI config for debatoAI project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn debatoAI.asgi:application``) so
+async views such as ``ai_response_async`` run on the event loop instead of
+being adapted onto a thread per request.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'myapp.middleware.MetricsMiddleware',
+    'myapp.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', 
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -39,6 +41,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'myapp.middleware.AdmissionControlMiddleware',
 ]
 
 ROOT_URLCONF = 'debatoAI.urls'
@@ -61,13 +64,37 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'debatoAI.wsgi.application'
 
+# Connections are kept for CONN_MAX_AGE seconds and checked before reuse.
+# Write transactions start with BEGIN IMMEDIATE so a writer waits for the lock
+# (up to busy_timeout) up front instead of failing when a read upgrades to a write.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(os.environ.get('RENDER_DISK_MOUNT_PATH', BASE_DIR), 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# PRAGMAs that myapp.db applies to every new SQLite connection. WAL lets readers
+# run alongside the single writer; busy_timeout (ms) makes a blocked writer wait
+# instead of raising "database is locked"; synchronous=NORMAL is durable in WAL
+# mode except for the last commits before a power loss.
+SQLITE_TUNING = {
+    'ENABLED': os.environ.get('SQLITE_TUNING_ENABLED', 'True') == 'True',
+    'PRAGMAS': {
+        'journal_mode': 'wal',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'synchronous': 'normal',
+        'mmap_size': 128 * 1024 * 1024,
+        'cache_size': -20000,  # negative values are KiB, i.e. about 20 MB
+        'temp_store': 'memory',
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -116,5 +143,199 @@ LOGGING = {
     'root': {'handlers': ['console'], 'level': 'INFO'},
 }
 
+# LLM backend used by DebateAIService: GeminiBackend in production, StubBackend
+# or SimulatorBackend (both deterministic and offline) for tests and load tests.
+# Gemini context caching of the static prompt prefix is effectively off: the
+# prefixes are far below its default prefix_cache_min_tokens (32768, the
+# Gemini 1.5 minimum). Lower it in OPTIONS for a pinned model whose minimum
+# the prefixes reach.
+AI_BACKEND = {
+    'BACKEND': os.environ.get('AI_BACKEND', 'myapp.ai_backends.GeminiBackend'),
+    'OPTIONS': {},
+}
+
+# The AI backend client is built once per worker process; with AI_CLIENT_WARMUP
+# its connection is opened at startup instead of on the first turn.
+AI_CLIENT_WARMUP = os.environ.get('AI_CLIENT_WARMUP', 'False') == 'True'
+
+# Tail-latency controls for AI backend calls. A reply gets DEADLINE_FRACTION of
+# the debate's reply_time_limit by difficulty (DEFAULT_DEADLINE without one),
+# capped at MAX_DEADLINE seconds, over up to MAX_ATTEMPTS attempts with jittered
+# exponential backoff from BACKOFF up to BACKOFF_MAX seconds. With HEDGE, a call
+# slower than the HEDGE_QUANTILE of recent ones sends a second request. The
+# BREAKER opens when FAILURE_RATE of the last WINDOW calls failed (at least
+# MIN_CALLS), serving fallback replies for OPEN_SECONDS before probing again.
+AI_RESILIENCE = {
+    'ENABLED': os.environ.get('AI_RESILIENCE_ENABLED', 'True') == 'True',
+    'DEADLINE_FRACTION': {'easy': 0.2, 'medium': 0.25, 'hard': 0.33},
+    'DEFAULT_DEADLINE': 20,
+    'MAX_DEADLINE': int(os.environ.get('AI_MAX_DEADLINE', 30)),
+    'MAX_ATTEMPTS': 3,
+    'BACKOFF': 0.1,
+    'BACKOFF_MAX': 1,
+    'HEDGE': os.environ.get('AI_HEDGE_ENABLED', 'False') == 'True',
+    'HEDGE_QUANTILE': 0.95,
+    'HEDGE_MIN_SAMPLES': 20,
+    'HEDGE_MIN_DELAY': 0.5,
+    'BREAKER': {
+        'WINDOW': 20,
+        'MIN_CALLS': 10,
+        'FAILURE_RATE': 0.5,
+        'OPEN_SECONDS': 30,
+        'HALF_OPEN_CALLS': 1,
+    },
+    'MAX_WORKERS': 32,
+}
+
+# Exact-match AI reply cache. BACKEND is 'local' (per-process LRU with TTL)
+# or 'django' (shared through CACHES[CACHE_ALIAS]); only DIFFICULTIES are cached.
+AI_RESPONSE_CACHE = {
+    'ENABLED': os.environ.get('AI_RESPONSE_CACHE_ENABLED', 'False') == 'True',
+    'BACKEND': os.environ.get('AI_RESPONSE_CACHE_BACKEND', 'local'),
+    'CACHE_ALIAS': 'default',
+    'MAX_SIZE': 1024,
+    'TIMEOUT': 60 * 60,
+    'DIFFICULTIES': ['easy', 'medium'],
+}
+
+# Prompt context: the newest TAIL_MESSAGES messages go to the model verbatim and
+# older ones are folded into Debate.context_summary SUMMARIZE_EVERY at a time.
+# Summary, history and argument are trimmed to TOKEN_BUDGET tokens, estimated
+# as CHARS_PER_TOKEN characters each.
+AI_CONTEXT = {
+    'TAIL_MESSAGES': 6,
+    'SUMMARIZE_EVERY': 4,
+    'SUMMARY_MAX_CHARS': 2000,
+    'TOKEN_BUDGET': 1500,
+    'CHARS_PER_TOKEN': 4,
+}
+
+# Background AI generation. With ENABLED, the ai-response endpoint queues the
+# reply in AIGenerationJob and answers 202; `manage.py run_ai_workers` drains
+# the queue with WORKERS threads or processes. MAX_DEPTH bounds queued jobs and
+# PER_USER_LIMIT a requester's outstanding ones; registered users go before
+# guests. Running jobs older than STALE_AFTER seconds are requeued, up to
+# MAX_ATTEMPTS runs. LONG_POLL_TIMEOUT caps the status endpoint's ?wait=.
+AI_JOB_QUEUE = {
+    'ENABLED': os.environ.get('AI_JOB_QUEUE_ENABLED', 'False') == 'True',
+    'MAX_DEPTH': int(os.environ.get('AI_JOB_QUEUE_MAX_DEPTH', 200)),
+    'PER_USER_LIMIT': 2,
+    'WORKERS': int(os.environ.get('AI_JOB_WORKERS', 4)),
+    'POLL_INTERVAL': 0.5,
+    'LONG_POLL_TIMEOUT': 25,
+    'STALE_AFTER': 120,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_AFTER': 5,
+}
+
+# Admission control for AI-backed endpoints. ENDPOINTS maps URL names to groups;
+# each group has (requests per minute, burst) token buckets per signed-in user,
+# guest session and client IP, kept in CACHES[CACHE_ALIAS] (use a shared cache
+# with several workers). DIFFICULTY_COST is the tokens a request takes by the
+# debate's difficulty; CONCURRENCY caps a group's in-flight requests, beyond
+# which requests are shed with 503 and RETRY_AFTER seconds. TRUSTED_PROXIES is
+# the number of reverse proxies in front of the app whose X-Forwarded-For
+# entries identify the client (one load balancer on Render); with 0 the IP
+# buckets use REMOTE_ADDR.
+RATE_LIMITS = {
+    'ENABLED': os.environ.get('RATE_LIMITS_ENABLED', 'False') == 'True',
+    'CACHE_ALIAS': 'default',
+    'GROUPS': {
+        'ai': {'user': (12, 4), 'session': (6, 3), 'ip': (30, 8)},
+        'messages': {'user': (30, 10), 'session': (15, 5), 'ip': (60, 20)},
+    },
+    'ENDPOINTS': {
+        'ai_response': 'ai',
+        'ai_response_stream': 'ai',
+        'ai_response_async': 'ai',
+        'debate_turn': 'ai',
+        'debate_turn_stream': 'ai',
+        'debate_messages': 'messages',
+    },
+    'DIFFICULTY_COST': {
+        'ai': {'easy': 1, 'medium': 1, 'hard': 2},
+    },
+    'CONCURRENCY': {
+        'ai': int(os.environ.get('RATE_LIMITS_AI_CONCURRENCY', 32)),
+    },
+    'RETRY_AFTER': 2,
+    'TRUSTED_PROXIES': int(os.environ.get('TRUSTED_PROXIES', 1 if 'RENDER' in os.environ else 0)),
+}
+
+# Deduplication of message and AI-reply POSTs. A request with an
+# Idempotency-Key header, or an AI reply to a turn already being answered,
+# runs once and its response is replayed for TTL seconds, or DEGRADED_TTL for
+# a fallback reply. An identical request arriving while it runs waits up to
+# WAIT_TIMEOUT seconds (the longest AI deadline) for that response, then gets
+# a 409 with Retry-After. LEASE_TIMEOUT frees the work of a process that died
+# mid-request. State lives in CACHES[CACHE_ALIAS], so it is off by default:
+# enable it together with a shared cache alias (Redis, Memcached) once
+# CACHES defines one, or with a single worker process.
+IDEMPOTENCY = {
+    'ENABLED': os.environ.get('IDEMPOTENCY_ENABLED', 'False') == 'True',
+    'CACHE_ALIAS': 'default',
+    'TTL': 24 * 60 * 60,
+    'DEGRADED_TTL': 30,
+    'LEASE_TIMEOUT': 120,
+    'WAIT_TIMEOUT': int(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', 30)),
+    'POLL_INTERVAL': 0.05,
+}
+
+# Debate catalog (categories and topics) served from a per-process copy that
+# is rebuilt when the catalog version row in the database changes. Each
+# process reads that row at most every VERSION_CHECK_INTERVAL seconds, which
+# bounds how long another worker's edit goes unnoticed. MAX_AGE is the HTTP
+# Cache-Control max-age.
+CATALOG_CACHE = {
+    'VERSION_CHECK_INTERVAL': 1.0,
+    'MAX_AGE': 300,
+}
+
+# Semantic reply cache: reuses the stored counter-argument of the most similar
+# past opening argument per (topic, difficulty) above THRESHOLD cosine similarity.
+AI_SEMANTIC_CACHE = {
+    'ENABLED': os.environ.get('AI_SEMANTIC_CACHE_ENABLED', 'False') == 'True',
+    'THRESHOLD': float(os.environ.get('AI_SEMANTIC_CACHE_THRESHOLD', 0.92)),
+    'DIMENSIONS': 512,
+    'MAX_ENTRIES_PER_TOPIC': 2000,
+    'MAX_TOPICS': 256,
+    'MAX_HISTORY': 1,
+    'DIFFICULTIES': ['easy', 'medium'],
+}
+
+# Per-request SQL instrumentation (Server-Timing header + /api/admin/query-stats/).
+# BUDGETS caps queries per URL name; BUDGET_ACTION is 'log' or 'raise'.
+QUERY_INSTRUMENTATION = {
+    'ENABLED': os.environ.get('QUERY_INSTRUMENTATION_ENABLED', 'False') == 'True',
+    'BUFFER_SIZE': 200,
+    'BUDGET_ACTION': os.environ.get('QUERY_BUDGET_ACTION', 'log'),
+    'BUDGETS': {
+        'landing': 5,
+        'dashboard': 10,
+        'categories': 4,
+        'topics': 4,
+        'create_debate': 12,
+        'debate_detail': 10,
+        'debate_messages': 6,
+        'ai_response': 8,
+        'debate_turn': 10,
+        'debate_history': 5,
+        'leaderboard': 5,
+        'leaderboard_rank': 4,
+    },
+}
+
+# Prometheus metrics at /metrics. Set MULTIPROCESS_DIR to a directory shared by
+# all worker processes so a scrape reports totals across them. TOKEN, when set,
+# is required as "Authorization: Bearer <token>"; without it only loopback and
+# private client addresses (see RATE_LIMITS TRUSTED_PROXIES) may scrape, unless
+# PUBLIC opens the endpoint to everyone.
+METRICS = {
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_MULTIPROCESS_DIR'),
+    'FLUSH_INTERVAL': 5,
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+    'PUBLIC': os.environ.get('METRICS_PUBLIC', 'False') == 'True',
+}
+
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
\ No newline at end of file
@@ -3,7 +3,7 @@ from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     UserProfile, DebateCategory, DebateTopic, 
-    Debate, DebateMessage, GuestSession
+    Debate, DebateMessage, GuestSession, SiteStatistics, AIGenerationJob
 )
 
 # Inline admin for UserProfile
@@ -48,8 +48,8 @@ class DebateTopicAdmin(admin.ModelAdmin):
 class DebateMessageInline(admin.TabularInline):
     model = DebateMessage
     extra = 0
-    readonly_fields = ['timestamp', 'response_time']
-    fields = ['sender', 'content', 'response_time', 'timestamp']
+    readonly_fields = ['timestamp', 'response_time', 'time_to_first_token']
+    fields = ['sender', 'content', 'response_time', 'time_to_first_token', 'timestamp']
 
 @admin.register(Debate)
 class DebateAdmin(admin.ModelAdmin):
@@ -68,7 +68,7 @@ class DebateAdmin(admin.ModelAdmin):
 
 @admin.register(DebateMessage)
 class DebateMessageAdmin(admin.ModelAdmin):
-    list_display = ['debate', 'sender', 'content_preview', 'response_time', 'timestamp']
+    list_display = ['debate', 'sender', 'content_preview', 'response_time', 'time_to_first_token', 'timestamp']
     list_filter = ['sender', 'timestamp']
     search_fields = ['content', 'debate__user__username']
     readonly_fields = ['timestamp']
@@ -88,6 +88,18 @@ class GuestSessionAdmin(admin.ModelAdmin):
         return f"Guest_{obj.session_id[:8]}..."
     session_preview.short_description = 'Session ID'
 
+@admin.register(SiteStatistics)
+class SiteStatisticsAdmin(admin.ModelAdmin):
+    list_display = ['completed_debates', 'registered_users', 'active_topics', 'reconciled_at']
+    readonly_fields = ['completed_debates', 'registered_users', 'active_topics', 'reconciled_at']
+
+@admin.register(AIGenerationJob)
+class AIGenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'debate', 'user', 'status', 'priority', 'attempts', 'worker', 'created_at', 'finished_at']
+    list_filter = ['status', 'priority']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+    raw_id_fields = ['debate', 'user']
+
 # Customize admin site header and title
 admin.site.site_header = "Debato AI Administration"
 admin.site.site_title = "Debato AI Admin"
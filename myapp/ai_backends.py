@@ -0,0 +1,401 @@
+import asyncio
+import datetime
+import os
+import random
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class AIBackendError(Exception):
+    """Raised by a backend when the model call fails."""
+
+
+class CachedPrefix(NamedTuple):
+    """
+    A static prompt prefix the provider holds, and the prompt tokens it saves
+    per call. ``handle`` is None for a prefix that is not cached, until
+    ``expires_at`` when registration failed, for good when it is too short.
+    """
+    handle: Optional[str]
+    tokens: int
+    expires_at: Optional[float]
+
+
+class BaseAIBackend:
+    """
+    Interface between DebateAIService and a text generation provider.
+
+    Backends receive the fully built prompt and generation config and return
+    plain text, so the service's prompt, cache and persistence logic is the
+    same whichever provider is configured in ``settings.AI_BACKEND``.
+
+    Backends that can cache a static prompt prefix on the provider side
+    override ``cache_prefix``; their ``generate``, ``stream`` and
+    ``agenerate`` then also accept ``cached_prefix=<handle>``, in which case
+    the prompt passed is only the part that follows the prefix.
+    """
+
+    name = 'base'
+    # Seconds a registered prefix lives on the provider; None if it does not expire.
+    prefix_ttl = None
+    # Bound on remembered prefixes, one per topic and difficulty in practice.
+    max_cached_prefixes = 512
+    # Seconds before registering a prefix is tried again after it failed.
+    prefix_retry_after = 300
+
+    def __init__(self, **options):
+        self.options = options
+        self._prefix_lock = threading.Lock()
+        self._prefixes = {}
+        self._registering = set()
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def generate(self, prompt: str, generation_config: Dict) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, generation_config: Dict) -> Iterator[str]:
+        yield self.generate(prompt, generation_config)
+
+    async def agenerate(self, prompt: str, generation_config: Dict) -> str:
+        return await sync_to_async(self.generate, thread_sensitive=False)(prompt, generation_config)
+
+    def count_tokens(self, text: str) -> int:
+        return self.estimate_tokens(text)
+
+    def estimate_tokens(self, text: str) -> int:
+        """A local token estimate, roughly four characters per token for English text; never calls the provider."""
+        return max(1, len(text) // 4)
+
+    def warm_up(self):
+        """Opens connections ahead of the first real turn."""
+
+    def cache_prefix(self, key: str, text: str) -> Optional[str]:
+        """
+        Registers a static prompt prefix with the provider's context cache
+        and returns its handle, or None when it cannot be cached; the prompt
+        is then sent whole.
+        """
+        return None
+
+    def release_prefix(self, handle: str):
+        """Frees what the backend keeps locally for a prefix handle that expired, was evicted or forgotten."""
+
+    def prefix_handle(self, key: str, text: str) -> Optional[CachedPrefix]:
+        """
+        Returns the cached prefix for ``key``, registering it on first use,
+        or None when the prompt must be sent whole. Registration runs outside
+        the lock; turns arriving while it is in progress send the whole prompt
+        rather than wait for it.
+        """
+        now = time.monotonic()
+        with self._prefix_lock:
+            cached = self._prefixes.get(key)
+            if cached is not None and (cached.expires_at is None or cached.expires_at > now):
+                return cached if cached.handle is not None else None
+            if key in self._registering:
+                return None
+            self._registering.add(key)
+        try:
+            handle = self.cache_prefix(key, text)
+        except Exception as e:
+            print(f"--- WARNING: Could not cache prompt prefix, sending it whole: {e} ---")
+            cached = CachedPrefix(None, 0, now + self.prefix_retry_after)
+        else:
+            # Renew a little before the provider drops it.
+            expires_at = now + self.prefix_ttl * 0.9 if handle is not None and self.prefix_ttl else None
+            cached = CachedPrefix(handle, self.estimate_tokens(text) if handle is not None else 0, expires_at)
+        with self._prefix_lock:
+            self._registering.discard(key)
+            dropped = [self._prefixes.pop(key, None)]
+            if len(self._prefixes) >= self.max_cached_prefixes:
+                dropped.append(self._prefixes.pop(next(iter(self._prefixes))))
+            self._prefixes[key] = cached
+        for old in dropped:
+            if old is not None and old.handle is not None and old.handle != cached.handle:
+                self.release_prefix(old.handle)
+        return cached if cached.handle is not None else None
+
+    def forget_prefix(self, key: str):
+        """Drops a prefix whose handle stopped working, so the next call registers it again."""
+        with self._prefix_lock:
+            cached = self._prefixes.pop(key, None)
+        if cached is not None and cached.handle is not None:
+            self.release_prefix(cached.handle)
+
+
+class GeminiBackend(BaseAIBackend):
+    """
+    Google Gemini through ``google.generativeai``.
+
+    Prompt prefixes of at least ``prefix_cache_min_tokens`` tokens are
+    registered as Gemini cached content for ``prefix_ttl`` seconds; shorter
+    ones are below the provider's minimum and are sent with every call. The
+    default is the Gemini 1.5 minimum, well above this app's prompt prefixes,
+    so caching stays off unless a model with a lower minimum is configured.
+    Context caching needs a pinned model version such as
+    ``gemini-1.5-flash-001``. The model built for a cached prefix is dropped
+    when its prefix expires or is forgotten.
+    """
+
+    name = 'gemini'
+    _configure_lock = threading.Lock()
+    _configured_key = None
+
+    def __init__(self, model_name: str = "gemini-1.5-flash-latest", api_key_env: str = "GEMINI_API_KEY",
+                 prefix_cache_min_tokens: int = 32768, prefix_ttl: int = 3600, **options):
+        super().__init__(**options)
+        import google.generativeai as genai
+
+        self.model_name = model_name
+        self.prefix_cache_min_tokens = prefix_cache_min_tokens
+        self.prefix_ttl = prefix_ttl
+        self._cached_models = {}
+        try:
+            api_key = os.getenv(api_key_env)
+            if not api_key:
+                raise ValueError(f"{api_key_env} not found in environment variables.")
+
+            with self._configure_lock:
+                if GeminiBackend._configured_key != api_key:
+                    genai.configure(api_key=api_key)
+                    GeminiBackend._configured_key = api_key
+                    print(f"--- Google Gemini AI Service Initialized Successfully with model: {model_name} ---")
+
+            self.model = genai.GenerativeModel(model_name=model_name)
+        except Exception as e:
+            print(f"--- ERROR: Failed to initialize Gemini AI Service: {e} ---")
+            self.model = None
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    def _model_for(self, cached_prefix):
+        if cached_prefix is None:
+            return self.model
+        model = self._cached_models.get(cached_prefix)
+        if model is None:
+            raise AIBackendError(f"Cached prefix {cached_prefix} was released")
+        return model
+
+    def release_prefix(self, handle):
+        self._cached_models.pop(handle, None)
+
+    def generate(self, prompt, generation_config, cached_prefix=None):
+        response = self._model_for(cached_prefix).generate_content(prompt, generation_config=generation_config)
+        return response.text
+
+    def stream(self, prompt, generation_config, cached_prefix=None):
+        for chunk in self._model_for(cached_prefix).generate_content(prompt, generation_config=generation_config, stream=True):
+            yield chunk.text
+
+    async def agenerate(self, prompt, generation_config, cached_prefix=None):
+        response = await self._model_for(cached_prefix).generate_content_async(prompt, generation_config=generation_config)
+        return response.text
+
+    def count_tokens(self, text):
+        return self.model.count_tokens(text).total_tokens
+
+    def warm_up(self):
+        self.count_tokens("warm-up")
+
+    def cache_prefix(self, key, text):
+        # Estimated locally: a count_tokens RPC per topic would cost more than it saves.
+        if self.estimate_tokens(text) < self.prefix_cache_min_tokens:
+            return None
+        import google.generativeai as genai
+        from google.generativeai import caching
+
+        cached = caching.CachedContent.create(model=self.model_name, display_name=f"debato-{key[:16]}",
+                                              contents=[text], ttl=datetime.timedelta(seconds=self.prefix_ttl))
+        self._cached_models[cached.name] = genai.GenerativeModel.from_cached_content(cached_content=cached)
+        return cached.name
+
+
+DEFAULT_STUB_REPLIES = [
+    "That argument overlooks the people it would hurt most. Look at who actually bears the cost before calling it progress.",
+    "Correlation is doing a lot of work in that claim. Without a causal link, the conclusion simply does not follow.",
+    "History points the other way: every time this was tried at scale, the promised benefits failed to materialize.",
+    "You are assuming the best case. Plan for the realistic case and the argument collapses.",
+]
+
+
+class StubBackend(BaseAIBackend):
+    """
+    Deterministic offline backend for tests, load tests and perf CI.
+
+    Picks a canned counter-argument from a hash of the prompt, waits for a
+    latency drawn from a seeded distribution and streams the reply in word
+    chunks. Token counts are whitespace-delimited words, and call and token
+    totals are kept on the instance.
+
+    With ``prefix_cache`` on, registered prompt prefixes are kept on the
+    instance like a provider-side context cache: ``prefixes_registered``
+    counts registrations, ``prefix_hits`` calls that reused one, and
+    ``cached_prompt_tokens`` the prefix tokens those calls did not resend.
+    ``prompt_tokens`` only counts what was actually sent.
+
+    Latency distributions (seconds): ``fixed`` uses ``latency``; ``uniform``
+    draws from ``[latency_min, latency_max]``; ``normal`` and ``lognormal``
+    use ``latency`` as the mean with ``latency_stddev`` spread.
+    """
+
+    name = 'stub'
+
+    def __init__(self, replies: Optional[List[str]] = None, latency: float = 0.0, distribution: str = 'fixed',
+                 latency_min: float = 0.0, latency_max: float = 0.0, latency_stddev: float = 0.0,
+                 chunk_words: int = 3, seed: int = 0, prefix_cache: bool = True, **options):
+        super().__init__(**options)
+        self.replies = list(replies) if replies is not None else list(DEFAULT_STUB_REPLIES)
+        self.latency = latency
+        self.distribution = distribution
+        self.latency_min = latency_min
+        self.latency_max = latency_max
+        self.latency_stddev = latency_stddev
+        self.chunk_words = max(1, chunk_words)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.prefix_cache = prefix_cache
+        self.registered_prefixes = {}
+        self.prefixes_registered = 0
+        self.prefix_hits = 0
+        self.cached_prompt_tokens = 0
+
+    def sample_latency(self) -> float:
+        with self._lock:
+            if self.distribution == 'uniform':
+                value = self._random.uniform(self.latency_min, self.latency_max)
+            elif self.distribution == 'normal':
+                value = self._random.gauss(self.latency, self.latency_stddev)
+            elif self.distribution == 'lognormal':
+                value = self.latency * self._random.lognormvariate(0, self.latency_stddev)
+            else:
+                value = self.latency
+        return max(0.0, value)
+
+    def reply_for(self, prompt: str) -> str:
+        if not self.replies:
+            return ""
+        return self.replies[zlib.crc32(prompt.encode('utf-8')) % len(self.replies)]
+
+    def _record(self, prompt: str, reply: str, cached_prefix: Optional[str] = None):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += self.count_tokens(prompt)
+            self.completion_tokens += self.count_tokens(reply) if reply else 0
+            if cached_prefix is not None:
+                self.prefix_hits += 1
+                self.cached_prompt_tokens += self.count_tokens(self.registered_prefixes[cached_prefix])
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    def cache_prefix(self, key, text):
+        if not self.prefix_cache:
+            return None
+        handle = f"stub-prefix-{key[:16]}"
+        with self._lock:
+            self.registered_prefixes[handle] = text
+            self.prefixes_registered += 1
+        return handle
+
+    def full_prompt(self, prompt: str, cached_prefix: Optional[str] = None) -> str:
+        """The prompt as the model sees it, with a cached prefix put back in front."""
+        if cached_prefix is None:
+            return prompt
+        if cached_prefix not in self.registered_prefixes:
+            raise AIBackendError(f"Unknown cached prefix {cached_prefix}")
+        return self.registered_prefixes[cached_prefix] + prompt
+
+    def chunks(self, reply: str) -> List[str]:
+        words = reply.split(" ")
+        return [
+            " ".join(words[i:i + self.chunk_words]) + (" " if i + self.chunk_words < len(words) else "")
+            for i in range(0, len(words), self.chunk_words)
+        ] if reply else []
+
+    def generate(self, prompt, generation_config, cached_prefix=None):
+        time.sleep(self.sample_latency())
+        reply = self.reply_for(self.full_prompt(prompt, cached_prefix))
+        self._record(prompt, reply, cached_prefix)
+        return reply
+
+    def stream(self, prompt, generation_config, cached_prefix=None):
+        reply = self.reply_for(self.full_prompt(prompt, cached_prefix))
+        pieces = self.chunks(reply)
+        # Spend most of the latency before the first token, like a real model.
+        latency = self.sample_latency()
+        time.sleep(latency * 0.5)
+        for piece in pieces:
+            yield piece
+            time.sleep(latency * 0.5 / len(pieces))
+        self._record(prompt, reply, cached_prefix)
+
+    async def agenerate(self, prompt, generation_config, cached_prefix=None):
+        await asyncio.sleep(self.sample_latency())
+        reply = self.reply_for(self.full_prompt(prompt, cached_prefix))
+        self._record(prompt, reply, cached_prefix)
+        return reply
+
+
+class SimulatorBackend(StubBackend):
+    """
+    StubBackend that also misbehaves: fails a ``failure_rate`` fraction of
+    calls with AIBackendError and stalls a ``stall_rate`` fraction for
+    ``stall_latency`` seconds, to exercise fallbacks and timeouts offline.
+    """
+
+    name = 'simulator'
+
+    def __init__(self, failure_rate: float = 0.1, stall_rate: float = 0.0, stall_latency: float = 10.0, **options):
+        super().__init__(**options)
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.stall_latency = stall_latency
+        self.failures = 0
+
+    def sample_latency(self):
+        latency = super().sample_latency()
+        with self._lock:
+            stalled = self._random.random() < self.stall_rate
+        return self.stall_latency if stalled else latency
+
+    def _maybe_fail(self):
+        with self._lock:
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+        if failed:
+            raise AIBackendError("Simulated backend failure")
+
+    def generate(self, prompt, generation_config, cached_prefix=None):
+        self._maybe_fail()
+        return super().generate(prompt, generation_config, cached_prefix)
+
+    def stream(self, prompt, generation_config, cached_prefix=None):
+        self._maybe_fail()
+        yield from super().stream(prompt, generation_config, cached_prefix)
+
+    async def agenerate(self, prompt, generation_config, cached_prefix=None):
+        self._maybe_fail()
+        return await super().agenerate(prompt, generation_config, cached_prefix)
+
+
+def build_backend(config: Optional[Dict] = None) -> BaseAIBackend:
+    """Instantiates the backend described by ``settings.AI_BACKEND``."""
+    if config is None:
+        config = getattr(settings, 'AI_BACKEND', {})
+    backend_class = import_string(config.get('BACKEND', 'myapp.ai_backends.GeminiBackend'))
+    return backend_class(**config.get('OPTIONS', {}))
@@ -0,0 +1,323 @@
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from cachetools import TTLCache
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class ResponseCache:
+    """
+    Exact-match cache of AI replies keyed by the normalized prompt inputs.
+
+    Subclasses provide the storage; this class owns key building, the
+    per-difficulty policy and the hit/miss counters.
+    """
+
+    def __init__(self, timeout: int = 3600, difficulties=('easy', 'medium')):
+        self.timeout = timeout
+        self.difficulties = set(difficulties)
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def make_key(self, topic: str, difficulty: str, history: List[Dict], user_message: str, summary: str = '') -> str:
+        """Hashes everything the turn's prompt is built from, so a hit answers the same prompt."""
+        payload = json.dumps([
+            self.normalize(topic),
+            difficulty,
+            self.normalize(summary),
+            [[msg['sender'], self.normalize(msg['content'])] for msg in history],
+            self.normalize(user_message),
+        ])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def should_cache(self, difficulty: str) -> bool:
+        return difficulty in self.difficulties
+
+    def get(self, key: str) -> Optional[str]:
+        content = self._get(key)
+        with self._stats_lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def set(self, key: str, content: str):
+        self._set(key, content)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+        }
+
+    def _get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def _set(self, key: str, content: str):
+        raise NotImplementedError
+
+
+class LocalResponseCache(ResponseCache):
+    """In-process LRU cache with per-entry TTL, bounded to ``max_size`` replies."""
+
+    def __init__(self, max_size: int = 1024, timer=time.monotonic, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._cache = TTLCache(maxsize=max_size, ttl=self.timeout, timer=timer)
+
+    def _get(self, key):
+        with self._lock:
+            return self._cache.get(key)
+
+    def _set(self, key, content):
+        with self._lock:
+            self._cache[key] = content
+
+
+class DjangoResponseCache(ResponseCache):
+    """Stores replies in a configured Django cache so workers can share them."""
+
+    key_prefix = 'ai-response:'
+
+    def __init__(self, alias: str = 'default', **kwargs):
+        super().__init__(**kwargs)
+        self.alias = alias
+
+    def _get(self, key):
+        return caches[self.alias].get(self.key_prefix + key)
+
+    def _set(self, key, content):
+        caches[self.alias].set(self.key_prefix + key, content, self.timeout)
+
+
+def build_response_cache(config: Dict) -> Optional[ResponseCache]:
+    """Creates the cache described by an ``AI_RESPONSE_CACHE`` settings dict."""
+    if not config.get('ENABLED'):
+        return None
+    options = {
+        'timeout': config.get('TIMEOUT', 3600),
+        'difficulties': config.get('DIFFICULTIES', ('easy', 'medium')),
+    }
+    backend = config.get('BACKEND', 'local')
+    if backend == 'local':
+        return LocalResponseCache(max_size=config.get('MAX_SIZE', 1024), **options)
+    if backend == 'django':
+        return DjangoResponseCache(alias=config.get('CACHE_ALIAS', 'default'), **options)
+    raise ValueError(f"Unknown AI response cache backend: {backend}")
+
+
+_UNSET = object()
+_response_cache = _UNSET
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Returns the process-wide response cache, or None when caching is off."""
+    global _response_cache
+    if _response_cache is _UNSET:
+        with _response_cache_lock:
+            if _response_cache is _UNSET:
+                _response_cache = build_response_cache(getattr(settings, 'AI_RESPONSE_CACHE', {}))
+    return _response_cache
+
+
+def reset_response_cache():
+    """Drops the process-wide cache so the next lookup rebuilds it from settings."""
+    global _response_cache
+    with _response_cache_lock:
+        _response_cache = _UNSET
+
+
+class HashingVectorizer:
+    """
+    Embeds text locally as a signed, hashed bag of character n-grams and
+    words, L2-normalized so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, dimensions: int = 512, ngram: int = 3):
+        self.dimensions = dimensions
+        self.ngram = ngram
+
+    def _add(self, vector, token: str):
+        digest = zlib.crc32(token.encode('utf-8'))
+        vector[digest % self.dimensions] += 1.0 if digest & 0x80000000 else -1.0
+
+    def transform(self, text: str) -> np.ndarray:
+        text = ResponseCache.normalize(text)
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        padded = f" {text} "
+        for i in range(len(padded) - self.ngram + 1):
+            self._add(vector, padded[i:i + self.ngram])
+        for word in text.split():
+            self._add(vector, "w:" + word)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+
+class SemanticIndex:
+    """
+    Fixed-width matrix of argument embeddings with their stored replies.
+
+    Grows by doubling up to ``max_entries`` rows, then overwrites the oldest
+    row so memory per topic stays bounded.
+    """
+
+    def __init__(self, dimensions: int, max_entries: int):
+        self.max_entries = max_entries
+        self.vectors = np.zeros((min(64, max_entries), dimensions), dtype=np.float32)
+        self.replies = []
+        self.next_slot = 0
+
+    def __len__(self):
+        return len(self.replies)
+
+    def add(self, vector: np.ndarray, reply: str):
+        size = len(self.replies)
+        if size < self.max_entries:
+            if size == len(self.vectors):
+                grown = np.zeros((min(size * 2, self.max_entries), self.vectors.shape[1]), dtype=np.float32)
+                grown[:size] = self.vectors
+                self.vectors = grown
+            slot = size
+            self.replies.append(reply)
+        else:
+            slot = self.next_slot
+            self.next_slot = (slot + 1) % self.max_entries
+            self.replies[slot] = reply
+        self.vectors[slot] = vector
+
+    def nearest(self, vector: np.ndarray) -> Tuple[float, Optional[str]]:
+        if not self.replies:
+            return 0.0, None
+        scores = self.vectors[:len(self.replies)] @ vector
+        best = int(np.argmax(scores))
+        return float(scores[best]), self.replies[best]
+
+
+class SemanticResponseCache:
+    """
+    Reuses counter-arguments for user arguments that differ only in wording.
+
+    Keeps one SemanticIndex per (topic, difficulty), least recently used
+    topics evicted past ``max_topics``, and serves the stored reply of the
+    most similar past argument when its cosine similarity reaches
+    ``threshold``. Only opening turns (``max_history`` messages of history
+    or fewer) are eligible, since the lookup ignores the conversation.
+    """
+
+    def __init__(self, threshold: float = 0.92, dimensions: int = 512, max_entries_per_topic: int = 2000,
+                 max_topics: int = 256, max_history: int = 1, difficulties=('easy', 'medium')):
+        self.threshold = threshold
+        self.vectorizer = HashingVectorizer(dimensions=dimensions)
+        self.max_entries_per_topic = max_entries_per_topic
+        self.max_topics = max_topics
+        self.max_history = max_history
+        self.difficulties = set(difficulties)
+        self.hits = 0
+        self.misses = 0
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def should_cache(self, difficulty: str, conversation_history: List[Dict]) -> bool:
+        return difficulty in self.difficulties and len(conversation_history) <= self.max_history
+
+    def vectorize(self, text: str) -> np.ndarray:
+        return self.vectorizer.transform(text)
+
+    def _index(self, topic: str, difficulty: str, create: bool = False) -> Optional[SemanticIndex]:
+        key = (ResponseCache.normalize(topic), difficulty)
+        index = self._indexes.get(key)
+        if index is None and create:
+            index = self._indexes[key] = SemanticIndex(self.vectorizer.dimensions, self.max_entries_per_topic)
+            if len(self._indexes) > self.max_topics:
+                self._indexes.popitem(last=False)
+        if index is not None:
+            self._indexes.move_to_end(key)
+        return index
+
+    def lookup(self, topic: str, difficulty: str, vector: np.ndarray) -> Optional[str]:
+        with self._lock:
+            index = self._index(topic, difficulty)
+            score, reply = index.nearest(vector) if index is not None else (0.0, None)
+            if reply is not None and score >= self.threshold:
+                self.hits += 1
+                return reply
+            self.misses += 1
+            return None
+
+    def add(self, topic: str, difficulty: str, vector: np.ndarray, reply: str):
+        with self._lock:
+            self._index(topic, difficulty, create=True).add(vector, reply)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = sum(len(index) for index in self._indexes.values())
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+            'topics': len(self._indexes),
+            'entries': entries,
+        }
+
+
+def build_semantic_cache(config: Dict) -> Optional[SemanticResponseCache]:
+    """Creates the cache described by an ``AI_SEMANTIC_CACHE`` settings dict."""
+    if not config.get('ENABLED'):
+        return None
+    return SemanticResponseCache(
+        threshold=config.get('THRESHOLD', 0.92),
+        dimensions=config.get('DIMENSIONS', 512),
+        max_entries_per_topic=config.get('MAX_ENTRIES_PER_TOPIC', 2000),
+        max_topics=config.get('MAX_TOPICS', 256),
+        max_history=config.get('MAX_HISTORY', 1),
+        difficulties=config.get('DIFFICULTIES', ('easy', 'medium')),
+    )
+
+
+_semantic_cache = _UNSET
+
+
+def get_semantic_cache() -> Optional[SemanticResponseCache]:
+    """Returns the process-wide semantic cache, or None when it is off."""
+    global _semantic_cache
+    if _semantic_cache is _UNSET:
+        with _response_cache_lock:
+            if _semantic_cache is _UNSET:
+                _semantic_cache = build_semantic_cache(getattr(settings, 'AI_SEMANTIC_CACHE', {}))
+    return _semantic_cache
+
+
+def reset_semantic_cache():
+    """Drops the process-wide semantic cache so it is rebuilt from settings."""
+    global _semantic_cache
+    with _response_cache_lock:
+        _semantic_cache = _UNSET
+
+
+@receiver(setting_changed)
+def reset_response_cache_on_setting_change(setting, **kwargs):
+    if setting == 'AI_RESPONSE_CACHE':
+        reset_response_cache()
+    elif setting == 'AI_SEMANTIC_CACHE':
+        reset_semantic_cache()
@@ -1,106 +1,415 @@
-import os
+import hashlib
+import threading
 import time
-from typing import List, Dict
-import google.generativeai as genai
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Iterator, NamedTuple, Optional
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .ai_backends import BaseAIBackend, build_backend
+from .ai_cache import get_response_cache, get_semantic_cache
+from .resilience import CircuitOpen, DeadlineExceeded, get_resilience_policy
+from . import metrics
+
+UNAVAILABLE_MESSAGE = "I'm currently unable to connect to my AI core. Please try again later."
+FALLBACK_MESSAGE = "I'm having a bit of trouble formulating a response right now. Could you please rephrase your argument?"
+
+
+def is_fallback(content: str) -> bool:
+    """Whether a reply is one of the canned messages served instead of a model reply."""
+    return content in (UNAVAILABLE_MESSAGE, FALLBACK_MESSAGE)
+
+DIFFICULTY_INSTRUCTIONS = {
+    'easy': "Your persona is that of a friendly beginner. Use simple language and make one clear, straightforward point. Avoid complex vocabulary and concepts. Your goal is to have an accessible discussion.",
+    'medium': "Your persona is that of a knowledgeable peer. Your arguments should be well-reasoned and logical. You can introduce related concepts or general evidence to support your point. Your goal is a balanced, intelligent debate.",
+    'hard': "Your persona is that of an expert debater. Your arguments should be sharp, analytical, and directly challenge the user's logic. You can point out fallacies, use advanced vocabulary, and introduce complex, multi-layered counter-arguments. Your goal is to win the debate decisively."
+}
+
+
+@dataclass(frozen=True)
+class PromptPrefix:
+    """The static head of the prompt, the same on every turn of a topic and difficulty."""
+    key: str
+    text: str
+
+
+class Prompt(NamedTuple):
+    prefix: PromptPrefix
+    suffix: str
+
+    @property
+    def text(self) -> str:
+        return self.prefix.text + self.suffix
+
+
+class OutgoingPrompt:
+    """
+    What a turn sends to the backend: the suffix against the provider's
+    cached prefix, or the whole prompt once that prefix has failed.
+    """
+
+    def __init__(self, prompt: Prompt, text: str, options: Dict):
+        self.prompt = prompt
+        self.text = text
+        self.options = options
+
+    def drop_prefix(self, backend: BaseAIBackend, error: Exception):
+        # The provider may have evicted the prefix early; register it afresh next turn.
+        print(f"--- WARNING: Cached prompt prefix failed, resending the whole prompt: {error!r} ---")
+        backend.forget_prefix(self.prompt.prefix.key)
+        self.text = self.prompt.text
+        self.options = {}
+
+
+@lru_cache(maxsize=512)
+def static_prefix(topic: str, difficulty: str) -> PromptPrefix:
+    """Builds the persona, rules and topic header once per (topic, difficulty)."""
+    text = f"""You are Debato AI, a formidable and intelligent debate opponent.
+The topic of this debate is: "{topic}"
+
+**Your Persona and Instructions for this round (Difficulty: {difficulty.upper()}):**
+{DIFFICULTY_INSTRUCTIONS.get(difficulty, "")}
+
+**General Rules:**
+1. Analyze the user's last message and the conversation history.
+2. You must take an opposing stance to the user.
+3. Generate a strong, concise counter-argument based on your persona. Your response must be short, around 2-4 sentences.
+4. Do not agree with the user or concede points.
+
+---
+"""
+    return PromptPrefix(key=hashlib.sha256(text.encode('utf-8')).hexdigest(), text=text)
+
 
 class DebateAIService:
     """
-    AI service that uses the Google Gemini API to generate
-    dynamic and contextual debate responses.
+    AI service that generates dynamic and contextual debate responses
+    through the LLM backend configured in ``settings.AI_BACKEND``.
     """
-    
-    def __init__(self):
+
+    def __init__(self, backend: BaseAIBackend = None):
         """
-        Initializes the Gemini AI model.
+        Initializes the configured AI backend, or wraps an already constructed one.
         """
-        try:
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                raise ValueError("GEMINI_API_KEY not found in environment variables.")
-            
-            genai.configure(api_key=api_key)
-            
-            self.model = genai.GenerativeModel(model_name="gemini-1.5-flash-latest")
-            print("--- Google Gemini AI Service Initialized Successfully with model: gemini-1.5-flash-latest ---")
-
-
-        except Exception as e:
-            print(f"--- ERROR: Failed to initialize Gemini AI Service: {e} ---")
-            self.model = None
+        self.backend = backend if backend is not None else build_backend()
 
     def generate_response(self, user_message: str, topic: str, difficulty: str, 
-                         conversation_history: List[Dict]) -> Dict:
+                         conversation_history: List[Dict], summary: str = '',
+                         reply_time_limit: Optional[int] = None) -> Dict:
         """
-        Generates a contextual debate response using the generative model.
+        Generates a contextual debate response using the generative model,
+        within the deadline the resilience policy derives from the debate's
+        ``reply_time_limit``.
         """
         start_time = time.time()
+
+        cached_content, remember = self._cache_lookup(user_message, topic, difficulty, conversation_history, summary)
+        if cached_content is not None:
+            response_time = round(time.time() - start_time, 2)
+            self._record_reply(difficulty, 'cache', response_time, cached_content)
+            return {'content': cached_content, 'response_time': response_time, 'sender': 'ai'}
         
-        if not self.model:
+        policy = get_resilience_policy()
+        unavailable = self._unavailable_reason(policy)
+        if unavailable:
+            self._record_reply(difficulty, unavailable, 0, UNAVAILABLE_MESSAGE)
             return {
-                'content': "I'm currently unable to connect to my AI core. Please try again later.", 
+                'content': UNAVAILABLE_MESSAGE, 
                 'response_time': 0, 
                 'sender': 'ai'
             }
 
+        prompt = self._build_prompt(user_message, topic, difficulty, conversation_history, summary)
+        metrics.ai_prompt_chars.observe(len(prompt.text), difficulty=difficulty)
+        outgoing = self._send_args(prompt, difficulty)
+        
+        generation_config = self._generation_config(difficulty)
+        deadline = policy.deadline(difficulty, reply_time_limit)
+        source = 'model'
+        try:
+            # Send the prompt and the new config to the AI model
+            ai_content = policy.call(self.backend.name, lambda: self._generate(outgoing, generation_config), difficulty, deadline).strip()
+            remember(ai_content)
+        except CircuitOpen:
+            ai_content = UNAVAILABLE_MESSAGE
+            source = 'circuit_open'
+        except Exception as e:
+            print(f"--- ERROR: AI backend call failed: {e!r} ---")
+            metrics.ai_errors_total.inc(difficulty=difficulty)
+            ai_content = FALLBACK_MESSAGE
+            source = self._failure_source(e)
+
+        end_time = time.time()
+        response_time = round(end_time - start_time, 2)
+        self._record_reply(difficulty, source, response_time, ai_content)
+        
+        return {'content': ai_content, 'response_time': response_time, 'sender': 'ai'}
+
+    async def agenerate_response(self, user_message: str, topic: str, difficulty: str,
+                                 conversation_history: List[Dict], summary: str = '',
+                                 reply_time_limit: Optional[int] = None) -> Dict:
+        """
+        Async counterpart of generate_response that awaits the model instead
+        of blocking a worker thread for the full generation latency.
+        """
+        start_time = time.time()
+
+        cached_content, remember = self._cache_lookup(user_message, topic, difficulty, conversation_history, summary)
+        if cached_content is not None:
+            response_time = round(time.time() - start_time, 2)
+            self._record_reply(difficulty, 'cache', response_time, cached_content)
+            return {'content': cached_content, 'response_time': response_time, 'sender': 'ai'}
+
+        policy = get_resilience_policy()
+        unavailable = self._unavailable_reason(policy)
+        if unavailable:
+            self._record_reply(difficulty, unavailable, 0, UNAVAILABLE_MESSAGE)
+            return {
+                'content': UNAVAILABLE_MESSAGE,
+                'response_time': 0,
+                'sender': 'ai'
+            }
+
+        prompt = self._build_prompt(user_message, topic, difficulty, conversation_history, summary)
+        metrics.ai_prompt_chars.observe(len(prompt.text), difficulty=difficulty)
+        outgoing = self._send_args(prompt, difficulty)
+
+        generation_config = self._generation_config(difficulty)
+        deadline = policy.deadline(difficulty, reply_time_limit)
+        source = 'model'
+        try:
+            ai_content = (await policy.acall(self.backend.name, lambda: self._agenerate(outgoing, generation_config), difficulty, deadline)).strip()
+            remember(ai_content)
+        except CircuitOpen:
+            ai_content = UNAVAILABLE_MESSAGE
+            source = 'circuit_open'
+        except Exception as e:
+            print(f"--- ERROR: AI backend async call failed: {e!r} ---")
+            metrics.ai_errors_total.inc(difficulty=difficulty)
+            ai_content = FALLBACK_MESSAGE
+            source = self._failure_source(e)
+
+        end_time = time.time()
+        response_time = round(end_time - start_time, 2)
+        self._record_reply(difficulty, source, response_time, ai_content)
+
+        return {'content': ai_content, 'response_time': response_time, 'sender': 'ai'}
+
+    def stream_response(self, user_message: str, topic: str, difficulty: str,
+                        conversation_history: List[Dict], summary: str = '',
+                        reply_time_limit: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Streams a debate response as it is generated.
+
+        Yields ``{'type': 'chunk', 'content': ...}`` events for each piece of
+        text, followed by a single ``{'type': 'done', ...}`` event carrying the
+        full content, the total response time and the time to first token.
+        """
+        start_time = time.time()
+
+        cached_content, remember = self._cache_lookup(user_message, topic, difficulty, conversation_history, summary)
+        if cached_content is not None:
+            response_time = round(time.time() - start_time, 2)
+            self._record_reply(difficulty, 'cache', response_time, cached_content)
+            yield {'type': 'chunk', 'content': cached_content}
+            yield {
+                'type': 'done',
+                'content': cached_content,
+                'response_time': response_time,
+                'time_to_first_token': response_time,
+                'sender': 'ai'
+            }
+            return
+
+        policy = get_resilience_policy()
+        unavailable = self._unavailable_reason(policy)
+        if unavailable:
+            self._record_reply(difficulty, unavailable, 0, UNAVAILABLE_MESSAGE)
+            yield {
+                'type': 'done',
+                'content': UNAVAILABLE_MESSAGE,
+                'response_time': 0,
+                'time_to_first_token': 0,
+                'sender': 'ai'
+            }
+            return
+
+        prompt = self._build_prompt(user_message, topic, difficulty, conversation_history, summary)
+        metrics.ai_prompt_chars.observe(len(prompt.text), difficulty=difficulty)
+        outgoing = self._send_args(prompt, difficulty)
+        generation_config = self._generation_config(difficulty)
+        deadline = policy.deadline(difficulty, reply_time_limit)
+        parts = []
+        first_token_time = None
+        source = 'model'
+        failure = 'error'
+
+        try:
+            for piece in policy.stream(self.backend.name, lambda: self._stream(outgoing, generation_config), difficulty, deadline):
+                if not piece:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.time()
+                parts.append(piece)
+                yield {'type': 'chunk', 'content': piece}
+            if parts:
+                remember("".join(parts).strip())
+        except CircuitOpen:
+            failure = 'circuit_open'
+        except Exception as e:
+            print(f"--- ERROR: AI backend streaming call failed: {e!r} ---")
+            metrics.ai_errors_total.inc(difficulty=difficulty)
+            failure = self._failure_source(e)
+
+        if not parts:
+            source = failure
+            first_token_time = time.time()
+            parts.append(FALLBACK_MESSAGE)
+            yield {'type': 'chunk', 'content': FALLBACK_MESSAGE}
+
+        end_time = time.time()
+        content = "".join(parts).strip()
+        response_time = round(end_time - start_time, 2)
+        self._record_reply(difficulty, source, response_time, content)
+
+        yield {
+            'type': 'done',
+            'content': content,
+            'response_time': response_time,
+            'time_to_first_token': round(first_token_time - start_time, 2),
+            'sender': 'ai'
+        }
+
+    def _cache_lookup(self, user_message: str, topic: str, difficulty: str,
+                      conversation_history: List[Dict], summary: str = ''):
+        """
+        Looks the turn up in the exact-match and semantic response caches.
+        The exact-match key covers the same summary and history the prompt
+        is built from.
+
+        Returns ``(content, remember)``: ``content`` is a cached reply or None
+        on a miss, and ``remember(reply)`` stores a freshly generated reply in
+        every cache that applies to this turn.
+        """
+        stores = []
+
+        cache = get_response_cache()
+        if cache is not None and cache.should_cache(difficulty):
+            key = cache.make_key(topic, difficulty, conversation_history, user_message, summary)
+            content = cache.get(key)
+            metrics.ai_cache_lookups_total.inc(cache='exact', result='miss' if content is None else 'hit')
+            if content is not None:
+                return content, None
+            stores.append(lambda reply: cache.set(key, reply))
+
+        semantic_cache = get_semantic_cache()
+        if semantic_cache is not None and semantic_cache.should_cache(difficulty, conversation_history):
+            vector = semantic_cache.vectorize(user_message)
+            content = semantic_cache.lookup(topic, difficulty, vector)
+            metrics.ai_cache_lookups_total.inc(cache='semantic', result='miss' if content is None else 'hit')
+            if content is not None:
+                for store in stores:
+                    store(content)
+                return content, None
+            stores.append(lambda reply: semantic_cache.add(topic, difficulty, vector, reply))
+
+        def remember(reply):
+            for store in stores:
+                store(reply)
+
+        return None, remember
+
+    def _unavailable_reason(self, policy) -> Optional[str]:
+        """Why the backend cannot be called right now, or None when it can."""
+        if not self.backend.available:
+            return 'unavailable'
+        if policy.rejecting(self.backend.name):
+            return 'circuit_open'
+        return None
+
+    def _failure_source(self, error: Exception) -> str:
+        return 'timeout' if isinstance(error, DeadlineExceeded) else 'error'
+
+    def _generate(self, outgoing: OutgoingPrompt, generation_config: Dict) -> str:
+        """One backend call; a failure against the cached prefix is repeated at once with the whole prompt."""
+        if outgoing.options:
+            try:
+                return self.backend.generate(outgoing.text, generation_config, **outgoing.options)
+            except Exception as e:
+                outgoing.drop_prefix(self.backend, e)
+        return self.backend.generate(outgoing.text, generation_config)
+
+    async def _agenerate(self, outgoing: OutgoingPrompt, generation_config: Dict) -> str:
+        if outgoing.options:
+            try:
+                return await self.backend.agenerate(outgoing.text, generation_config, **outgoing.options)
+            except Exception as e:
+                outgoing.drop_prefix(self.backend, e)
+        return await self.backend.agenerate(outgoing.text, generation_config)
+
+    def _stream(self, outgoing: OutgoingPrompt, generation_config: Dict) -> Iterator[str]:
+        # Only a failure before the first chunk can be repeated without the prefix.
+        if outgoing.options:
+            pieces = self.backend.stream(outgoing.text, generation_config, **outgoing.options)
+            try:
+                first = next(pieces)
+            except StopIteration:
+                return
+            except Exception as e:
+                outgoing.drop_prefix(self.backend, e)
+            else:
+                yield first
+                yield from pieces
+                return
+        yield from self.backend.stream(outgoing.text, generation_config)
+
+    def _record_reply(self, difficulty: str, source: str, response_time: float, content: str):
+        """
+        Records latency and size metrics for a reply; ``source`` is model,
+        cache, or for canned replies error, timeout, unavailable or circuit_open.
+        """
+        metrics.ai_response_seconds.observe(response_time, difficulty=difficulty, source=source)
+        metrics.ai_response_chars.observe(len(content), difficulty=difficulty)
+        if source not in ('model', 'cache'):
+            metrics.ai_fallback_replies_total.inc(reason=source)
+
+    def _generation_config(self, difficulty: str) -> Dict:
+        """Returns the sampling configuration for the given difficulty."""
         temperature = 0.7
         if difficulty == 'medium':
             temperature = 0.85
         elif difficulty == 'hard':
             temperature = 1.0
             
-        generation_config = {
+        return {
             "temperature": temperature,
             "top_p": 1,
             "top_k": 1,
             "max_output_tokens": 2048,
         }
 
-        prompt = self._build_prompt(user_message, topic, difficulty, conversation_history)
-        
-        try:
-            # Send the prompt and the new config to the AI model
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config
-            )
-            ai_content = response.text.strip()
-        except Exception as e:
-            print(f"--- ERROR: Gemini API call failed: {e} ---")
-            ai_content = "I'm having a bit of trouble formulating a response right now. Could you please rephrase your argument?"
-
-        end_time = time.time()
-        response_time = round(end_time - start_time, 2)
-        
-        return {'content': ai_content, 'response_time': response_time, 'sender': 'ai'}
+    def _send_args(self, prompt: Prompt, difficulty: str) -> OutgoingPrompt:
+        """
+        Returns what to send: only the suffix when the backend holds the
+        prefix in its context cache, the whole prompt otherwise.
+        """
+        cached = self.backend.prefix_handle(prompt.prefix.key, prompt.prefix.text)
+        metrics.ai_prompt_tokens_saved.observe(cached.tokens if cached else 0, difficulty=difficulty)
+        if cached is None:
+            return OutgoingPrompt(prompt, prompt.text, {})
+        return OutgoingPrompt(prompt, prompt.suffix, {'cached_prefix': cached.handle})
 
     def _build_prompt(self, user_message: str, topic: str, difficulty: str,
-                      conversation_history: List[Dict]) -> str:
-        """Constructs a detailed prompt for the AI model."""
+                      conversation_history: List[Dict], summary: str = '') -> Prompt:
+        """Constructs a detailed prompt for the AI model: the topic's static prefix and this turn's suffix."""
 
         history_str = "\n".join(
-            [f"- {msg['sender'].upper()}: {msg['content']}" for msg in conversation_history[-4:]]
+            [f"- {msg['sender'].upper()}: {msg['content']}" for msg in conversation_history]
         )
+        summary_str = f"EARLIER IN THE DEBATE (summary):\n{summary}\n\n" if summary else ""
 
-        difficulty_instructions = {
-            'easy': "Your persona is that of a friendly beginner. Use simple language and make one clear, straightforward point. Avoid complex vocabulary and concepts. Your goal is to have an accessible discussion.",
-            'medium': "Your persona is that of a knowledgeable peer. Your arguments should be well-reasoned and logical. You can introduce related concepts or general evidence to support your point. Your goal is a balanced, intelligent debate.",
-            'hard': "Your persona is that of an expert debater. Your arguments should be sharp, analytical, and directly challenge the user's logic. You can point out fallacies, use advanced vocabulary, and introduce complex, multi-layered counter-arguments. Your goal is to win the debate decisively."
-        }
-        
-        prompt = f"""You are Debato AI, a formidable and intelligent debate opponent.
-The topic of this debate is: "{topic}"
-
-**Your Persona and Instructions for this round (Difficulty: {difficulty.upper()}):**
-{difficulty_instructions.get(difficulty, "")}
-
-**General Rules:**
-1. Analyze the user's last message and the conversation history.
-2. You must take an opposing stance to the user.
-3. Generate a strong, concise counter-argument based on your persona. Your response must be short, around 2-4 sentences.
-4. Do not agree with the user or concede points.
-
----
-CONVERSATION HISTORY (Most recent messages):
+        suffix = f"""{summary_str}CONVERSATION HISTORY (Most recent messages):
 {history_str}
 
 USER'S LATEST ARGUMENT: "{user_message}"
@@ -108,4 +417,74 @@ USER'S LATEST ARGUMENT: "{user_message}"
 
 Now, generate your counter-argument based on your assigned persona and instructions:
 """
-        return prompt
\ No newline at end of file
+        return Prompt(static_prefix(topic, difficulty), suffix)
+
+
+class AIClientRegistry:
+    """
+    Process-wide DebateAIService, built and warmed once per process and
+    shared by every request thread. The backend and its registered prompt
+    prefixes are shared with it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._service = None
+        self.warm = False
+
+    @property
+    def initialized(self) -> bool:
+        return self._service is not None
+
+    def initialize(self):
+        """Builds the service if it has not been built yet."""
+        with self._lock:
+            if self._service is None:
+                self._service = DebateAIService()
+
+    def reset(self):
+        """Drops the service so the next request rebuilds it from settings."""
+        with self._lock:
+            self._service = None
+            self.warm = False
+
+    def get_service(self) -> DebateAIService:
+        if self._service is None:
+            self.initialize()
+        return self._service
+
+    def warm_up(self):
+        """Opens the backend connection ahead of the first real turn."""
+        self.initialize()
+        try:
+            if self._service.backend.available:
+                self._service.backend.warm_up()
+            self.warm = self._service.backend.available
+        except Exception as e:
+            print(f"--- ERROR: AI backend warm-up failed: {e} ---")
+            self.warm = False
+
+    def status(self) -> Dict:
+        service = self._service
+        backend = service.backend.name if service is not None else None
+        return {
+            'initialized': service is not None,
+            'available': service is not None and service.backend.available,
+            'backend': backend,
+            'warm': self.warm,
+            'circuit': get_resilience_policy().breaker(backend).status() if backend else None,
+        }
+
+
+ai_clients = AIClientRegistry()
+
+
+def get_ai_service() -> DebateAIService:
+    """Returns the already-initialized DebateAIService of this process."""
+    return ai_clients.get_service()
+
+
+@receiver(setting_changed)
+def reset_ai_clients_on_setting_change(setting, **kwargs):
+    if setting == 'AI_BACKEND':
+        ai_clients.reset()
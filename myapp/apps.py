@@ -1,4 +1,6 @@
+import threading
 from django.apps import AppConfig
+from django.conf import settings
 from django.db.models.signals import post_migrate
 
 def populate_data(sender, **kwargs):
@@ -21,6 +23,15 @@ class MyappConfig(AppConfig):
 
     def ready(self):
         """
-        Connect the populate_data function to be called after migrations are run.
+        Connect the populate_data function to be called after migrations are run
+        and the SQLite tuning, catalog, site statistics and leaderboard
+        handlers, and optionally warm the AI client in the background.
         """
-        post_migrate.connect(populate_data, sender=self)
\ No newline at end of file
+        post_migrate.connect(populate_data, sender=self)
+        # Connects the SQLite tuning, catalog, site statistics and leaderboard
+        # signal handlers, and registers the system checks.
+        from . import catalog, checks, db, leaderboard, sitestats  # noqa: F401
+
+        if getattr(settings, 'AI_CLIENT_WARMUP', False):
+            from .ai_service import ai_clients
+            threading.Thread(target=ai_clients.warm_up, name='ai-client-warmup', daemon=True).start()
\ No newline at end of file
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CatalogVersion, DebateCategory, DebateTopic
+
+SINGLETON_PK = 1
+
+# Bound on memoized topic filter combinations, as the filters come straight
+# from query parameters.
+MAX_TOPIC_LISTS = 256
+
+
+class CatalogCache:
+    """
+    Process-local copy of the debate catalog: the active categories with
+    their active topic counts, and the active topic lists per category and
+    difficulty, already serialized.
+
+    The copy is tagged with the catalog version stored in the CatalogVersion
+    row. Saving or deleting a category or topic replaces that version, which
+    the editing process notices at once and every other process within
+    ``check_interval`` seconds, the longest it goes without reading the row.
+    Each list is returned with a digest of its serialized content, which the
+    catalog endpoints use as their ETag, so processes holding different
+    copies never share a tag.
+    """
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._categories = None
+        self._topics = None
+        self._topic_lists = {}
+
+    def current_version(self) -> str:
+        if self._version is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return self._version
+        version = CatalogVersion.objects.filter(pk=SINGLETON_PK).values_list('version', flat=True).first()
+        if version is None:
+            version = CatalogVersion.objects.get_or_create(pk=SINGLETON_PK, defaults={'version': uuid.uuid4().hex})[0].version
+        self._checked_at = time.monotonic()
+        return version
+
+    def invalidate(self):
+        """Moves every process on to a new catalog version."""
+        # A fresh token rather than a counter, so a version is never reused
+        # after a rollback or a restored backup.
+        version = uuid.uuid4().hex
+        if not CatalogVersion.objects.filter(pk=SINGLETON_PK).update(version=version):
+            version = CatalogVersion.objects.get_or_create(pk=SINGLETON_PK, defaults={'version': version})[0].version
+        with self._lock:
+            self._categories = None
+            self._topics = None
+            self._topic_lists = {}
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    @staticmethod
+    def digest(data) -> str:
+        return hashlib.sha1(json.dumps(data, cls=DjangoJSONEncoder).encode()).hexdigest()[:32]
+
+    def _sync(self) -> str:
+        version = self.current_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._categories = None
+                    self._topics = None
+                    self._topic_lists = {}
+                    self._version = version
+        return version
+
+    def categories(self) -> Tuple[str, List[Dict]]:
+        """Returns ``(digest, serialized active categories)``."""
+        from .serializers import DebateCategorySerializer
+
+        version = self._sync()
+        categories = self._categories
+        if categories is None:
+            queryset = DebateCategorySerializer.setup_eager_loading(DebateCategory.objects.filter(is_active=True))
+            data = DebateCategorySerializer(queryset, many=True).data
+            categories = (self.digest(data), data)
+            with self._lock:
+                if self._version == version:
+                    self._categories = categories
+        return categories
+
+    def topics(self, category: Optional[str] = None, difficulty: Optional[str] = None) -> Tuple[str, List[Dict]]:
+        """Returns ``(digest, serialized active topics)`` filtered like the topic list endpoint."""
+        from .serializers import DebateTopicSerializer
+
+        version = self._sync()
+        key = (category or None, difficulty or None)
+        topics = self._topic_lists.get(key)
+        if topics is not None:
+            return topics
+
+        all_topics = self._topics
+        if all_topics is None:
+            queryset = DebateTopicSerializer.setup_eager_loading(DebateTopic.objects.filter(is_active=True)).order_by('id')
+            all_topics = DebateTopicSerializer(queryset, many=True).data
+        data = [
+            topic for topic in all_topics
+            if (not category or str(topic['category']) == category)
+            and (not difficulty or topic['difficulty_level'] == difficulty)
+        ]
+        topics = (self.digest(data), data)
+        with self._lock:
+            if self._version == version:
+                self._topics = all_topics
+                if len(self._topic_lists) < MAX_TOPIC_LISTS:
+                    self._topic_lists[key] = topics
+        return topics
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> CatalogCache:
+    """Returns the process-wide catalog cache."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = CatalogCache(check_interval=getattr(settings, 'CATALOG_CACHE', {}).get('VERSION_CHECK_INTERVAL', 1.0))
+    return _catalog
+
+
+@receiver(post_save, sender=DebateCategory)
+@receiver(post_delete, sender=DebateCategory)
+@receiver(post_save, sender=DebateTopic)
+@receiver(post_delete, sender=DebateTopic)
+def invalidate_catalog(sender, **kwargs):
+    get_catalog().invalidate()
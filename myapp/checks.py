@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Cache backends whose entries only the current process sees.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def process_local(alias: str) -> bool:
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches)
+def check_rate_limit_cache(app_configs, **kwargs):
+    from .ratelimit import rate_limit_settings
+
+    config = rate_limit_settings()
+    if config['ENABLED'] and process_local(config['CACHE_ALIAS']):
+        return [Warning(
+            f"RATE_LIMITS keeps its buckets in the process-local cache {config['CACHE_ALIAS']!r}.",
+            hint='Each worker process enforces the limits separately, so N workers admit N times the '
+                 'configured rates. Point RATE_LIMITS["CACHE_ALIAS"] at a shared cache such as Redis.',
+            id='myapp.W001',
+        )]
+    return []
+
+
+@register(Tags.caches)
+def check_idempotency_cache(app_configs, **kwargs):
+    from .idempotency import idempotency_settings
+
+    config = idempotency_settings()
+    if config['ENABLED'] and process_local(config['CACHE_ALIAS']):
+        return [Warning(
+            f"IDEMPOTENCY keeps its leases and replayed responses in the process-local cache {config['CACHE_ALIAS']!r}.",
+            hint='A duplicate request handled by another worker process runs again. Point '
+                 'IDEMPOTENCY["CACHE_ALIAS"] at a shared cache such as Redis.',
+            id='myapp.W002',
+        )]
+    return []
@@ -0,0 +1,130 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from .models import Debate
+
+DEFAULTS = {
+    'TAIL_MESSAGES': 6,
+    'SUMMARIZE_EVERY': 4,
+    'SUMMARY_MAX_CHARS': 2000,
+    'TOKEN_BUDGET': 1500,
+    'CHARS_PER_TOKEN': 4,
+}
+# Each folded message contributes at most this much to the summary.
+SUMMARY_LINE_CHARS = 200
+
+
+def context_settings() -> Dict:
+    return {**DEFAULTS, **getattr(settings, 'AI_CONTEXT', {})}
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // context_settings()['CHARS_PER_TOKEN'])
+
+
+@dataclass
+class DebateContext:
+    """What the prompt sees of a debate: a summary of older turns and the recent messages."""
+    summary: str = ''
+    history: List[Dict] = field(default_factory=list)
+    # Set when older messages were folded into the summary and need saving.
+    summary_update: Optional[Dict] = None
+
+
+def summary_line(message) -> str:
+    """One line per folded message: the sender and the opening of what they said."""
+    text = ' '.join(message.content.split())
+    first_sentence = re.split(r'(?<=[.!?])\s', text, maxsplit=1)[0]
+    if len(first_sentence) > SUMMARY_LINE_CHARS:
+        first_sentence = first_sentence[:SUMMARY_LINE_CHARS - 3].rstrip() + '...'
+    return f"- {message.sender.upper()}: {first_sentence}"
+
+
+def fold_summary(summary: str, messages, max_chars: int) -> str:
+    """Appends the messages to the summary, dropping its oldest lines beyond ``max_chars``."""
+    lines = [line for line in summary.splitlines() if line] + [summary_line(message) for message in messages]
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return '\n'.join(lines)[-max_chars:]
+
+
+def tail_queryset(debate: Debate, config: Dict):
+    """The unsummarized messages, newest first, bounded however long the debate runs."""
+    messages = debate.messages.order_by('-timestamp', '-id')
+    if debate.summary_through_id:
+        messages = messages.filter(id__gt=debate.summary_through_id)
+    return messages[:config['TAIL_MESSAGES'] + config['SUMMARIZE_EVERY']]
+
+
+def assemble(debate: Debate, recent: List, pending_message: Optional[str], config: Dict) -> DebateContext:
+    """
+    Builds the context from the unsummarized messages (oldest first).
+
+    Once SUMMARIZE_EVERY messages have piled up beyond the newest
+    TAIL_MESSAGES, those are folded into the summary in one step, so the
+    summary is rewritten every few turns rather than on every turn. The
+    summary and history are then trimmed, oldest first, to TOKEN_BUDGET.
+    """
+    context = DebateContext(summary=debate.context_summary)
+    tail_size = config['TAIL_MESSAGES']
+    if len(recent) >= tail_size + config['SUMMARIZE_EVERY']:
+        split = len(recent) - tail_size
+        folded, recent = recent[:split], recent[split:]
+        context.summary = fold_summary(context.summary, folded, config['SUMMARY_MAX_CHARS'])
+        context.summary_update = {
+            'previous_through_id': debate.summary_through_id,
+            'context_summary': context.summary,
+            'summary_through_id': folded[-1].id,
+        }
+
+    history = [{'sender': message.sender, 'content': message.content} for message in recent]
+    if pending_message is not None:
+        history.append({'sender': 'user', 'content': pending_message})
+
+    budget = config['TOKEN_BUDGET']
+    used = sum(estimate_tokens(message['content']) for message in history) + estimate_tokens(context.summary)
+    # The latest message always stays; older ones go first, then the summary's oldest lines.
+    while used > budget and len(history) > 1:
+        used -= estimate_tokens(history.pop(0)['content'])
+    if used > budget and context.summary:
+        keep_chars = max(0, (budget - (used - estimate_tokens(context.summary))) * config['CHARS_PER_TOKEN'])
+        context.summary = fold_summary(context.summary, [], keep_chars) if keep_chars else ''
+    context.history = history
+    return context
+
+
+def summary_filter(debate: Debate, update: Dict):
+    # Conditional on the summary the context was built from, so two
+    # concurrent turns do not fold the same messages twice.
+    return Debate.objects.filter(pk=debate.pk, summary_through_id=update['previous_through_id'])
+
+
+def build_context(debate: Debate, pending_message: Optional[str] = None) -> DebateContext:
+    """
+    Returns the prompt context for the debate's next AI reply with one
+    bounded query, plus one UPDATE on the turns that roll the summary
+    forward. ``pending_message`` is a user argument not stored yet.
+    """
+    config = context_settings()
+    recent = list(tail_queryset(debate, config))[::-1]
+    context = assemble(debate, recent, pending_message, config)
+    update = context.summary_update
+    if update:
+        summary_filter(debate, update).update(context_summary=update['context_summary'], summary_through_id=update['summary_through_id'])
+        debate.context_summary, debate.summary_through_id = update['context_summary'], update['summary_through_id']
+    return context
+
+
+async def abuild_context(debate: Debate, pending_message: Optional[str] = None) -> DebateContext:
+    """Async ORM counterpart of build_context."""
+    config = context_settings()
+    recent = [message async for message in tail_queryset(debate, config)][::-1]
+    context = assemble(debate, recent, pending_message, config)
+    update = context.summary_update
+    if update:
+        await summary_filter(debate, update).aupdate(context_summary=update['context_summary'], summary_through_id=update['summary_through_id'])
+        debate.context_summary, debate.summary_through_id = update['context_summary'], update['summary_through_id']
+    return context
@@ -0,0 +1,58 @@
+import logging
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_PRAGMAS = {'journal_mode', 'busy_timeout', 'synchronous', 'mmap_size', 'cache_size', 'temp_store'}
+# journal_mode=wal persists in the database file; the rest last for the connection.
+FILE_ONLY_PRAGMAS = {'journal_mode', 'mmap_size'}
+
+
+def pragma_statements(pragmas):
+    """Validates ``SQLITE_TUNING['PRAGMAS']`` and returns the PRAGMA statements to run."""
+    statements = []
+    for name, value in pragmas.items():
+        if name not in SUPPORTED_PRAGMAS:
+            raise ImproperlyConfigured(f"Unsupported SQLite pragma {name!r}")
+        if not isinstance(value, int) and not re.fullmatch(r'[A-Za-z]+', str(value)):
+            raise ImproperlyConfigured(f"Invalid value {value!r} for SQLite pragma {name!r}")
+        statements.append((name, f'PRAGMA {name} = {value}'))
+    return statements
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    """
+    Applies ``SQLITE_TUNING['PRAGMAS']`` to each new SQLite connection.
+
+    The statements run on the raw DB-API connection, so they are not logged
+    or counted as queries of the request that opened the connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    config = getattr(settings, 'SQLITE_TUNING', {})
+    if not config.get('ENABLED'):
+        return
+    in_memory = connection.is_in_memory_db()
+    for name, statement in pragma_statements(config.get('PRAGMAS', {})):
+        if in_memory and name in FILE_ONLY_PRAGMAS:
+            continue
+        result = connection.connection.execute(statement).fetchone()
+        if name == 'journal_mode' and result and result[0].lower() != str(config['PRAGMAS'][name]).lower():
+            logger.warning(f"SQLite journal_mode is {result[0]}, not {config['PRAGMAS'][name]}")
+
+
+def sqlite_settings(connection):
+    """Returns the effective values of the tuned pragmas on ``connection``."""
+    values = {}
+    with connection.cursor() as cursor:
+        for name in sorted(SUPPORTED_PRAGMAS):
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+    return values
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import time
+import uuid
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import metrics
+
+DEFAULTS = {
+    'ENABLED': False,
+    'CACHE_ALIAS': 'default',
+    'TTL': 24 * 60 * 60,
+    'DEGRADED_TTL': 30,
+    'LEASE_TIMEOUT': 120,
+    'WAIT_TIMEOUT': 30,
+    'POLL_INTERVAL': 0.05,
+}
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+KEY_PREFIX = 'idempotency:'
+
+
+class InvalidKey(Exception):
+    """The Idempotency-Key header is empty or too long."""
+
+
+class KeyReused(Exception):
+    """An Idempotency-Key was sent again with a different request body."""
+
+
+class StillInFlight(Exception):
+    """The original request is still running after waiting WAIT_TIMEOUT seconds for it."""
+
+
+def idempotency_settings() -> Dict:
+    return {**DEFAULTS, **getattr(settings, 'IDEMPOTENCY', {})}
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def requester(request, user=None) -> str:
+    user = user if user is not None else request.user
+    if user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'session:{request.session.session_key}'
+
+
+def flight_key(request, scope: str, turn=None, data=None, user=None) -> Optional[Tuple[str, str]]:
+    """
+    Identifies the work a request asks for as ``(key, fingerprint)``: by its
+    Idempotency-Key and body if it sent a key, otherwise by ``turn`` when
+    the caller can tell which debate turn it answers. Requests without
+    either are not deduplicated. ``data`` is the parsed body, for requests
+    that are not DRF requests.
+    """
+    key = request.headers.get(HEADER)
+    who = requester(request, user)
+    if key is not None:
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise InvalidKey()
+        body = json.dumps(request.data if data is None else data, sort_keys=True, default=str)
+        return _digest(scope, who, 'key', key), _digest(body)
+    if turn is not None:
+        key = _digest(scope, who, 'turn', *turn)
+        return key, key
+    return None
+
+
+class SingleFlight:
+    """
+    Runs each keyed piece of work once and replays its result. Leases and
+    results live in ``CACHES[alias]``, so the guarantee only spans the
+    processes that share that cache; with the default local-memory cache
+    each worker process deduplicates on its own.
+
+    The first request takes a lease with ``cache.add``. Identical requests
+    arriving meanwhile poll for up to ``wait_timeout`` seconds for its
+    result and otherwise raise StillInFlight. Results are kept for ``ttl``
+    seconds, or ``degraded_ttl`` for a degraded result such as a fallback
+    reply, so a turn answered during an outage can be asked again soon. A
+    lease whose holder died expires after ``lease_timeout``, and the next
+    request then takes over.
+    """
+
+    def __init__(self, alias='default', ttl=DEFAULTS['TTL'], degraded_ttl=DEFAULTS['DEGRADED_TTL'],
+                 lease_timeout=DEFAULTS['LEASE_TIMEOUT'], wait_timeout=DEFAULTS['WAIT_TIMEOUT'],
+                 poll_interval=DEFAULTS['POLL_INTERVAL']):
+        self.alias = alias
+        self.ttl = ttl
+        self.degraded_ttl = degraded_ttl
+        self.lease_timeout = lease_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _stored(self, key: str, fingerprint: str) -> Optional[Dict]:
+        stored = self.cache.get(f'{KEY_PREFIX}result:{key}')
+        if stored is not None and stored['fingerprint'] != fingerprint:
+            raise KeyReused()
+        return stored
+
+    def claim(self, key: str, fingerprint: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Returns ``(stored, None)`` with the stored ``{'status', 'data'}`` when
+        the work is already done, possibly after waiting for another request
+        to finish it, or ``(None, lease)`` when this request should do it.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            stored = self._stored(key, fingerprint)
+            if stored is not None:
+                metrics.idempotent_requests_total.inc(result='coalesced' if waited else 'replayed')
+                return stored, None
+            lease = uuid.uuid4().hex
+            if self.cache.add(f'{KEY_PREFIX}lease:{key}', lease, timeout=self.lease_timeout):
+                # The previous holder may have stored its result just before letting go.
+                stored = self._stored(key, fingerprint)
+                if stored is not None:
+                    self.release(key, lease)
+                    metrics.idempotent_requests_total.inc(result='coalesced' if waited else 'replayed')
+                    return stored, None
+                metrics.idempotent_requests_total.inc(result='executed')
+                return None, lease
+            if time.monotonic() >= deadline:
+                raise StillInFlight()
+            waited = True
+            time.sleep(self.poll_interval)
+
+    def complete(self, key: str, lease: str, fingerprint: str, status_code: int, data, degraded: bool = False):
+        """Stores the result for replay, unless it was a server error, and lets go of the lease."""
+        if status_code < 500:
+            self.cache.set(f'{KEY_PREFIX}result:{key}', {'fingerprint': fingerprint, 'status': status_code, 'data': data},
+                           self.degraded_ttl if degraded else self.ttl)
+        self.release(key, lease)
+
+    def release(self, key: str, lease: str):
+        lease_key = f'{KEY_PREFIX}lease:{key}'
+        if self.cache.get(lease_key) == lease:
+            self.cache.delete(lease_key)
+
+
+def get_single_flight() -> SingleFlight:
+    config = idempotency_settings()
+    return SingleFlight(alias=config['CACHE_ALIAS'], ttl=config['TTL'], degraded_ttl=config['DEGRADED_TTL'],
+                        lease_timeout=config['LEASE_TIMEOUT'], wait_timeout=config['WAIT_TIMEOUT'],
+                        poll_interval=config['POLL_INTERVAL'])
+
+
+def replay_response(stored: Dict) -> Response:
+    """A stored result as a response; like a retried turn, a replayed 201 comes back as 200."""
+    status_code = status.HTTP_200_OK if stored['status'] == status.HTTP_201_CREATED else stored['status']
+    return Response(stored['data'], status=status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def error_response(error: Exception) -> Response:
+    if isinstance(error, InvalidKey):
+        return Response({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}, status=status.HTTP_400_BAD_REQUEST)
+    if isinstance(error, KeyReused):
+        return Response({'error': f'{HEADER} was already used for a different request'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response({'error': 'The original request is still being processed'}, status=status.HTTP_409_CONFLICT,
+                    headers={'Retry-After': '1'})
+
+
+class Ticket(NamedTuple):
+    """The lease on a flight held by the request doing its work."""
+    flight: SingleFlight
+    key: str
+    fingerprint: str
+    lease: str
+
+    def complete(self, status_code: int, data, degraded: bool = False):
+        self.flight.complete(self.key, self.lease, self.fingerprint, status_code, data, degraded)
+
+    def release(self):
+        self.flight.release(self.key, self.lease)
+
+
+def begin(request, scope: str, turn=None, data=None, user=None) -> Tuple[Optional[Ticket], Optional[Response]]:
+    """
+    Starts a deduplicated request. Returns ``(ticket, None)`` when this
+    request should do the work and then complete or release the ticket,
+    ``(None, response)`` with the stored or error response to answer with,
+    and ``(None, None)`` when the request is not deduplicated.
+    """
+    if not idempotency_settings()['ENABLED']:
+        return None, None
+    try:
+        flight_id = flight_key(request, scope, turn, data=data, user=user)
+        if flight_id is None:
+            return None, None
+        key, fingerprint = flight_id
+        flight = get_single_flight()
+        stored, lease = flight.claim(key, fingerprint)
+    except (InvalidKey, KeyReused, StillInFlight) as e:
+        return None, error_response(e)
+    if stored is not None:
+        return None, replay_response(stored)
+    return Ticket(flight, key, fingerprint, lease), None
+
+
+def run_once(request, scope: str, handler: Callable[[], Response], turn=None,
+             degraded: Optional[Callable[[Dict], bool]] = None) -> Response:
+    """
+    Runs ``handler`` once per flight key (see flight_key) and answers
+    repeats of the request with its stored response. ``degraded(data)``
+    tells which responses are only kept for DEGRADED_TTL.
+    """
+    ticket, response = begin(request, scope, turn)
+    if response is not None:
+        return response
+    if ticket is None:
+        return handler()
+    try:
+        response = handler()
+    except Exception:
+        ticket.release()
+        raise
+    ticket.complete(response.status_code, response.data, degraded=bool(degraded and degraded(response.data)))
+    return response
@@ -0,0 +1,174 @@
+import logging
+import threading
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .ai_service import get_ai_service
+from .context import build_context
+from .models import AIGenerationJob, Debate, DebateMessage
+from .serializers import DebateMessageSerializer
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MAX_DEPTH': 200,
+    'PER_USER_LIMIT': 2,
+    'WORKERS': 4,
+    'POLL_INTERVAL': 0.5,
+    'LONG_POLL_TIMEOUT': 25,
+    'STALE_AFTER': 120,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_AFTER': 5,
+}
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class QueueFull(Exception):
+    """The queue already holds MAX_DEPTH jobs."""
+
+
+class TooManyJobs(Exception):
+    """The requester already has PER_USER_LIMIT jobs queued or running."""
+
+
+def queue_settings() -> Dict:
+    return {**DEFAULTS, **getattr(settings, 'AI_JOB_QUEUE', {})}
+
+
+def owner_filter(user=None, session_id: Optional[str] = None) -> Dict:
+    if user is not None:
+        return {'user': user}
+    return {'user__isnull': True, 'session_id': session_id}
+
+
+def enqueue(debate: Debate, user_message: str, user=None, session_id: Optional[str] = None) -> Tuple[AIGenerationJob, bool]:
+    """
+    Queues the AI reply to ``user_message``; returns ``(job, created)``.
+
+    A debate has at most one outstanding job, which is returned as-is when
+    the reply is requested again. Raises QueueFull or TooManyJobs instead of
+    queueing past the limits. The checks and the insert share one write
+    transaction, which SQLite's IMMEDIATE mode serializes between workers.
+    """
+    config = queue_settings()
+    with transaction.atomic():
+        existing = AIGenerationJob.objects.filter(debate=debate, status__in=ACTIVE_STATUSES).first()
+        if existing is not None:
+            return existing, False
+        if AIGenerationJob.objects.filter(status='queued').count() >= config['MAX_DEPTH']:
+            metrics.ai_jobs_total.inc(event='rejected_full')
+            raise QueueFull()
+        if AIGenerationJob.objects.filter(status__in=ACTIVE_STATUSES, **owner_filter(user, session_id)).count() >= config['PER_USER_LIMIT']:
+            metrics.ai_jobs_total.inc(event='rejected_user')
+            raise TooManyJobs()
+        job = AIGenerationJob.objects.create(
+            debate=debate, user=user, session_id=None if user is not None else session_id, user_message=user_message,
+            priority=AIGenerationJob.PRIORITY_REGISTERED if user is not None else AIGenerationJob.PRIORITY_GUEST)
+    metrics.ai_jobs_total.inc(event='queued')
+    return job, True
+
+
+def queue_position(job: AIGenerationJob) -> int:
+    """Number of queued jobs that will be claimed before this one."""
+    ahead = Q(priority__lt=job.priority) | Q(priority=job.priority, created_at__lt=job.created_at)
+    return AIGenerationJob.objects.filter(ahead, status='queued').count()
+
+
+def claim(worker: str) -> Optional[AIGenerationJob]:
+    """Marks the next queued job as running for ``worker`` and returns it, or None if the queue is empty."""
+    while True:
+        job_id = (AIGenerationJob.objects.filter(status='queued')
+                  .order_by('priority', 'created_at').values_list('pk', flat=True).first())
+        if job_id is None:
+            return None
+        # Conditional on the status, so a job two workers race for runs once.
+        if AIGenerationJob.objects.filter(pk=job_id, status='queued').update(
+                status='running', worker=worker, started_at=timezone.now(), attempts=F('attempts') + 1):
+            job = AIGenerationJob.objects.select_related('debate__topic').get(pk=job_id)
+            metrics.ai_job_wait_seconds.observe((job.started_at - job.created_at).total_seconds())
+            return job
+
+
+def record_ai_reply(debate: Debate, ai_response: Dict) -> Dict:
+    """Stores an AI reply and bumps the debate counter; returns the ai-response payload."""
+    with transaction.atomic():
+        ai_message = DebateMessage.objects.create(debate=debate, sender='ai', content=ai_response['content'], response_time=ai_response['response_time'], time_to_first_token=ai_response.get('time_to_first_token'))
+        Debate.objects.filter(pk=debate.pk).update(ai_messages_count=F('ai_messages_count') + 1)
+        debate.refresh_from_db(fields=['user_messages_count', 'ai_messages_count'])
+    return {'message': DebateMessageSerializer(ai_message).data, 'debate_status': {'user_messages': debate.user_messages_count, 'ai_messages': debate.ai_messages_count, 'total_messages': debate.user_messages_count + debate.ai_messages_count}}
+
+
+def finish(job: AIGenerationJob, status: str, result: Optional[Dict] = None, error: str = '') -> bool:
+    # Only the worker still holding the job may finish it; a requeued job belongs to its new run.
+    finished = AIGenerationJob.objects.filter(pk=job.pk, status='running', worker=job.worker).update(
+        status=status, result=result, error=error, finished_at=timezone.now())
+    if finished:
+        metrics.ai_jobs_total.inc(event=status)
+    return bool(finished)
+
+
+def run(job: AIGenerationJob) -> bool:
+    """Generates and stores the reply for a claimed job; returns whether it succeeded."""
+    debate = job.debate
+    if debate.status != 'active':
+        finish(job, 'failed', error='Debate is not active')
+        return False
+    try:
+        context = build_context(debate)
+        ai_response = get_ai_service().generate_response(user_message=job.user_message, topic=debate.topic.title, difficulty=debate.difficulty_level, conversation_history=context.history, summary=context.summary, reply_time_limit=debate.reply_time_limit)
+        # The reply is stored together with the job's move to done: if the job
+        # was requeued while this run was generating, its new run owns the
+        # reply and this one is rolled back.
+        with transaction.atomic():
+            payload = record_ai_reply(debate, ai_response)
+            if finish(job, 'done', result=payload):
+                return True
+            transaction.set_rollback(True)
+            return False
+    except Exception as e:
+        logger.error(f"Error generating AI response for job {job.pk}: {str(e)}")
+        finish(job, 'failed', error='Failed to generate AI response')
+        return False
+
+
+def requeue_stale() -> int:
+    """Requeues jobs whose worker stopped responding, failing those out of attempts; returns the number requeued."""
+    config = queue_settings()
+    now = timezone.now()
+    stale = AIGenerationJob.objects.filter(status='running', started_at__lt=now - timedelta(seconds=config['STALE_AFTER']))
+    failed = stale.filter(attempts__gte=config['MAX_ATTEMPTS']).update(status='failed', error='Worker stopped responding', finished_at=now)
+    requeued = stale.filter(attempts__lt=config['MAX_ATTEMPTS']).update(status='queued', worker='', started_at=None)
+    if failed:
+        metrics.ai_jobs_total.inc(failed, event='failed')
+    if requeued:
+        metrics.ai_jobs_total.inc(requeued, event='requeued')
+    return requeued
+
+
+def work(worker: str, stop: threading.Event, drain: bool = False) -> int:
+    """
+    Runs jobs until ``stop`` is set, or until the queue is empty with
+    ``drain``; returns the number of jobs run. Idle polls requeue stale jobs.
+    """
+    poll_interval = queue_settings()['POLL_INTERVAL']
+    processed = 0
+    while not stop.is_set():
+        close_old_connections()
+        job = claim(worker)
+        if job is None:
+            if requeue_stale():
+                continue
+            if drain:
+                break
+            stop.wait(poll_interval)
+            continue
+        run(job)
+        processed += 1
+    return processed
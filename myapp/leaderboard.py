@@ -0,0 +1,130 @@
+from typing import Dict, List, Optional
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import LeaderboardEntry, LeaderboardScore, UserProfile
+
+# Scores pack (win rate in basis points, wins) into one sortable integer, so
+# ranking is a single index order and a tie is an equal score.
+WINS_SCALE = 10 ** 7
+
+
+def compute_score(user_wins: int, total_debates: int) -> int:
+    """Ranking score: win rate first, then number of wins."""
+    basis_points = round(user_wins * 10000 / total_debates) if total_debates else 0
+    return basis_points * WINS_SCALE + min(user_wins, WINS_SCALE - 1)
+
+
+def entry_fields(user_wins: int, total_debates: int) -> Dict:
+    win_rate = round(user_wins / total_debates * 100, 2) if total_debates else 0
+    return {
+        'score': compute_score(user_wins, total_debates),
+        'win_rate': win_rate,
+        'user_wins': user_wins,
+        'total_debates': total_debates,
+    }
+
+
+def _adjust_players(score: int, delta: int):
+    if LeaderboardScore.objects.filter(score=score).update(players=F('players') + delta):
+        return
+    try:
+        with transaction.atomic():
+            LeaderboardScore.objects.create(score=score, players=delta)
+    except IntegrityError:
+        # Another request created the row first.
+        LeaderboardScore.objects.filter(score=score).update(players=F('players') + delta)
+
+
+def update_player(user_id: int):
+    """
+    Brings one player's entry and the per-score counts in line with their
+    profile. Call inside the transaction that updated the profile.
+    """
+    profile = UserProfile.objects.filter(user_id=user_id).values('user_wins', 'total_debates').first()
+    if profile is None or not profile['total_debates']:
+        return
+    fields = entry_fields(profile['user_wins'], profile['total_debates'])
+    with transaction.atomic():
+        entry = LeaderboardEntry.objects.select_for_update().filter(user_id=user_id).only('score').first()
+        if entry is None:
+            LeaderboardEntry.objects.create(user_id=user_id, **fields)
+        else:
+            if entry.score == fields['score']:
+                LeaderboardEntry.objects.filter(user_id=user_id).update(**fields)
+                return
+            _adjust_players(entry.score, -1)
+            LeaderboardEntry.objects.filter(user_id=user_id).update(**fields)
+        _adjust_players(fields['score'], 1)
+
+
+def rank_of_score(score: int) -> int:
+    """Competition rank ("1224") of a score: one more than the players scoring higher."""
+    above = LeaderboardScore.objects.filter(score__gt=score).aggregate(total=Sum('players'))['total']
+    return (above or 0) + 1
+
+
+def assign_ranks(entries: List[LeaderboardEntry]) -> List[LeaderboardEntry]:
+    """
+    Sets ``rank`` on a page of entries in leaderboard order, with one
+    aggregate for the first entry and one lookup of the page's score counts.
+    """
+    if not entries:
+        return entries
+    scores = sorted({entry.score for entry in entries}, reverse=True)
+    players = dict(LeaderboardScore.objects.filter(score__in=scores).values_list('score', 'players'))
+    rank = rank_of_score(scores[0])
+    ranks = {}
+    for score in scores:
+        ranks[score] = rank
+        rank += players.get(score, 0)
+    for entry in entries:
+        entry.rank = ranks[entry.score]
+    return entries
+
+
+def player_rank(user_id: int) -> Optional[LeaderboardEntry]:
+    """Returns the player's entry with ``rank`` set, or None if they are not ranked yet."""
+    entry = LeaderboardEntry.objects.select_related('user').filter(user_id=user_id).first()
+    if entry is not None:
+        entry.rank = rank_of_score(entry.score)
+    return entry
+
+
+def rebuild(batch_size: int = 5000) -> int:
+    """
+    Recreates every entry and score count from the profiles; returns the
+    number of ranked players.
+    """
+    profiles = (UserProfile.objects.filter(total_debates__gt=0)
+                .values_list('user_id', 'user_wins', 'total_debates').order_by().iterator(chunk_size=batch_size))
+    count = 0
+    with transaction.atomic():
+        LeaderboardEntry.objects.all().delete()
+        LeaderboardScore.objects.all().delete()
+        batch = []
+        for user_id, user_wins, total_debates in profiles:
+            batch.append(LeaderboardEntry(user_id=user_id, **entry_fields(user_wins, total_debates)))
+            if len(batch) >= batch_size:
+                LeaderboardEntry.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        LeaderboardEntry.objects.bulk_create(batch)
+        count += len(batch)
+        counts = LeaderboardEntry.objects.values('score').annotate(players=Count('user')).order_by()
+        LeaderboardScore.objects.bulk_create(
+            (LeaderboardScore(score=row['score'], players=row['players']) for row in counts.iterator()),
+            batch_size=batch_size)
+    return count
+
+
+@receiver(pre_delete, sender=User)
+def remove_player(sender, instance, **kwargs):
+    # The entry itself goes with the user's cascade; only the count needs fixing.
+    score = LeaderboardEntry.objects.filter(user_id=instance.pk).values_list('score', flat=True).first()
+    if score is not None:
+        _adjust_players(score, -1)
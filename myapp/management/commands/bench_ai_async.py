@@ -0,0 +1,44 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from myapp.ai_backends import StubBackend
+from myapp.ai_service import DebateAIService
+
+
+class Command(BaseCommand):
+    help = 'Compare sync (thread-per-turn) and async AI turn throughput against the stub backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, default=200, help='Number of AI turns to generate')
+        parser.add_argument('--latency', type=float, default=0.5, help='Artificial model latency in seconds')
+        parser.add_argument('--workers', type=int, default=8, help='Worker threads available to the sync path')
+
+    def handle(self, *args, **options):
+        turns = options['turns']
+        service = DebateAIService(backend=StubBackend(latency=options['latency']))
+        kwargs = {
+            'user_message': 'AI will take all jobs',
+            'topic': 'AI will replace most human jobs',
+            'difficulty': 'medium',
+            'conversation_history': [],
+        }
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            list(pool.map(lambda _: service.generate_response(**kwargs), range(turns)))
+        sync_elapsed = time.perf_counter() - start
+
+        async def run_async():
+            await asyncio.gather(*(service.agenerate_response(**kwargs) for _ in range(turns)))
+
+        start = time.perf_counter()
+        asyncio.run(run_async())
+        async_elapsed = time.perf_counter() - start
+
+        self.stdout.write(f"Turns: {turns}, model latency: {options['latency']}s, sync workers: {options['workers']}")
+        self.stdout.write(f"Sync:  {sync_elapsed:.2f}s total, {turns / sync_elapsed:.1f} turns/sec")
+        self.stdout.write(f"Async: {async_elapsed:.2f}s total, {turns / async_elapsed:.1f} turns/sec")
+        self.stdout.write(self.style.SUCCESS(f"Async speedup: {sync_elapsed / async_elapsed:.1f}x"))
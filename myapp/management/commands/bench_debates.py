@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from myapp.models import DebateTopic
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LockErrorCounter:
+    """execute_wrapper that counts SQLite "database is locked" failures."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if 'locked' in str(e):
+                with self._lock:
+                    self.count += 1
+            raise
+
+
+class Command(BaseCommand):
+    help = 'Drive full debates through the URLconf against the stub AI backend and report per-endpoint latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debates', type=int, default=20, help='Debates to run per participant type')
+        parser.add_argument('--turns', type=int, default=5, help='User/AI exchanges per debate')
+        parser.add_argument('--concurrency', type=int, default=4, help='Debates running at the same time')
+        parser.add_argument('--participants', choices=['users', 'guests', 'both'], default='both')
+        parser.add_argument('--ai-latency', type=float, default=0.0, help='Stub backend latency in seconds')
+        parser.add_argument('--flow', choices=['turn', 'legacy'], default='turn', help='Send each exchange as one turn request or as separate message and AI response requests')
+        parser.add_argument('--database', help='Scratch SQLite file created and deleted for the run (default: a temporary file)')
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+
+    def handle(self, *args, **options):
+        workdir = None
+        database = options['database']
+        if not database:
+            workdir = tempfile.mkdtemp(prefix='debato-bench-')
+            database = os.path.join(workdir, 'bench.sqlite3')
+
+        # Per-request INFO logging would dominate the timings.
+        logging.disable(logging.INFO)
+        setup_test_environment()
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            ai_backend = {'BACKEND': 'myapp.ai_backends.StubBackend', 'OPTIONS': {'latency': options['ai_latency']}}
+            with override_settings(AI_BACKEND=ai_backend):
+                results = self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            logging.disable(logging.NOTSET)
+            if workdir:
+                os.rmdir(workdir)
+
+        self.print_report(results)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def run_benchmark(self, options):
+        topic_ids = list(DebateTopic.objects.filter(is_active=True).values_list('id', flat=True))
+        flows = []
+        if options['participants'] in ('users', 'both'):
+            for i in range(options['debates']):
+                user = User.objects.create_user(username=f'bench_user_{i}', password='bench-password')
+                flows.append(('user', user))
+        if options['participants'] in ('guests', 'both'):
+            flows += [('guest', None)] * options['debates']
+
+        samples = defaultdict(list)
+        samples_lock = threading.Lock()
+        lock_errors = LockErrorCounter()
+
+        def timed(name, call):
+            with connection.execute_wrapper(lock_errors), CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = call()
+                elapsed = time.perf_counter() - start
+            with samples_lock:
+                samples[name].append((elapsed, len(queries), response.status_code))
+            return response
+
+        def run_flow(index, participant):
+            kind, user = participant
+            client = Client()
+            if user:
+                client.force_login(user)
+            try:
+                response = timed('create_debate', lambda: client.post(reverse('create_debate'), {'topic': topic_ids[index % len(topic_ids)], 'difficulty_level': 'medium', 'total_time_limit': 10}, content_type='application/json'))
+                if response.status_code != 201:
+                    return
+                debate_id = response.json()['id']
+                detail = reverse('debate_detail', args=[debate_id])
+                timed('start_debate', lambda: client.patch(detail, {'action': 'start'}, content_type='application/json'))
+                for turn in range(options['turns']):
+                    content = f'Argument {turn} from {kind} {index}'
+                    if options['flow'] == 'turn':
+                        timed('debate_turn', lambda: client.post(reverse('debate_turn', args=[debate_id]), {'content': content, 'turn_id': str(uuid.uuid4())}, content_type='application/json'))
+                        continue
+                    timed('debate_messages', lambda: client.post(reverse('debate_messages', args=[debate_id]), {'content': content, 'sender': 'user'}, content_type='application/json'))
+                    timed('ai_response', lambda: client.post(reverse('ai_response', args=[debate_id]), {'user_message': content}, content_type='application/json'))
+                timed('end_debate', lambda: client.patch(detail, {'action': 'end', 'winner': 'ai'}, content_type='application/json'))
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(lambda args: run_flow(*args), enumerate(flows)))
+        elapsed = time.perf_counter() - start
+
+        endpoints = {}
+        for name, entries in samples.items():
+            latencies = sorted(entry[0] * 1000 for entry in entries)
+            endpoints[name] = {
+                'requests': len(entries),
+                'errors': sum(1 for entry in entries if entry[2] >= 400),
+                'p50_ms': round(percentile(latencies, 0.50), 3),
+                'p95_ms': round(percentile(latencies, 0.95), 3),
+                'p99_ms': round(percentile(latencies, 0.99), 3),
+                'queries_per_request': round(sum(entry[1] for entry in entries) / len(entries), 2),
+            }
+        total_requests = sum(endpoint['requests'] for endpoint in endpoints.values())
+        return {
+            'commit': self.git_commit(),
+            'config': {key: options[key] for key in ('debates', 'turns', 'concurrency', 'participants', 'ai_latency', 'flow')},
+            'elapsed_seconds': round(elapsed, 3),
+            'requests': total_requests,
+            'requests_per_second': round(total_requests / elapsed, 2) if elapsed else 0,
+            'sqlite_lock_errors': lock_errors.count,
+            'endpoints': endpoints,
+        }
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def print_report(self, results):
+        self.stdout.write(f"{results['requests']} requests in {results['elapsed_seconds']}s "
+                          f"({results['requests_per_second']} req/s), SQLite lock errors: {results['sqlite_lock_errors']}")
+        self.stdout.write(f"{'endpoint':<18}{'reqs':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}")
+        for name, endpoint in sorted(results['endpoints'].items()):
+            self.stdout.write(f"{name:<18}{endpoint['requests']:>7}{endpoint['errors']:>8}{endpoint['p50_ms']:>10}"
+                              f"{endpoint['p95_ms']:>10}{endpoint['p99_ms']:>10}{endpoint['queries_per_request']:>9}")
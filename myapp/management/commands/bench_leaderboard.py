@@ -0,0 +1,132 @@
+import json
+import os
+import random
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from myapp import leaderboard
+from myapp.management.commands.bench_debates import percentile
+from myapp.models import LeaderboardEntry, LeaderboardScore, UserProfile
+from myapp.pagination import LeaderboardPagination
+
+
+class Command(BaseCommand):
+    help = 'Rank synthetic profiles in a scratch database and report leaderboard rebuild, page, rank and update latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=1_000_000, help='Synthetic players to create')
+        parser.add_argument('--lookups', type=int, default=1000, help='Timed operations of each kind')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database', help='Scratch SQLite file created and deleted for the run (default: a temporary file)')
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+
+    def handle(self, *args, **options):
+        workdir = None
+        database = options['database']
+        if not database:
+            workdir = tempfile.mkdtemp(prefix='debato-bench-')
+            database = os.path.join(workdir, 'bench.sqlite3')
+
+        setup_test_environment()
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if workdir:
+                os.rmdir(workdir)
+
+        self.print_report(results)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def seed(self, count, rng, batch_size=10000):
+        """Bulk-inserts users and profiles; most players have played a handful of debates."""
+        for offset in range(0, count, batch_size):
+            size = min(batch_size, count - offset)
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    [User(username=f'bench_player_{offset + i}', password='!') for i in range(size)])
+                profiles = []
+                for user in users:
+                    total = min(int(rng.expovariate(1 / 8)) + 1, 500)
+                    skill = rng.betavariate(2, 2)
+                    wins = sum(1 for _ in range(total) if rng.random() < skill)
+                    profiles.append(UserProfile(user=user, user_wins=wins, ai_wins=total - wins, total_debates=total))
+                UserProfile.objects.bulk_create(profiles)
+
+    def timed(self, count, operation):
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            operation()
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        return {
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'max_ms': round(latencies[-1], 3),
+        }
+
+    def run_benchmark(self, options):
+        rng = random.Random(options['seed'])
+        start = time.perf_counter()
+        self.seed(options['profiles'], rng)
+        seed_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ranked = leaderboard.rebuild()
+        rebuild_seconds = time.perf_counter() - start
+
+        user_ids = list(LeaderboardEntry.objects.values_list('user_id', flat=True))
+        page_size = options['page_size']
+        ordered = LeaderboardEntry.objects.select_related('user').order_by(*LeaderboardPagination.ordering)
+
+        def top_page():
+            leaderboard.assign_ranks(list(ordered[:page_size]))
+
+        def deep_page():
+            entry = LeaderboardEntry.objects.only('score', 'user_id').get(user_id=rng.choice(user_ids))
+            leaderboard.assign_ranks(LeaderboardPagination().fetch(ordered, (entry.score, entry.user_id), page_size))
+
+        def update():
+            user_id = rng.choice(user_ids)
+            with transaction.atomic():
+                field = 'user_wins' if rng.random() < 0.5 else 'ai_wins'
+                UserProfile.objects.filter(user_id=user_id).update(**{field: F(field) + 1, 'total_debates': F('total_debates') + 1})
+                leaderboard.update_player(user_id)
+
+        lookups = options['lookups']
+        operations = {
+            'my_rank': self.timed(lookups, lambda: leaderboard.player_rank(rng.choice(user_ids))),
+            'top_page': self.timed(lookups, top_page),
+            'deep_page': self.timed(lookups, deep_page),
+            'record_result': self.timed(lookups, update),
+        }
+        return {
+            'profiles': options['profiles'],
+            'ranked_players': ranked,
+            'distinct_scores': LeaderboardScore.objects.count(),
+            'seed_seconds': round(seed_seconds, 2),
+            'rebuild_seconds': round(rebuild_seconds, 2),
+            'operations': operations,
+        }
+
+    def print_report(self, results):
+        self.stdout.write(f"{results['ranked_players']} players ranked in {results['rebuild_seconds']}s "
+                          f"({results['distinct_scores']} distinct scores; seeding took {results['seed_seconds']}s)")
+        self.stdout.write(f"{'operation':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, timings in results['operations'].items():
+            self.stdout.write(f"{name:<16}{timings['p50_ms']:>10}{timings['p95_ms']:>10}{timings['p99_ms']:>10}{timings['max_ms']:>10}")
@@ -0,0 +1,84 @@
+import json
+import random
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve, reverse
+
+from myapp.management.commands.bench_debates import percentile
+from myapp.middleware import AdmissionControlMiddleware
+from myapp.ratelimit import get_admission_controller
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of the rate limiting and admission control middleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000, help='Timed requests per scenario')
+        parser.add_argument('--identities', type=int, default=1000, help='Distinct users, guest sessions and IPs the requests spread over')
+        parser.add_argument('--cache-alias', default='default', help='CACHES alias holding the buckets')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        url = reverse('ai_response', args=[1])
+        match = resolve(url)
+        factory = RequestFactory()
+        # Generous limits, so every request takes the admitted path through the buckets and the slot counter.
+        config = dict(settings.RATE_LIMITS, ENABLED=True, CACHE_ALIAS=options['cache_alias'],
+                      GROUPS={'ai': {'user': (10 ** 9, 10 ** 6), 'session': (10 ** 9, 10 ** 6), 'ip': (10 ** 9, 10 ** 6)}},
+                      CONCURRENCY={'ai': 10 ** 6})
+        caches[options['cache_alias']].clear()
+
+        def build_request(index):
+            request = factory.post(url, REMOTE_ADDR=f'10.0.{index // 250}.{index % 250}')
+            request.resolver_match = match
+            guest = index % 2
+            request.user = SimpleNamespace(is_authenticated=not guest, pk=index)
+            request.session = SimpleNamespace(session_key=f'session-{index}' if guest else None)
+            return request
+
+        requests = [build_request(rng.randrange(options['identities'])) for _ in range(options['requests'])]
+        results = {}
+        for label, enabled in (('disabled', False), ('enabled', True)):
+            with override_settings(RATE_LIMITS=dict(config, ENABLED=enabled)):
+                middleware = AdmissionControlMiddleware(lambda request: HttpResponse())
+                # The debate's difficulty is looked up once per process; leave that out of the loop.
+                get_admission_controller()._difficulties[1] = 'hard'
+                results[label] = self.timed(middleware, requests)
+
+        overhead = {key: round(results['enabled'][key] - results['disabled'][key], 2) for key in ('mean_us', 'p50_us', 'p99_us')}
+        results['overhead'] = overhead
+        results['cache_backend'] = settings.CACHES[options['cache_alias']]['BACKEND'] if options['cache_alias'] in settings.CACHES else 'default'
+
+        self.stdout.write(f"{'scenario':<10}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+        for label in ('disabled', 'enabled', 'overhead'):
+            row = results[label]
+            self.stdout.write(f"{label:<10}{row['mean_us']:>10}{row['p50_us']:>10}{row['p99_us']:>10}")
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def timed(self, middleware, requests):
+        latencies = []
+        for request in requests:
+            start = time.perf_counter()
+            response = middleware.process_view(request, None, (), {'debate_id': 1})
+            if response is None:
+                response = middleware(request)
+            latencies.append((time.perf_counter() - start) * 1_000_000)
+            if response.status_code != 200:
+                raise RuntimeError(f"Request was not admitted: {response.status_code}")
+        latencies.sort()
+        return {
+            'mean_us': round(sum(latencies) / len(latencies), 2),
+            'p50_us': round(percentile(latencies, 0.50), 2),
+            'p99_us': round(percentile(latencies, 0.99), 2),
+        }
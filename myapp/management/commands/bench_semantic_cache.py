@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myapp.ai_cache import SemanticResponseCache
+
+
+class Command(BaseCommand):
+    help = 'Measure semantic cache lookup latency for one topic with many cached arguments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100_000, help='Cached arguments in the topic index')
+        parser.add_argument('--dimensions', type=int, default=getattr(settings, 'AI_SEMANTIC_CACHE', {}).get('DIMENSIONS', 512),
+                            help='Embedding width (default: AI_SEMANTIC_CACHE DIMENSIONS)')
+        parser.add_argument('--lookups', type=int, default=500, help='Number of timed lookups')
+
+    def handle(self, *args, **options):
+        entries = options['entries']
+        cache = SemanticResponseCache(dimensions=options['dimensions'], max_entries_per_topic=entries)
+        topic, difficulty = 'AI will replace most human jobs', 'easy'
+
+        rng = np.random.default_rng(0)
+        start = time.perf_counter()
+        for offset in range(0, entries, 10_000):
+            batch = rng.standard_normal((min(10_000, entries - offset), options['dimensions'])).astype(np.float32)
+            batch /= np.linalg.norm(batch, axis=1, keepdims=True)
+            for i, vector in enumerate(batch):
+                cache.add(topic, difficulty, vector, f"Stored reply {offset + i}")
+        self.stdout.write(f"Filled {entries} entries in {time.perf_counter() - start:.2f}s")
+
+        queries = [f"AI will take all {word} jobs within a decade" for word in ('the', 'our', 'most', 'many', 'factory')]
+        embed_times, lookup_times = [], []
+        for i in range(options['lookups']):
+            start = time.perf_counter()
+            vector = cache.vectorize(queries[i % len(queries)])
+            embedded = time.perf_counter()
+            cache.lookup(topic, difficulty, vector)
+            done = time.perf_counter()
+            embed_times.append((embedded - start) * 1000)
+            lookup_times.append((done - embedded) * 1000)
+
+        for label, samples in (('embed', embed_times), ('lookup', lookup_times)):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            self.stdout.write(f"{label:>6}: p50 {p50:.3f}ms  p95 {p95:.3f}ms  p99 {p99:.3f}ms")
+        memory_mb = entries * options['dimensions'] * 4 / 1024 / 1024
+        self.stdout.write(self.style.SUCCESS(f"Index matrix size: {memory_mb:.1f} MiB"))
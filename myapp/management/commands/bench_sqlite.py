@@ -0,0 +1,172 @@
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from myapp.db import sqlite_settings
+from myapp.management.commands.bench_debates import LockErrorCounter, percentile
+from myapp.models import Debate, DebateTopic
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent message writers and debate readers against scratch SQLite files with the connection tuning off and on'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Workers posting debate messages')
+        parser.add_argument('--readers', type=int, default=8, help='Workers loading debates')
+        parser.add_argument('--debates', type=int, default=8, help='Debates the workers spread over')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per mode')
+        parser.add_argument('--modes', choices=['off', 'on', 'both'], default='both')
+        parser.add_argument('--processes', action='store_true', help='Run each worker in its own forked process, like separate gunicorn workers, instead of a thread')
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+
+    def handle(self, *args, **options):
+        modes = ['off', 'on'] if options['modes'] == 'both' else [options['modes']]
+        logging.disable(logging.WARNING)
+        setup_test_environment()
+        try:
+            results = {mode: self.run_mode(mode, options) for mode in modes}
+        finally:
+            teardown_test_environment()
+            logging.disable(logging.NOTSET)
+
+        self.print_report(results)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def mode_settings(self, mode):
+        """Connection settings for a mode; 'off' is Django's SQLite defaults."""
+        tuning = dict(settings.SQLITE_TUNING, ENABLED=mode == 'on')
+        options = dict(settings.DATABASES['default'].get('OPTIONS', {}))
+        conn_max_age = settings.DATABASES['default'].get('CONN_MAX_AGE', 0)
+        if mode == 'off':
+            options.pop('transaction_mode', None)
+            conn_max_age = 0
+        return tuning, options, conn_max_age
+
+    def run_mode(self, mode, options):
+        # A fresh file per mode, as journal_mode=wal persists in the database.
+        workdir = tempfile.mkdtemp(prefix='debato-bench-')
+        tuning, db_options, conn_max_age = self.mode_settings(mode)
+        saved = {key: connection.settings_dict.get(key) for key in ('OPTIONS', 'CONN_MAX_AGE')}
+        connection.settings_dict.update(OPTIONS=db_options, CONN_MAX_AGE=conn_max_age)
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+        try:
+            with override_settings(SQLITE_TUNING=tuning):
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+                try:
+                    result = self.run_load(options)
+                    result['pragmas'] = sqlite_settings(connection)
+                    result['conn_max_age'] = conn_max_age
+                    result['transaction_mode'] = db_options.get('transaction_mode', 'DEFERRED')
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            connection.settings_dict.update(saved)
+            shutil.rmtree(workdir, ignore_errors=True)
+        return result
+
+    def run_load(self, options):
+        user = User.objects.create_user(username='bench_sqlite', password='bench-password')
+        topic = DebateTopic.objects.filter(is_active=True).first()
+        debate_ids = [
+            Debate.objects.create(user=user, session_id=f'bench-{i}', topic=topic, difficulty_level='medium',
+                                  total_time_limit=10, reply_time_limit=60, status='active').id
+            for i in range(options['debates'])
+        ]
+        clients = []
+        for _ in range(options['writers'] + options['readers']):
+            client = Client(raise_request_exception=False)
+            client.force_login(user)
+            clients.append(client)
+        connection.close()
+
+        lock_errors = LockErrorCounter()
+        start = time.perf_counter()
+        deadline = start + options['duration']
+
+        def worker(index):
+            kind = 'write' if index < options['writers'] else 'read'
+            client = clients[index]
+            rng = random.Random(index)
+            local = []
+            try:
+                with connection.execute_wrapper(lock_errors):
+                    while time.perf_counter() < deadline:
+                        debate_id = rng.choice(debate_ids)
+                        request_start = time.perf_counter()
+                        if kind == 'write':
+                            response = client.post(reverse('debate_messages', args=[debate_id]), {'content': f'Argument from writer {index}', 'sender': 'user'}, content_type='application/json')
+                        else:
+                            response = client.get(reverse('debate_detail', args=[debate_id]))
+                        local.append((time.perf_counter() - request_start, response.status_code))
+            finally:
+                connection.close()
+            return kind, local
+
+        if options['processes']:
+            outcomes = self.run_processes(worker, len(clients), lock_errors)
+        else:
+            with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+                outcomes = list(pool.map(worker, range(len(clients))))
+        elapsed = time.perf_counter() - start
+
+        samples = {'write': [], 'read': []}
+        for kind, local in outcomes:
+            samples[kind].extend(local)
+        result = {'elapsed_seconds': round(elapsed, 3), 'sqlite_lock_errors': lock_errors.count}
+        for kind, entries in samples.items():
+            latencies = sorted(entry[0] * 1000 for entry in entries)
+            result[kind] = {
+                'requests': len(entries),
+                'errors': sum(1 for entry in entries if entry[1] >= 400),
+                'requests_per_second': round(len(entries) / elapsed, 2) if elapsed else 0,
+                'p50_ms': round(percentile(latencies, 0.50), 3),
+                'p95_ms': round(percentile(latencies, 0.95), 3),
+                'p99_ms': round(percentile(latencies, 0.99), 3),
+            }
+        return result
+
+    def run_processes(self, worker, count, lock_errors):
+        """Runs ``worker(index)`` in forked children and adds their lock errors to ``lock_errors``."""
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+
+        def child(index):
+            kind, local = worker(index)
+            queue.put((kind, local, lock_errors.count))
+
+        processes = [context.Process(target=child, args=(index,)) for index in range(count)]
+        for process in processes:
+            process.start()
+        outcomes = []
+        for _ in processes:
+            kind, local, errors = queue.get()
+            lock_errors.count += errors
+            outcomes.append((kind, local))
+        for process in processes:
+            process.join()
+        return outcomes
+
+    def print_report(self, results):
+        self.stdout.write(f"{'mode':<6}{'kind':<7}{'reqs':>7}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'lock errs':>11}")
+        for mode, result in results.items():
+            for kind in ('write', 'read'):
+                row = result[kind]
+                self.stdout.write(f"{mode:<6}{kind:<7}{row['requests']:>7}{row['errors']:>8}{row['requests_per_second']:>10}"
+                                  f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{result['sqlite_lock_errors']:>11}")
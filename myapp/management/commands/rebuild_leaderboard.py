@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp import leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Recreate the leaderboard entries and per-score counts from the user profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = leaderboard.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Ranked {count} players in {time.perf_counter() - start:.2f}s"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from myapp import sitestats
+
+
+class Command(BaseCommand):
+    help = 'Recount the landing page statistics and correct any drift in the stored counters'
+
+    def handle(self, *args, **options):
+        stored, actual = sitestats.reconcile()
+        if not stored:
+            self.stdout.write(f"Created site statistics: {actual}")
+            return
+        drift = {field: actual[field] - stored[field] for field in sitestats.COUNTER_FIELDS if actual[field] != stored[field]}
+        if drift:
+            self.stdout.write(self.style.WARNING(f"Corrected drift: {drift}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Site statistics already match the tables"))
@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from myapp import jobs
+from myapp.ai_service import ai_clients
+
+
+class Command(BaseCommand):
+    help = 'Generate queued AI replies with a pool of worker threads or processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Concurrent jobs (default: AI_JOB_QUEUE WORKERS)')
+        parser.add_argument('--processes', action='store_true', help='Run each worker in its own forked process instead of a thread')
+        parser.add_argument('--drain', action='store_true', help='Exit once the queue is empty instead of waiting for more jobs')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or jobs.queue_settings()['WORKERS']
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        if options['processes']:
+            stop = multiprocessing.get_context('fork').Event()
+        else:
+            stop = threading.Event()
+        # Finish the jobs in hand on SIGINT or SIGTERM, then exit.
+        previous = {signum: signal.signal(signum, lambda *args: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+        self.stdout.write(f"Starting {workers} AI {'processes' if options['processes'] else 'threads'}")
+        try:
+            if options['processes']:
+                processed = self.run_processes(workers, prefix, stop, options['drain'])
+            else:
+                processed = self.run_threads(workers, prefix, stop, options['drain'])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} AI jobs"))
+
+    def run_worker(self, name, stop, drain):
+        try:
+            return jobs.work(name, stop, drain=drain)
+        finally:
+            connections.close_all()
+
+    def run_threads(self, count, prefix, stop, drain):
+        # Build the shared AI client once rather than in every thread.
+        ai_clients.initialize()
+        results = [0] * count
+
+        def target(index):
+            results[index] = self.run_worker(f"{prefix}/{index}", stop, drain)
+
+        threads = [threading.Thread(target=target, args=(index,), name=f"ai-worker-{index}") for index in range(count)]
+        for thread in threads:
+            thread.start()
+        # Joined with a timeout so signals still reach the main thread.
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+        return sum(results)
+
+    def run_processes(self, count, prefix, stop, drain):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        # Children must open their own database connections.
+        connections.close_all()
+
+        def child(index):
+            results.put(self.run_worker(f"{prefix}/{index}", stop, drain))
+
+        processes = [context.Process(target=child, args=(index,)) for index in range(count)]
+        for process in processes:
+            process.start()
+        # Joined with a timeout so signals still reach the main process.
+        while any(process.is_alive() for process in processes):
+            for process in processes:
+                process.join(timeout=0.5)
+        # Only children that exited cleanly put their count on the queue.
+        processed = 0
+        for process in processes:
+            if process.exitcode == 0:
+                processed += results.get(timeout=5)
+            else:
+                self.stderr.write(f"AI worker process {process.pid} exited with code {process.exitcode}")
+        return processed
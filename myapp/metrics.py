@@ -0,0 +1,290 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, List
+
+from django.conf import settings
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    A named metric with fixed label names.
+
+    Values live in a per-metric dict keyed by the JSON-encoded label values,
+    so recording is a single dict update under a short-lived lock and the
+    snapshot can be written to disk and merged across worker processes.
+    """
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> str:
+        return json.dumps([str(labels.get(name, '')) for name in self.labelnames])
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self._values.items()}
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        registry.maybe_flush()
+
+    @staticmethod
+    def merge(left, right):
+        return left + right
+
+    def render(self, values: Dict) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, json.loads(key))} {_format_value(value)}'
+                for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            # Per-bucket (non-cumulative) counts followed by the sum and the count.
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+        registry.maybe_flush()
+
+    @staticmethod
+    def merge(left, right):
+        return [a + b for a, b in zip(left, right)]
+
+    def render(self, values: Dict) -> List[str]:
+        lines = []
+        for key, entry in sorted(values.items()):
+            labelvalues = json.loads(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = (('le', _format_value(bound)),)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {_format_value(entry[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labelvalues)} {entry[-1]}')
+        return lines
+
+
+class Gauge:
+    """Point-in-time value computed at scrape time, e.g. from the database."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        return [f'{self.name} {_format_value(self.collect())}']
+
+
+class MetricsRegistry:
+    """
+    Holds every metric and renders the Prometheus text exposition format.
+
+    With ``settings.METRICS['MULTIPROCESS_DIR']`` set, each worker process
+    periodically writes its snapshot to ``metrics-<pid>.json`` in that
+    directory and a scrape merges every file, so counters and histograms
+    add up across gunicorn workers whichever worker serves the scrape.
+    Clear the directory on deploy, as files from exited workers are kept.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._gauges = []
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric):
+        if isinstance(metric, Gauge):
+            self._gauges.append(metric)
+        else:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, collect):
+        return self.register(Gauge(name, documentation, collect))
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS', {}).get('MULTIPROCESS_DIR')
+
+    def snapshot(self) -> Dict:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def maybe_flush(self):
+        if not self.directory:
+            return
+        interval = getattr(settings, 'METRICS', {}).get('FLUSH_INTERVAL', 5)
+        if time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def flush(self):
+        directory = self.directory
+        if not directory or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = time.monotonic()
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(self.snapshot(), fh)
+            os.replace(tmp_path, os.path.join(directory, f'metrics-{os.getpid()}.json'))
+        finally:
+            self._flush_lock.release()
+
+    def collect(self) -> Dict:
+        """Returns metric values merged across every process that has flushed."""
+        directory = self.directory
+        if not directory:
+            return self.snapshot()
+        self.flush()
+        merged = {}
+        by_name = {metric.name: metric for metric in self._metrics}
+        for filename in os.listdir(directory):
+            if not (filename.startswith('metrics-') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as fh:
+                    snapshot = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            for name, values in snapshot.items():
+                metric = by_name.get(name)
+                if metric is None:
+                    continue
+                target = merged.setdefault(name, {})
+                for key, value in values.items():
+                    target[key] = metric.merge(target[key], value) if key in target else value
+        return merged
+
+    def render(self) -> str:
+        values = self.collect()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render(values.get(metric.name, {})))
+        for gauge in self._gauges:
+            lines.append(f'# HELP {gauge.name} {gauge.documentation}')
+            lines.append(f'# TYPE {gauge.name} gauge')
+            lines.extend(gauge.render())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        for metric in self._metrics:
+            metric.reset()
+
+
+registry = MetricsRegistry()
+
+SIZE_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+TOKEN_BUCKETS = (0, 50, 100, 250, 500, 1000, 4000, 32000)
+
+ai_response_seconds = registry.histogram(
+    'debato_ai_response_seconds', 'Time to produce an AI reply.', ['difficulty', 'source'])
+ai_errors_total = registry.counter(
+    'debato_ai_errors_total', 'AI backend calls that raised an error.', ['difficulty'])
+ai_fallback_replies_total = registry.counter(
+    'debato_ai_fallback_replies_total', 'Canned replies served instead of a model reply.', ['reason'])
+ai_prompt_chars = registry.histogram(
+    'debato_ai_prompt_chars', 'Size of prompts sent to the AI backend in characters.', ['difficulty'], SIZE_BUCKETS)
+ai_response_chars = registry.histogram(
+    'debato_ai_response_chars', 'Size of AI replies in characters.', ['difficulty'], SIZE_BUCKETS)
+ai_prompt_tokens_saved = registry.histogram(
+    'debato_ai_prompt_tokens_saved', 'Prompt tokens per turn served from a cached prefix instead of resent.', ['difficulty'], TOKEN_BUCKETS)
+ai_cache_lookups_total = registry.counter(
+    'debato_ai_cache_lookups_total', 'AI response cache lookups.', ['cache', 'result'])
+ai_call_retries_total = registry.counter(
+    'debato_ai_call_retries_total', 'AI backend calls retried after a failed attempt.', ['difficulty'])
+ai_hedged_requests_total = registry.counter(
+    'debato_ai_hedged_requests_total', 'Hedged second AI requests: sent, and won when they answered first.', ['difficulty', 'result'])
+ai_circuit_transitions_total = registry.counter(
+    'debato_ai_circuit_transitions_total', 'AI circuit breaker state changes.', ['backend', 'from_state', 'to_state'])
+ai_jobs_total = registry.counter(
+    'debato_ai_jobs_total', 'Background AI generation jobs by event: queued, rejected_full, rejected_user, requeued, done or failed.', ['event'])
+ai_job_wait_seconds = registry.histogram(
+    'debato_ai_job_wait_seconds', 'Time AI generation jobs spent queued before a worker claimed them.')
+rate_limit_decisions_total = registry.counter(
+    'debato_rate_limit_decisions_total', 'Admission decisions for rate-limited endpoints: admitted, limited or shed.', ['group', 'result'])
+idempotent_requests_total = registry.counter(
+    'debato_idempotent_requests_total', 'Deduplicated requests: executed, replayed from a stored result, or coalesced onto one in flight.', ['result'])
+http_request_seconds = registry.histogram(
+    'debato_http_request_seconds', 'Request latency per view.', ['view', 'method'])
+debates_completed_total = registry.counter(
+    'debato_debates_completed_total', 'Debates that reached the completed state.', ['winner'])
+guest_conversions_total = registry.counter(
+    'debato_guest_conversions_total', 'Guest sessions that went on to register an account.')
+
+
+def _active_debates():
+    from .models import Debate
+    return Debate.objects.filter(status='active').count()
+
+
+registry.gauge('debato_active_debates', 'Debates currently in progress.', _active_debates)
+
+
+def _queued_ai_jobs():
+    from .models import AIGenerationJob
+    return AIGenerationJob.objects.filter(status='queued').count()
+
+
+registry.gauge('debato_ai_jobs_queued', 'AI generation jobs waiting for a worker.', _queued_ai_jobs)
@@ -0,0 +1,237 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
+
+from .metrics import http_request_seconds, rate_limit_decisions_total
+from .ratelimit import get_admission_controller
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request runs more queries than its endpoint's budget allows."""
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times every SQL statement of a request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_sql = None
+        self.slowest_duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if elapsed >= self.slowest_duration:
+                self.slowest_duration = elapsed
+                self.slowest_sql = sql
+
+
+class QueryStatsRegistry:
+    """Keeps the most recent request samples per endpoint in bounded ring buffers."""
+
+    def __init__(self, size=200):
+        self.size = size
+        self._samples = defaultdict(lambda: deque(maxlen=self.size))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, sample):
+        with self._lock:
+            self._samples[endpoint].append(sample)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self, include_samples=False):
+        with self._lock:
+            snapshot = {endpoint: list(samples) for endpoint, samples in self._samples.items()}
+        summary = {}
+        for endpoint, samples in snapshot.items():
+            queries = [sample['queries'] for sample in samples]
+            durations = sorted(sample['total_ms'] for sample in samples)
+            slowest = max(samples, key=lambda sample: sample['slowest_ms'])
+            summary[endpoint] = {
+                'requests': len(samples),
+                'avg_queries': round(sum(queries) / len(queries), 2),
+                'max_queries': max(queries),
+                'avg_db_ms': round(sum(sample['db_ms'] for sample in samples) / len(samples), 3),
+                'p95_total_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                'slowest_sql': slowest['slowest_sql'],
+                'slowest_ms': slowest['slowest_ms'],
+            }
+            if include_samples:
+                summary[endpoint]['samples'] = samples
+        return summary
+
+
+query_stats = QueryStatsRegistry(size=getattr(settings, 'QUERY_INSTRUMENTATION', {}).get('BUFFER_SIZE', 200))
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Opt-in per-request SQL instrumentation, enabled by
+    ``settings.QUERY_INSTRUMENTATION['ENABLED']``.
+
+    Records the query count, total DB time and slowest statement of each
+    request, adds them to the response as a ``Server-Timing`` header, keeps
+    them per URL name in ``query_stats`` and enforces ``BUDGETS``. Queries
+    issued while a streaming response is being consumed, and requests
+    served by async views, are not recorded.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = getattr(settings, 'QUERY_INSTRUMENTATION', {})
+        if not config.get('ENABLED'):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        endpoint = request.resolver_match.view_name if request.resolver_match else request.path
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries", '
+            f'total;dur={total * 1000:.2f}'
+        )
+        query_stats.record(endpoint, {
+            'method': request.method,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 3),
+            'total_ms': round(total * 1000, 3),
+            'slowest_sql': recorder.slowest_sql[:500] if recorder.slowest_sql else None,
+            'slowest_ms': round(recorder.slowest_duration * 1000, 3),
+        })
+
+        budget = config.get('BUDGETS', {}).get(endpoint)
+        if budget is not None and recorder.count > budget:
+            message = f"{request.method} {endpoint} ran {recorder.count} queries (budget {budget})"
+            if config.get('BUDGET_ACTION', 'log') == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+
+class MetricsMiddleware:
+    """Observes request latency per URL name into ``debato_http_request_seconds``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _observe(self, request, start):
+        view = request.resolver_match.view_name if request.resolver_match else 'unmatched'
+        http_request_seconds.observe(time.perf_counter() - start, view=view, method=request.method)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, start)
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Rate limits and load shedding for the endpoints in
+    ``settings.RATE_LIMITS['ENDPOINTS']``, enabled by ``RATE_LIMITS['ENABLED']``.
+
+    A request over its token buckets gets a 429, and one beyond its group's
+    concurrency cap a 503, both with ``Retry-After``, before the view runs.
+    An admitted request holds its concurrency slot until the response,
+    including a streamed one, has been sent.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        controller = get_admission_controller()
+        if not controller.config['ENABLED']:
+            return None
+        group = controller.group_for(request.resolver_match.url_name)
+        if group is None:
+            return None
+        wait = controller.check_rate(request, group, view_kwargs)
+        if wait:
+            rate_limit_decisions_total.inc(group=group, result='limited')
+            retry_after = max(1, math.ceil(wait))
+            response = JsonResponse({'error': 'Too many requests', 'retry_after': retry_after}, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+        if not controller.acquire_slot(group):
+            rate_limit_decisions_total.inc(group=group, result='shed')
+            retry_after = controller.config['RETRY_AFTER']
+            response = JsonResponse({'error': 'Server is busy, please try again shortly', 'retry_after': retry_after}, status=503)
+            response['Retry-After'] = str(retry_after)
+            return response
+        rate_limit_decisions_total.inc(group=group, result='admitted')
+        request.admission_group = group
+        return None
+
+    def _release_when_sent(self, request, response):
+        group = getattr(request, 'admission_group', None)
+        if group is None:
+            return response
+        controller = get_admission_controller()
+        if not response.streaming:
+            controller.release_slot(group)
+        else:
+            # Released when the server closes the response, which it does even
+            # if the client went away before the first chunk was sent.
+            response._resource_closers.append(lambda: controller.release_slot(group))
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._release_when_sent(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._release_when_sent(request, await self.get_response(request))
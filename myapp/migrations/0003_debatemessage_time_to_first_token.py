@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_alter_debate_session_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debatemessage',
+            name='time_to_first_token',
+            field=models.FloatField(blank=True, help_text='Time until the first streamed token arrived in seconds', null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_debatemessage_time_to_first_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debatemessage',
+            name='turn_id',
+            field=models.UUIDField(blank=True, help_text='Client-generated id shared by the user message and AI reply of one turn', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='debatemessage',
+            constraint=models.UniqueConstraint(fields=('debate', 'turn_id', 'sender'), name='unique_debate_turn_sender'),
+        ),
+    ]
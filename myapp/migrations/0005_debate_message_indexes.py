@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_debatemessage_turn_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='debatemessage',
+            name='debate',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='myapp.debate'),
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['user', '-created_at'], name='debate_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['status'], name='debate_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debatemessage',
+            index=models.Index(fields=['debate', 'timestamp'], name='message_debate_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debatemessage',
+            index=models.Index(fields=['debate', 'sender', 'timestamp'], name='message_debate_sender_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_debate_message_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='debate',
+            name='debate_user_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['user', 'created_at'], name='debate_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='debate_user_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['user', 'winner', 'created_at'], name='debate_user_winner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['user', 'difficulty_level', 'created_at'], name='debate_user_diff_created_idx'),
+        ),
+    ]
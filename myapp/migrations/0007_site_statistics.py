@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def seed_statistics(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Debate = apps.get_model('myapp', 'Debate')
+    DebateTopic = apps.get_model('myapp', 'DebateTopic')
+    SiteStatistics = apps.get_model('myapp', 'SiteStatistics')
+    SiteStatistics.objects.create(
+        pk=1,
+        completed_debates=Debate.objects.filter(status='completed').count(),
+        registered_users=User.objects.count(),
+        active_topics=DebateTopic.objects.filter(is_active=True).count(),
+        reconciled_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_debate_history_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_debates', models.IntegerField(default=0)),
+                ('registered_users', models.IntegerField(default=0)),
+                ('active_topics', models.IntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Site statistics',
+            },
+        ),
+        migrations.RunPython(seed_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_leaderboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debate',
+            name='context_summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='debate',
+            name='summary_through_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
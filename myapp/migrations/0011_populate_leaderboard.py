@@ -0,0 +1,53 @@
+from django.db import migrations
+from django.db.models import Count
+
+# The ranking score as of this migration (see myapp.leaderboard.compute_score),
+# copied so that replaying it never depends on the current code.
+WINS_SCALE = 10 ** 7
+BATCH_SIZE = 5000
+
+
+def populate_leaderboard(apps, schema_editor):
+    # Ranks the players who finished debates before the leaderboard tables existed.
+    UserProfile = apps.get_model('myapp', 'UserProfile')
+    LeaderboardEntry = apps.get_model('myapp', 'LeaderboardEntry')
+    LeaderboardScore = apps.get_model('myapp', 'LeaderboardScore')
+
+    LeaderboardEntry.objects.all().delete()
+    LeaderboardScore.objects.all().delete()
+    profiles = (UserProfile.objects.filter(total_debates__gt=0)
+                .values_list('user_id', 'user_wins', 'total_debates').order_by().iterator(chunk_size=BATCH_SIZE))
+    batch = []
+    for user_id, user_wins, total_debates in profiles:
+        basis_points = round(user_wins * 10000 / total_debates)
+        batch.append(LeaderboardEntry(
+            user_id=user_id,
+            score=basis_points * WINS_SCALE + min(user_wins, WINS_SCALE - 1),
+            win_rate=round(user_wins / total_debates * 100, 2),
+            user_wins=user_wins,
+            total_debates=total_debates,
+        ))
+        if len(batch) >= BATCH_SIZE:
+            LeaderboardEntry.objects.bulk_create(batch)
+            batch = []
+    LeaderboardEntry.objects.bulk_create(batch)
+    counts = LeaderboardEntry.objects.values('score').annotate(players=Count('user')).order_by()
+    LeaderboardScore.objects.bulk_create(
+        (LeaderboardScore(score=row['score'], players=row['players']) for row in counts.iterator()),
+        batch_size=BATCH_SIZE)
+
+
+def clear_leaderboard(apps, schema_editor):
+    apps.get_model('myapp', 'LeaderboardEntry').objects.all().delete()
+    apps.get_model('myapp', 'LeaderboardScore').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_ai_generation_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_leaderboard, clear_leaderboard),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -99,6 +101,11 @@ class Debate(models.Model):
     user_messages_count = models.IntegerField(default=0)
     ai_messages_count = models.IntegerField(default=0)
     
+    # Prompt context: a rolling summary of the messages up to and including
+    # summary_through_id; later messages are sent to the model verbatim.
+    context_summary = models.TextField(blank=True, default='')
+    summary_through_id = models.BigIntegerField(null=True, blank=True)
+    
     def __str__(self):
         user_name = self.user.username if self.user else f"Guest_{self.session_id[:8]}"
         return f"Debate: {user_name} vs AI - {self.topic.title}"
@@ -113,6 +120,20 @@ class Debate(models.Model):
     def is_guest_debate(self):
         """Check if this is a guest debate"""
         return self.user is None
+    
+    class Meta:
+        indexes = [
+            # Dashboard and history: a user's debates, newest first. Ascending
+            # so that a backwards scan yields (created_at, id) both descending,
+            # the keyset pagination order, without a sort step.
+            models.Index(fields=['user', 'created_at'], name='debate_user_created_idx'),
+            # Filtered history pages, in the same order.
+            models.Index(fields=['user', 'status', 'created_at'], name='debate_user_status_created_idx'),
+            models.Index(fields=['user', 'winner', 'created_at'], name='debate_user_winner_created_idx'),
+            models.Index(fields=['user', 'difficulty_level', 'created_at'], name='debate_user_diff_created_idx'),
+            # Landing page completed-debate count.
+            models.Index(fields=['status'], name='debate_status_idx'),
+        ]
 
 
 class DebateMessage(models.Model):
@@ -122,17 +143,29 @@ class DebateMessage(models.Model):
         ('ai', 'AI')
     ]
     
-    debate = models.ForeignKey(Debate, on_delete=models.CASCADE, related_name='messages')
+    # Indexed through the composite indexes below, which all lead with debate.
+    debate = models.ForeignKey(Debate, on_delete=models.CASCADE, related_name='messages', db_index=False)
     sender = models.CharField(max_length=10, choices=SENDER_CHOICES)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     response_time = models.FloatField(null=True, blank=True, help_text="Time taken to respond in seconds")
+    time_to_first_token = models.FloatField(null=True, blank=True, help_text="Time until the first streamed token arrived in seconds")
+    turn_id = models.UUIDField(null=True, blank=True, help_text="Client-generated id shared by the user message and AI reply of one turn")
     
     def __str__(self):
         return f"{self.sender}: {self.content[:50]}..."
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # A debate's transcript and recent-history window, in either direction.
+            models.Index(fields=['debate', 'timestamp'], name='message_debate_ts_idx'),
+            # Latest message from one side, e.g. the last user argument.
+            models.Index(fields=['debate', 'sender', 'timestamp'], name='message_debate_sender_ts_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['debate', 'turn_id', 'sender'], name='unique_debate_turn_sender'),
+        ]
 
 
 class GuestSession(models.Model):
@@ -146,6 +179,96 @@ class GuestSession(models.Model):
         return f"Guest: {self.session_id[:8]} - Used: {self.has_used_free_debate}"
 
 
+
+class SiteStatistics(models.Model):
+    """Landing page counters, kept in a single row so the page reads one row instead of counting tables"""
+    completed_debates = models.IntegerField(default=0)
+    registered_users = models.IntegerField(default=0)
+    active_topics = models.IntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Site statistics: {self.completed_debates} debates, {self.registered_users} users, {self.active_topics} topics"
+
+    class Meta:
+        verbose_name_plural = "Site statistics"
+
+
+class CatalogVersion(models.Model):
+    """Token replaced on every category or topic edit, so each process can tell its copy of the catalog is stale"""
+    version = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+
+class LeaderboardEntry(models.Model):
+    """Denormalized copy of a player's scoreboard, indexed by ranking score"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='leaderboard_entry')
+    score = models.BigIntegerField()
+    win_rate = models.FloatField()
+    user_wins = models.IntegerField()
+    total_debates = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.win_rate}% ({self.user_wins} wins)"
+
+    class Meta:
+        verbose_name_plural = "Leaderboard entries"
+        indexes = [
+            # Top-N pages: best score first, earlier players first on ties.
+            models.Index(fields=['-score', 'user'], name='leaderboard_score_user_idx'),
+        ]
+
+
+class LeaderboardScore(models.Model):
+    """Number of players holding each ranking score, so ranks are sums over distinct scores"""
+    score = models.BigIntegerField(primary_key=True)
+    players = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.score}: {self.players} players"
+
+class AIGenerationJob(models.Model):
+    """An AI reply queued for a background worker instead of generated in the request"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed')
+    ]
+    # Lower runs first.
+    PRIORITY_REGISTERED = 0
+    PRIORITY_GUEST = 10
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    debate = models.ForeignKey(Debate, on_delete=models.CASCADE, related_name='ai_jobs')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)  # Null for guest users
+    session_id = models.CharField(max_length=100, null=True, blank=True)
+    user_message = models.TextField()
+    priority = models.SmallIntegerField(default=PRIORITY_REGISTERED)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.SmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    result = models.JSONField(null=True, blank=True, help_text="The stored AI message and debate counters, as the synchronous endpoint returns them")
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"AI job {self.id} for debate {self.debate_id}: {self.status}"
+
+    class Meta:
+        indexes = [
+            # Claiming the next job: highest priority, then oldest.
+            models.Index(fields=['status', 'priority', 'created_at'], name='aijob_status_priority_idx'),
+            # Outstanding jobs per owner, for the concurrency limit.
+            models.Index(fields=['user', 'status'], name='aijob_user_status_idx'),
+            models.Index(fields=['session_id', 'status'], name='aijob_session_status_idx'),
+        ]
+
 # Signal to create UserProfile when User is created
 from django.db.models.signals import post_save
 from django.dispatch import receiver
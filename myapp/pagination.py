@@ -0,0 +1,132 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over ``(created_at, id)``, newest first.
+
+    The cursor is an opaque token encoding the sort key of the last row on
+    the page, and the next page is fetched with ``(created_at, id) < cursor``
+    rather than an OFFSET. Each page is therefore a bounded index
+    range scan, however deep the client has paged, and rows inserted
+    meanwhile neither shift nor repeat results.
+
+    Subclasses paging over another key override ``ordering``,
+    ``get_position``, ``parse_position`` and ``seek`` (or ``fetch``).
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+    def get_position(self, instance):
+        """Returns the JSON-serializable sort key of ``instance``."""
+        return [instance.created_at.isoformat(), instance.pk]
+
+    def parse_position(self, position):
+        """Validates a decoded sort key, raising ValueError if it is malformed."""
+        created_at, pk = position
+        created_at = parse_datetime(created_at)
+        if created_at is None or not isinstance(pk, int):
+            raise ValueError
+        return created_at, pk
+
+    def seek(self, queryset, position):
+        """Filters ``queryset`` to the rows after ``position`` in ``ordering``."""
+        created_at, pk = position
+        # created_at <= c AND NOT (created_at = c AND id >= pk): the same rows
+        # as (created_at, id) < (c, pk), written so created_at bounds the
+        # index range instead of being checked row by row.
+        return queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=pk)
+
+    def fetch(self, queryset, position, limit):
+        """Returns up to ``limit`` rows of the ordered ``queryset``, after ``position`` if given."""
+        if position is not None:
+            queryset = self.seek(queryset, position)
+        return list(queryset[:limit])
+
+    def encode_cursor(self, instance):
+        position = self.get_position(instance)
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            return self.parse_position(json.loads(base64.urlsafe_b64decode(padded.encode())))
+        except (TypeError, ValueError, binascii.Error):
+            raise ValidationError({self.cursor_query_param: 'Invalid cursor.'})
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            size = int(value)
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'A positive integer is required.'})
+        if size < 1:
+            raise ValidationError({self.page_size_query_param: 'A positive integer is required.'})
+        return min(size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        token = request.query_params.get(self.cursor_query_param)
+        position = self.decode_cursor(token) if token else None
+
+        # One extra row tells us whether another page exists without a COUNT.
+        rows = self.fetch(queryset, position, page_size + 1)
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class LeaderboardPagination(KeysetPagination):
+    """Keyset pagination over ``(score, user)``, best score first and earlier players first on ties."""
+
+    ordering = ('-score', 'user_id')
+
+    def get_position(self, instance):
+        return [instance.score, instance.user_id]
+
+    def parse_position(self, position):
+        score, user_id = position
+        if not isinstance(score, int) or not isinstance(user_id, int):
+            raise ValueError
+        return score, user_id
+
+    def fetch(self, queryset, position, limit):
+        if position is None:
+            return list(queryset[:limit])
+        # The rest of the cursor's tie group, then the lower scores, as two
+        # index ranges; a single mixed-direction predicate would step over
+        # the whole tie group row by row, and ties run to thousands of players.
+        score, user_id = position
+        rows = list(queryset.filter(score=score, user_id__gt=user_id)[:limit])
+        if len(rows) < limit:
+            rows += list(queryset.filter(score__lt=score)[:limit - len(rows)])
+        return rows
@@ -0,0 +1,212 @@
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .models import Debate
+
+DEFAULTS = {
+    'ENABLED': False,
+    'CACHE_ALIAS': 'default',
+    'GROUPS': {},
+    'ENDPOINTS': {},
+    'DIFFICULTY_COST': {},
+    'CONCURRENCY': {},
+    'RETRY_AFTER': 1,
+    'TRUSTED_PROXIES': 0,
+}
+KEY_PREFIX = 'ratelimit:'
+# In-flight counters expire after this long, so slots leaked by a killed
+# process come back eventually.
+SLOT_TIMEOUT = 300
+# Debates whose difficulty is remembered per process; a debate's difficulty never changes.
+MAX_REMEMBERED_DEBATES = 10000
+
+
+def rate_limit_settings() -> Dict:
+    return {**DEFAULTS, **getattr(settings, 'RATE_LIMITS', {})}
+
+
+def get_client_ip(request, trusted_proxies: Optional[int] = None):
+    """
+    The client's address: REMOTE_ADDR, or behind ``trusted_proxies`` proxies
+    (``RATE_LIMITS['TRUSTED_PROXIES']`` by default) the X-Forwarded-For entry
+    the outermost of them appended. Entries further left come from the
+    client and are ignored.
+    """
+    if trusted_proxies is None:
+        trusted_proxies = rate_limit_settings()['TRUSTED_PROXIES']
+    remote_addr = request.META.get('REMOTE_ADDR')
+    if not trusted_proxies:
+        return remote_addr
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    hops = forwarded + [remote_addr]
+    return hops[-(trusted_proxies + 1)] if len(hops) > trusted_proxies else hops[0]
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets kept in ``CACHES[alias]``, one cache entry per bucket.
+
+    Each bucket is stored as the time at which it will be full again (the
+    GCRA form of a token bucket), so taking tokens from all of a request's
+    buckets is one ``get_many`` and one ``set_many``. A request is admitted
+    only if every bucket has the tokens, and then takes them from all.
+
+    Updates are atomic between the threads of a process but read-then-write
+    across processes, so requests racing in different workers can overshoot
+    a limit by the number of processes racing.
+    """
+
+    def __init__(self, alias: str = 'default'):
+        self.alias = alias
+        self._lock = threading.Lock()
+
+    def take(self, buckets: List[Tuple[str, float, int]], cost: float = 1) -> float:
+        """
+        Takes ``cost`` tokens from each ``(key, per_minute, burst)`` bucket.
+        Returns 0 when admitted, otherwise the seconds until it would be.
+        """
+        cache = caches[self.alias]
+        with self._lock:
+            now = time.time()
+            stored = cache.get_many([key for key, _, _ in buckets])
+            updates = {}
+            wait = 0.0
+            for key, per_minute, burst in buckets:
+                interval = 60.0 / per_minute
+                full_at = max(stored.get(key, now), now) + interval * cost
+                wait = max(wait, full_at - burst * interval - now)
+                updates[key] = full_at
+            if wait > 0:
+                return wait
+            cache.set_many(updates, timeout=math.ceil(max(updates.values()) - now) + 1)
+        return 0.0
+
+
+class ConcurrencyLimiter:
+    """In-flight request counters per group, shared through ``CACHES[alias]`` with atomic incr/decr."""
+
+    def __init__(self, alias: str = 'default'):
+        self.alias = alias
+
+    def acquire(self, group: str, limit: int) -> bool:
+        cache = caches[self.alias]
+        key = f'{KEY_PREFIX}inflight:{group}'
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # First request since the counter expired; add() settles a race to create it.
+            count = 1 if cache.add(key, 1, timeout=SLOT_TIMEOUT) else cache.incr(key)
+        if count > limit:
+            cache.decr(key)
+            return False
+        return True
+
+    def release(self, group: str):
+        try:
+            caches[self.alias].decr(f'{KEY_PREFIX}inflight:{group}')
+        except ValueError:
+            pass
+
+
+class AdmissionController:
+    """
+    Decides whether a request to a rate-limited endpoint may run.
+
+    ``settings.RATE_LIMITS['ENDPOINTS']`` maps URL names to groups. Each
+    group in ``GROUPS`` has ``(requests per minute, burst)`` buckets for the
+    signed-in ``user``, the guest ``session`` and the client ``ip``; requests
+    in a group share its buckets whichever endpoint they use. A request
+    costs ``DIFFICULTY_COST[group][difficulty]`` tokens for the debate in its
+    URL, 1 by default. ``CONCURRENCY[group]`` caps the group's in-flight
+    requests across processes.
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.buckets = TokenBucketLimiter(alias=config['CACHE_ALIAS'])
+        self.slots = ConcurrencyLimiter(alias=config['CACHE_ALIAS'])
+        self._difficulties = {}
+
+    def group_for(self, url_name: Optional[str]) -> Optional[str]:
+        return self.config['ENDPOINTS'].get(url_name)
+
+    def identities(self, request) -> List[Tuple[str, str]]:
+        identities = []
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            identities.append(('user', str(user.pk)))
+        elif request.session.session_key:
+            identities.append(('session', request.session.session_key))
+        ip = get_client_ip(request, self.config['TRUSTED_PROXIES'])
+        if ip:
+            identities.append(('ip', ip))
+        return identities
+
+    def difficulty(self, debate_id) -> Optional[str]:
+        difficulty = self._difficulties.get(debate_id)
+        if difficulty is None:
+            difficulty = Debate.objects.filter(pk=debate_id).values_list('difficulty_level', flat=True).first()
+            if difficulty is not None:
+                if len(self._difficulties) >= MAX_REMEMBERED_DEBATES:
+                    self._difficulties.clear()
+                self._difficulties[debate_id] = difficulty
+        return difficulty
+
+    def cost(self, group: str, view_kwargs: Dict) -> float:
+        costs = self.config['DIFFICULTY_COST'].get(group)
+        if not costs or 'debate_id' not in view_kwargs:
+            return 1
+        return costs.get(self.difficulty(view_kwargs['debate_id']), 1)
+
+    def check_rate(self, request, group: str, view_kwargs: Dict) -> float:
+        """Returns 0 when the request is within its group's rates, otherwise the seconds to wait."""
+        limits = self.config['GROUPS'].get(group, {})
+        buckets = [
+            (f'{KEY_PREFIX}{group}:{kind}:{ident}', *limits[kind])
+            for kind, ident in self.identities(request) if kind in limits
+        ]
+        if not buckets:
+            return 0.0
+        return self.buckets.take(buckets, self.cost(group, view_kwargs))
+
+    def acquire_slot(self, group: str) -> bool:
+        limit = self.config['CONCURRENCY'].get(group)
+        return limit is None or self.slots.acquire(group, limit)
+
+    def release_slot(self, group: str):
+        if self.config['CONCURRENCY'].get(group) is not None:
+            self.slots.release(group)
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Returns the process-wide admission controller."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController(rate_limit_settings())
+    return _controller
+
+
+def reset_admission_controller():
+    """Drops the controller so the next request rebuilds it from settings."""
+    global _controller
+    with _controller_lock:
+        _controller = None
+
+
+@receiver(setting_changed)
+def reset_admission_controller_on_setting_change(setting, **kwargs):
+    if setting in ('RATE_LIMITS', 'CACHES'):
+        reset_admission_controller()
@@ -0,0 +1,419 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from tenacity import (AsyncRetrying, Retrying, retry_if_not_exception_type, stop_after_attempt,
+                      stop_before_delay, wait_random_exponential)
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DEADLINE_FRACTION': {},
+    'DEFAULT_DEADLINE': 20,
+    'MAX_DEADLINE': 30,
+    'MAX_ATTEMPTS': 3,
+    'BACKOFF': 0.1,
+    'BACKOFF_MAX': 1,
+    'HEDGE': False,
+    'HEDGE_QUANTILE': 0.95,
+    'HEDGE_MIN_SAMPLES': 20,
+    'HEDGE_MIN_DELAY': 0.5,
+    'BREAKER': {},
+    'MAX_WORKERS': 32,
+}
+BREAKER_DEFAULTS = {
+    'WINDOW': 20,
+    'MIN_CALLS': 10,
+    'FAILURE_RATE': 0.5,
+    'OPEN_SECONDS': 30,
+    'HALF_OPEN_CALLS': 1,
+}
+# Recent transitions kept per breaker for the readiness endpoint.
+MAX_TRANSITIONS = 20
+# Successful call latencies kept per difficulty for the hedging threshold.
+LATENCY_SAMPLES = 200
+
+_DONE = object()
+
+
+class DeadlineExceeded(Exception):
+    """The model call did not finish within its deadline."""
+
+
+class CircuitOpen(Exception):
+    """The circuit breaker is failing calls fast while the provider recovers."""
+
+
+def resilience_settings() -> Dict:
+    config = {**DEFAULTS, **getattr(settings, 'AI_RESILIENCE', {})}
+    config['BREAKER'] = {**BREAKER_DEFAULTS, **config['BREAKER']}
+    return config
+
+
+class CircuitBreaker:
+    """
+    Stops calling a degraded provider for a while.
+
+    Keeps the outcome of the last ``window`` calls. Once ``min_calls`` are
+    recorded and at least ``failure_rate`` of them failed, the breaker opens
+    and calls fail fast with CircuitOpen for ``open_seconds``. It then lets
+    ``half_open_calls`` probes through: a success closes it, a failure opens
+    it again. Every transition is logged, counted in
+    ``debato_ai_circuit_transitions_total`` and kept in ``transitions``.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 10, failure_rate: float = 0.5,
+                 open_seconds: float = 30, half_open_calls: int = 1, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self.transitions = deque(maxlen=MAX_TRANSITIONS)
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._changed_at = clock()
+        self._probes = 0
+
+    def _refresh(self):
+        if self._state == self.OPEN and self.clock() - self._changed_at >= self.open_seconds:
+            self._transition(self.HALF_OPEN)
+        elif self._state == self.HALF_OPEN and self.clock() - self._changed_at >= self.open_seconds:
+            # A probe that never reported back (e.g. an abandoned stream) must not wedge the breaker.
+            self._changed_at = self.clock()
+            self._probes = 0
+
+    def _transition(self, state: str):
+        previous, self._state = self._state, state
+        self._changed_at = self.clock()
+        self._probes = 0
+        if state == self.CLOSED:
+            self._outcomes.clear()
+        self.transitions.append({'from': previous, 'to': state, 'at': time.time()})
+        metrics.ai_circuit_transitions_total.inc(backend=self.name, from_state=previous, to_state=state)
+        logger.warning(f"AI circuit breaker for {self.name}: {previous} -> {state}")
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider now; takes a probe slot when half-open."""
+        with self._lock:
+            self._refresh()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._transition(self.CLOSED)
+            elif self._state == self.CLOSED:
+                self._outcomes.append(False)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._transition(self.OPEN)
+            elif self._state == self.CLOSED:
+                self._outcomes.append(True)
+                calls = len(self._outcomes)
+                if calls >= self.min_calls and sum(self._outcomes) >= self.failure_rate * calls:
+                    self._transition(self.OPEN)
+
+    def status(self) -> Dict:
+        with self._lock:
+            self._refresh()
+            retry_in = self.open_seconds - (self.clock() - self._changed_at) if self._state == self.OPEN else 0
+            return {
+                'state': self._state,
+                'recent_calls': len(self._outcomes),
+                'recent_failures': sum(self._outcomes),
+                'retry_in': round(max(0, retry_in), 2),
+                'transitions': list(self.transitions),
+            }
+
+
+class LatencyTracker:
+    """Recent successful call latencies per difficulty."""
+
+    def __init__(self, size: int = LATENCY_SAMPLES):
+        self.size = size
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def observe(self, difficulty: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(difficulty, deque(maxlen=self.size)).append(seconds)
+
+    def quantile(self, difficulty: str, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(difficulty, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def _timed(fn):
+    start = time.monotonic()
+    result = fn()
+    return result, time.monotonic() - start
+
+
+async def _atimed(afn):
+    start = time.monotonic()
+    result = await afn()
+    return result, time.monotonic() - start
+
+
+class ResiliencePolicy:
+    """
+    Deadlines, retries, hedging and circuit breaking around backend calls.
+
+    A call gets ``deadline(difficulty, reply_time_limit)`` seconds in all,
+    across up to ``MAX_ATTEMPTS`` attempts spaced by jittered exponential
+    backoff. Synchronous calls run on a bounded thread pool so an attempt
+    can be abandoned at the deadline; the provider call itself cannot be
+    cancelled and finishes in the background. With ``HEDGE``, an attempt
+    still running after the ``HEDGE_QUANTILE`` latency of its difficulty
+    sends a second identical request and takes whichever answers first.
+    Streams retry only until the first chunk and are not hedged. Each
+    backend name has a CircuitBreaker fed by every attempt.
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.latencies = LatencyTracker()
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._executor = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.config['MAX_WORKERS'], thread_name_prefix='ai-call')
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            config = self.config['BREAKER']
+            with self._lock:
+                breaker = self._breakers.setdefault(name, CircuitBreaker(
+                    name, window=config['WINDOW'], min_calls=config['MIN_CALLS'], failure_rate=config['FAILURE_RATE'],
+                    open_seconds=config['OPEN_SECONDS'], half_open_calls=config['HALF_OPEN_CALLS']))
+        return breaker
+
+    def rejecting(self, name: str) -> bool:
+        """Whether calls to backend ``name`` are being failed fast."""
+        return self.config['ENABLED'] and self.breaker(name).state == CircuitBreaker.OPEN
+
+    def deadline(self, difficulty: str, reply_time_limit: Optional[float] = None) -> float:
+        """Seconds an AI reply may take: a per-difficulty share of the debate's reply time limit."""
+        if reply_time_limit:
+            seconds = reply_time_limit * self.config['DEADLINE_FRACTION'].get(difficulty, 1)
+        else:
+            seconds = self.config['DEFAULT_DEADLINE']
+        return min(seconds, self.config['MAX_DEADLINE'])
+
+    def hedge_delay(self, difficulty: str) -> Optional[float]:
+        if not self.config['HEDGE']:
+            return None
+        threshold = self.latencies.quantile(difficulty, self.config['HEDGE_QUANTILE'], self.config['HEDGE_MIN_SAMPLES'])
+        return None if threshold is None else max(threshold, self.config['HEDGE_MIN_DELAY'])
+
+    def _retrying(self, deadline: float, difficulty: str, retrying_class=Retrying):
+        return retrying_class(
+            stop=stop_after_attempt(self.config['MAX_ATTEMPTS']) | stop_before_delay(deadline),
+            wait=wait_random_exponential(multiplier=self.config['BACKOFF'], max=self.config['BACKOFF_MAX']),
+            retry=retry_if_not_exception_type((CircuitOpen, DeadlineExceeded)),
+            before_sleep=lambda retry_state: metrics.ai_call_retries_total.inc(difficulty=difficulty),
+            reraise=True,
+        )
+
+    def _attempt(self, breaker: CircuitBreaker, run):
+        if not breaker.allow():
+            raise CircuitOpen()
+        try:
+            result = run()
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+
+    async def _aattempt(self, breaker: CircuitBreaker, run):
+        if not breaker.allow():
+            raise CircuitOpen()
+        try:
+            result = await run()
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+
+    def _won(self, difficulty: str, hedged: bool, outcome):
+        result, seconds = outcome
+        self.latencies.observe(difficulty, seconds)
+        if hedged:
+            metrics.ai_hedged_requests_total.inc(difficulty=difficulty, result='won')
+        return result
+
+    def call(self, name: str, fn: Callable[[], str], difficulty: str, deadline: float) -> str:
+        """Runs ``fn``, a blocking call to backend ``name``, under the policy."""
+        if not self.config['ENABLED']:
+            return fn()
+        breaker = self.breaker(name)
+        deadline_at = time.monotonic() + deadline
+        return self._retrying(deadline, difficulty)(self._attempt, breaker, lambda: self._hedged(fn, difficulty, deadline_at))
+
+    def _hedged(self, fn, difficulty: str, deadline_at: float):
+        futures = [self.executor.submit(_timed, fn)]
+        delay = self.hedge_delay(difficulty)
+        if delay is not None and time.monotonic() + delay < deadline_at and not wait(futures, timeout=delay).done:
+            metrics.ai_hedged_requests_total.inc(difficulty=difficulty, result='sent')
+            futures.append(self.executor.submit(_timed, fn))
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline_at - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded()
+            for future in done:
+                if future.exception() is None:
+                    return self._won(difficulty, future is not futures[0], future.result())
+                error = future.exception()
+        raise error
+
+    async def acall(self, name: str, afn, difficulty: str, deadline: float) -> str:
+        """Awaits ``afn()``, a coroutine call to backend ``name``, under the policy."""
+        if not self.config['ENABLED']:
+            return await afn()
+        breaker = self.breaker(name)
+        deadline_at = time.monotonic() + deadline
+        retrying = self._retrying(deadline, difficulty, AsyncRetrying)
+        return await retrying(self._aattempt, breaker, lambda: self._ahedged(afn, difficulty, deadline_at))
+
+    async def _ahedged(self, afn, difficulty: str, deadline_at: float):
+        tasks = [asyncio.ensure_future(_atimed(afn))]
+        try:
+            delay = self.hedge_delay(difficulty)
+            if delay is not None and time.monotonic() + delay < deadline_at:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    metrics.ai_hedged_requests_total.inc(difficulty=difficulty, result='sent')
+                    tasks.append(asyncio.ensure_future(_atimed(afn)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0, deadline_at - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded()
+                for task in done:
+                    if task.exception() is None:
+                        return self._won(difficulty, task is not tasks[0], task.result())
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stream(self, name: str, open_stream: Callable[[], Iterator[str]], difficulty: str, deadline: float) -> Iterator[str]:
+        """Yields the pieces of ``open_stream()``, a streaming call to backend ``name``, under the policy."""
+        if not self.config['ENABLED']:
+            yield from open_stream()
+            return
+        breaker = self.breaker(name)
+        deadline_at = time.monotonic() + deadline
+
+        def first_piece():
+            pieces = open_stream()
+            return pieces, self._next(pieces, deadline_at)
+
+        pieces, piece = self._retrying(deadline, difficulty)(self._attempt_stream, breaker, first_piece)
+        try:
+            while piece is not _DONE:
+                yield piece
+                piece = self._next(pieces, deadline_at)
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+
+    def _attempt_stream(self, breaker: CircuitBreaker, first_piece):
+        # Success is only known once the stream ends, so it is recorded by stream().
+        if not breaker.allow():
+            raise CircuitOpen()
+        try:
+            return first_piece()
+        except Exception:
+            breaker.record_failure()
+            raise
+
+    def _next(self, pieces: Iterator[str], deadline_at: float):
+        future = self.executor.submit(next, pieces, _DONE)
+        try:
+            return future.result(timeout=max(0, deadline_at - time.monotonic()))
+        except TimeoutError:
+            if future.done():
+                raise
+            raise DeadlineExceeded() from None
+
+    def status(self) -> Dict:
+        return {name: breaker.status() for name, breaker in list(self._breakers.items())}
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_resilience_policy() -> ResiliencePolicy:
+    """Returns the process-wide resilience policy, shared by every pooled AI service."""
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = ResiliencePolicy(resilience_settings())
+    return _policy
+
+
+def reset_resilience_policy():
+    """Drops the policy, with its breakers and latency history, so the next call rebuilds it from settings."""
+    global _policy
+    with _policy_lock:
+        if _policy is not None:
+            _policy.shutdown()
+        _policy = None
+
+
+@receiver(setting_changed)
+def reset_resilience_policy_on_setting_change(setting, **kwargs):
+    if setting == 'AI_RESILIENCE':
+        reset_resilience_policy()
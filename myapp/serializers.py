@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Count, Q
 from .models import (
     UserProfile, DebateCategory, DebateTopic, 
-    Debate, DebateMessage, GuestSession
+    Debate, DebateMessage, GuestSession, LeaderboardEntry, AIGenerationJob
 )
 
 class UserSerializer(serializers.ModelSerializer):
@@ -27,7 +28,13 @@ class DebateCategorySerializer(serializers.ModelSerializer):
         model = DebateCategory
         fields = ['id', 'name', 'description', 'is_active', 'topics_count']
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.annotate(active_topics_count=Count('topics', filter=Q(topics__is_active=True)))
+    
     def get_topics_count(self, obj):
+        if hasattr(obj, 'active_topics_count'):
+            return obj.active_topics_count
         return obj.topics.filter(is_active=True).count()
 
 class DebateTopicSerializer(serializers.ModelSerializer):
@@ -36,12 +43,16 @@ class DebateTopicSerializer(serializers.ModelSerializer):
     class Meta:
         model = DebateTopic
         fields = ['id', 'category', 'category_name', 'title', 'description', 'difficulty_level', 'is_active']
+    
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('category')
 
 class DebateMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = DebateMessage
-        fields = ['id', 'sender', 'content', 'timestamp', 'response_time']
-        read_only_fields = ['timestamp']
+        fields = ['id', 'sender', 'content', 'timestamp', 'response_time', 'time_to_first_token', 'turn_id']
+        read_only_fields = ['timestamp', 'time_to_first_token', 'turn_id']
 
 class DebateSerializer(serializers.ModelSerializer):
     topic_title = serializers.CharField(source='topic.title', read_only=True)
@@ -65,6 +76,20 @@ class DebateSerializer(serializers.ModelSerializer):
             'user', 'created_at', 'started_at', 'ended_at', 'duration',
             'user_messages_count', 'ai_messages_count', 'messages', 'is_guest'
         ]
+    
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('user', 'topic__category').prefetch_related('messages')
+
+class DebateStatusSerializer(serializers.ModelSerializer):
+    """Compact debate state returned alongside incremental message syncs"""
+    class Meta:
+        model = Debate
+        fields = [
+            'id', 'status', 'winner', 'started_at', 'ended_at',
+            'user_messages_count', 'ai_messages_count'
+        ]
+        read_only_fields = fields
 
 class DebateCreateSerializer(serializers.ModelSerializer):
     """Simplified serializer for creating debates"""
@@ -83,7 +108,10 @@ class DebateCreateSerializer(serializers.ModelSerializer):
         return value
 
 class DebateHistorySerializer(serializers.ModelSerializer):
-    """Simplified serializer for debate history display"""
+    """Simplified serializer for debate history display.
+
+    Pass ``fields`` to serialize only a subset of the declared fields.
+    """
     topic_title = serializers.CharField(source='topic.title', read_only=True)
     category_name = serializers.CharField(source='topic.category.name', read_only=True)
     duration = serializers.ReadOnlyField(source='duration_minutes')
@@ -94,6 +122,33 @@ class DebateHistorySerializer(serializers.ModelSerializer):
             'id', 'topic_title', 'category_name', 'difficulty_level',
             'status', 'winner', 'duration', 'created_at', 'ended_at'
         ]
+    
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+    
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('topic__category')
+
+class DebateHistoryFilterSerializer(serializers.Serializer):
+    """Validates the query parameters accepted by the debate history endpoint."""
+    status = serializers.ChoiceField(choices=Debate.STATUS_CHOICES, required=False)
+    winner = serializers.ChoiceField(choices=Debate.WINNER_CHOICES, required=False)
+    difficulty = serializers.ChoiceField(choices=Debate.DIFFICULTY_CHOICES, required=False)
+    category = serializers.IntegerField(min_value=1, required=False)
+    created_after = serializers.DateField(required=False)
+    created_before = serializers.DateField(required=False)
+    fields = serializers.CharField(required=False)
+    
+    def validate_fields(self, value):
+        requested = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = set(requested) - set(DebateHistorySerializer.Meta.fields)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return requested
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=6)
@@ -128,4 +183,25 @@ class DashboardSerializer(serializers.Serializer):
     user_profile = UserProfileSerializer(read_only=True)
     recent_debates = DebateHistorySerializer(many=True, read_only=True)
     scoreboard = serializers.DictField(read_only=True)
-    available_categories = DebateCategorySerializer(many=True, read_only=True)
\ No newline at end of file
+    available_categories = DebateCategorySerializer(many=True, read_only=True)
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+    """A ranked player; ``rank`` is set on the instance by the leaderboard module."""
+    username = serializers.CharField(source='user.username', read_only=True)
+    rank = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = LeaderboardEntry
+        fields = ['rank', 'username', 'win_rate', 'user_wins', 'total_debates']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('user')
+
+
+class AIGenerationJobSerializer(serializers.ModelSerializer):
+    """A queued AI reply; ``result`` is the ai-response payload once the job is done."""
+
+    class Meta:
+        model = AIGenerationJob
+        fields = ['id', 'debate', 'status', 'result', 'error', 'created_at', 'started_at', 'finished_at']
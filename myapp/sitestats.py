@@ -0,0 +1,91 @@
+from typing import Dict, Tuple
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Debate, DebateTopic, SiteStatistics
+
+SINGLETON_PK = 1
+COUNTER_FIELDS = ('completed_debates', 'registered_users', 'active_topics')
+
+
+def true_counts() -> Dict[str, int]:
+    """Counts the landing page statistics from the tables themselves."""
+    return {
+        'completed_debates': Debate.objects.filter(status='completed').count(),
+        'registered_users': User.objects.count(),
+        'active_topics': DebateTopic.objects.filter(is_active=True).count(),
+    }
+
+
+def reconcile() -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Overwrites the stored counters with true counts, creating the row if it
+    is missing. Returns ``(stored, actual)`` so callers can report drift;
+    ``stored`` is empty when the row had to be created.
+    """
+    with transaction.atomic():
+        counts = true_counts()
+        stats = SiteStatistics.objects.select_for_update().filter(pk=SINGLETON_PK).first()
+        if stats is None:
+            SiteStatistics.objects.create(pk=SINGLETON_PK, reconciled_at=timezone.now(), **counts)
+            return {}, counts
+        stored = {field: getattr(stats, field) for field in COUNTER_FIELDS}
+        SiteStatistics.objects.filter(pk=SINGLETON_PK).update(reconciled_at=timezone.now(), **counts)
+    return stored, counts
+
+
+def get_statistics() -> SiteStatistics:
+    """Returns the statistics row, building it from true counts the first time."""
+    stats = SiteStatistics.objects.filter(pk=SINGLETON_PK).first()
+    if stats is None:
+        reconcile()
+        stats = SiteStatistics.objects.get(pk=SINGLETON_PK)
+    return stats
+
+
+def increment(**deltas):
+    """
+    Adjusts counters with a single ``UPDATE ... SET field = field + delta``.
+
+    Without a row yet there is nothing to adjust, so it is built from true
+    counts, which already include the change being recorded.
+    """
+    updated = SiteStatistics.objects.filter(pk=SINGLETON_PK).update(
+        **{field: F(field) + delta for field, delta in deltas.items()})
+    if not updated:
+        reconcile()
+
+
+def refresh_active_topics():
+    """Recounts active topics; topic edits are rare and a flag flip has no cheap delta."""
+    count = DebateTopic.objects.filter(is_active=True).count()
+    if not SiteStatistics.objects.filter(pk=SINGLETON_PK).update(active_topics=count):
+        reconcile()
+
+
+@receiver(post_save, sender=User)
+def count_new_user(sender, instance, created, **kwargs):
+    if created:
+        increment(registered_users=1)
+
+
+@receiver(post_delete, sender=User)
+def count_deleted_user(sender, instance, **kwargs):
+    increment(registered_users=-1)
+
+
+@receiver(post_delete, sender=Debate)
+def count_deleted_debate(sender, instance, **kwargs):
+    if instance.status == 'completed':
+        increment(completed_debates=-1)
+
+
+@receiver(post_save, sender=DebateTopic)
+@receiver(post_delete, sender=DebateTopic)
+def count_active_topics(sender, **kwargs):
+    refresh_active_topics()
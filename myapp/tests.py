@@ -1 +1,1448 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+
+from .ai_backends import AIBackendError, GeminiBackend, SimulatorBackend, StubBackend, build_backend
+from .ai_cache import LocalResponseCache, SemanticResponseCache, get_response_cache, get_semantic_cache
+from .ai_service import UNAVAILABLE_MESSAGE, AIClientRegistry, DebateAIService
+from . import catalog, context, db, idempotency, jobs, leaderboard, metrics, ratelimit, resilience, sitestats
+from .middleware import QueryBudgetExceeded, query_stats
+from .models import AIGenerationJob, CatalogVersion, DebateCategory, DebateTopic, Debate, DebateMessage, GuestSession, LeaderboardEntry, LeaderboardScore, SiteStatistics, UserProfile
+from .pagination import KeysetPagination, LeaderboardPagination
+
+
+def stub_service(reply, **options):
+    return DebateAIService(backend=StubBackend(replies=[reply], **options))
+
+
+def parse_sse(body):
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class DebateTestCase(TestCase):
+    def setUp(self):
+        # Circuit breakers are per process; start every test with them closed.
+        resilience.reset_resilience_policy()
+        self.user = User.objects.create_user(username='tester', password='secret123')
+        self.client.force_login(self.user)
+        category = DebateCategory.objects.create(name='Testing')
+        self.topic = DebateTopic.objects.create(category=category, title='Tests are worth writing', description='A debate about tests', difficulty_level='easy')
+        self.debate = Debate.objects.create(user=self.user, session_id='session', topic=self.topic, difficulty_level='easy', total_time_limit=5, reply_time_limit=75, status='active')
+
+
+class AIResponseStreamTests(DebateTestCase):
+    def test_stream_emits_chunks_and_persists_message(self):
+        url = reverse('ai_response_stream', args=[self.debate.id])
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('Tests slow teams down.', chunk_words=1)):
+            response = self.client.post(url, {'user_message': 'Tests catch bugs'}, content_type='application/json')
+            body = b"".join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = parse_sse(body)
+        self.assertEqual([event for event, _ in events], ['chunk', 'chunk', 'chunk', 'chunk', 'done'])
+        self.assertEqual(events[-1][1]['message']['content'], 'Tests slow teams down.')
+        self.assertEqual(events[-1][1]['debate_status']['ai_messages'], 1)
+
+        message = DebateMessage.objects.get(debate=self.debate, sender='ai')
+        self.assertEqual(message.content, 'Tests slow teams down.')
+        self.assertIsNotNone(message.time_to_first_token)
+        self.assertLessEqual(message.time_to_first_token, message.response_time)
+
+    def test_stream_falls_back_when_backend_returns_nothing(self):
+        url = reverse('ai_response_stream', args=[self.debate.id])
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('')):
+            response = self.client.post(url, {'user_message': 'Tests catch bugs'}, content_type='application/json')
+            events = parse_sse(b"".join(response.streaming_content).decode())
+
+        self.assertEqual(events[-1][0], 'done')
+        self.assertIn('trouble', events[-1][1]['message']['content'])
+
+    def test_stream_rejects_inactive_debate(self):
+        self.debate.status = 'setup'
+        self.debate.save()
+        response = self.client.post(reverse('ai_response_stream', args=[self.debate.id]), {'user_message': 'Hi'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AIResponseAsyncTests(DebateTestCase):
+    async def test_async_view_persists_ai_message(self):
+        service = stub_service('Async replies scale.')
+        await self.async_client.aforce_login(self.user)
+        with mock.patch('myapp.views.get_ai_service', return_value=service):
+            response = await self.async_client.post(reverse('ai_response_async', args=[self.debate.id]), {'user_message': 'Threads are fine'}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['message']['content'], 'Async replies scale.')
+        self.assertEqual(response.json()['debate_status']['ai_messages'], 1)
+        self.assertEqual(await DebateMessage.objects.filter(debate=self.debate, sender='ai').acount(), 1)
+
+    async def test_async_reply_and_counter_are_stored_together(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('Lost.')), \
+                mock.patch.object(Debate.objects, 'filter', side_effect=RuntimeError('counter update failed')):
+            response = await self.async_client.post(reverse('ai_response_async', args=[self.debate.id]), {'user_message': 'Hi'}, content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(await DebateMessage.objects.filter(debate=self.debate, sender='ai').aexists())
+
+    async def test_async_view_hides_other_users_debates(self):
+        other = await User.objects.acreate_user(username='other', password='secret123')
+        await self.async_client.aforce_login(other)
+        response = await self.async_client.post(reverse('ai_response_async', args=[self.debate.id]), {'user_message': 'Hi'}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+class AIClientRegistryTests(TestCase):
+    @override_settings(AI_BACKEND={'BACKEND': 'myapp.ai_backends.GeminiBackend'})
+    def test_registry_builds_service_once(self):
+        registry = AIClientRegistry()
+        with mock.patch.dict('os.environ', {'GEMINI_API_KEY': ''}):
+            first = registry.get_service()
+            second = registry.get_service()
+
+        self.assertIs(first, second)
+        status = registry.status()
+        self.assertEqual(status.pop('circuit')['state'], 'closed')
+        self.assertEqual(status, {'initialized': True, 'available': False, 'backend': 'gemini', 'warm': False})
+
+    def test_readiness_endpoint_reports_registry_status(self):
+        registry = AIClientRegistry()
+        with mock.patch('myapp.views.ai_clients', registry):
+            self.assertEqual(self.client.get(reverse('ai_readiness')).status_code, 503)
+            registry._service = stub_service('ok')
+            registry.warm = True
+            response = self.client.get(reverse('ai_readiness'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['warm'])
+
+
+class ResponseCacheTests(TestCase):
+    def test_key_ignores_case_and_whitespace(self):
+        cache = LocalResponseCache()
+        history = [{'sender': 'user', 'content': 'AI will take all jobs'}]
+        self.assertEqual(
+            cache.make_key('Topic', 'easy', history, 'AI will take  all jobs'),
+            cache.make_key('topic', 'easy', [{'sender': 'user', 'content': 'ai will take all JOBS '}], 'ai will take all jobs'),
+        )
+        self.assertNotEqual(cache.make_key('Topic', 'easy', history, 'x'), cache.make_key('Topic', 'medium', history, 'x'))
+
+    def test_key_covers_the_whole_prompt_context(self):
+        cache = LocalResponseCache()
+        tail = [{'sender': 'user', 'content': f'Point {i}'} for i in range(4)]
+        earlier = [{'sender': 'ai', 'content': 'Opening'}]
+        self.assertNotEqual(cache.make_key('Topic', 'easy', tail, 'x'), cache.make_key('Topic', 'easy', earlier + tail, 'x'))
+        self.assertNotEqual(cache.make_key('Topic', 'easy', tail, 'x', summary='They agreed on taxes.'),
+                            cache.make_key('Topic', 'easy', tail, 'x', summary='They disagreed on taxes.'))
+
+    def test_lru_eviction_and_ttl(self):
+        now = [0]
+        cache = LocalResponseCache(max_size=2, timeout=10, timer=lambda: now[0])
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        cache.get('a')
+        cache.set('c', 'C')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+        now[0] = 11
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    @override_settings(AI_RESPONSE_CACHE={'ENABLED': True, 'BACKEND': 'local', 'DIFFICULTIES': ['easy']})
+    def test_service_serves_repeated_turns_from_cache(self):
+        service = stub_service('Jobs will change, not vanish.')
+        backend = service.backend
+        for _ in range(3):
+            reply = service.generate_response('AI will take all jobs', 'AI will replace most human jobs', 'easy', [])
+        self.assertEqual(reply['content'], 'Jobs will change, not vanish.')
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(get_response_cache().stats()['hits'], 2)
+
+        service.generate_response('AI will take all jobs', 'AI will replace most human jobs', 'hard', [])
+        service.generate_response('AI will take all jobs', 'AI will replace most human jobs', 'hard', [])
+        self.assertEqual(backend.calls, 3)
+
+    @override_settings(AI_RESPONSE_CACHE={'ENABLED': True, 'BACKEND': 'django', 'DIFFICULTIES': ['easy']})
+    def test_django_backend_shares_replies(self):
+        backend = StubBackend(replies=['Shared reply.'])
+        DebateAIService(backend=backend).generate_response('Hi', 'Topic', 'easy', [])
+        DebateAIService(backend=backend).generate_response('Hi', 'Topic', 'easy', [])
+        self.assertEqual(backend.calls, 1)
+
+
+class SemanticResponseCacheTests(TestCase):
+    def test_reworded_argument_reuses_reply(self):
+        cache = SemanticResponseCache(threshold=0.8)
+        cache.add('Topic', 'easy', cache.vectorize('AI will take all jobs'), 'Jobs will change, not vanish.')
+        self.assertEqual(cache.lookup('Topic', 'easy', cache.vectorize('AI will take all the jobs!')), 'Jobs will change, not vanish.')
+        self.assertIsNone(cache.lookup('Topic', 'easy', cache.vectorize('Homework builds discipline')))
+        self.assertIsNone(cache.lookup('Topic', 'hard', cache.vectorize('AI will take all jobs')))
+
+    def test_topic_index_is_capped(self):
+        cache = SemanticResponseCache(max_entries_per_topic=3)
+        for i in range(5):
+            cache.add('Topic', 'easy', cache.vectorize(f'argument number {i}'), f'reply {i}')
+        self.assertEqual(cache.stats()['entries'], 3)
+        self.assertEqual(cache.lookup('Topic', 'easy', cache.vectorize('argument number 4')), 'reply 4')
+        self.assertIsNone(cache.lookup('Topic', 'easy', cache.vectorize('argument number 0')))
+
+    @override_settings(AI_SEMANTIC_CACHE={'ENABLED': True, 'THRESHOLD': 0.8, 'DIFFICULTIES': ['easy']})
+    def test_service_uses_semantic_cache_for_opening_turns(self):
+        service = stub_service('Jobs will change, not vanish.')
+        backend = service.backend
+        service.generate_response('AI will take all jobs', 'Topic', 'easy', [])
+        reply = service.generate_response('ai will take ALL the jobs', 'Topic', 'easy', [])
+        self.assertEqual(reply['content'], 'Jobs will change, not vanish.')
+        self.assertEqual(backend.calls, 1)
+
+        later_turn = [{'sender': 'user', 'content': 'x'}, {'sender': 'ai', 'content': 'y'}]
+        service.generate_response('AI will take all jobs', 'Topic', 'easy', later_turn)
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(get_semantic_cache().stats()['hits'], 1)
+
+
+class AIBackendTests(TestCase):
+    def test_stub_backend_is_deterministic(self):
+        first = StubBackend(seed=1, distribution='uniform', latency_max=0.01)
+        second = StubBackend(seed=1, distribution='uniform', latency_max=0.01)
+        self.assertEqual(first.reply_for('prompt'), second.reply_for('prompt'))
+        self.assertEqual([first.sample_latency() for _ in range(3)], [second.sample_latency() for _ in range(3)])
+
+    def test_stub_backend_streams_and_counts_tokens(self):
+        backend = StubBackend(replies=['one two three four five'], chunk_words=2)
+        self.assertEqual(list(backend.stream('a b c', {})), ['one two ', 'three four ', 'five'])
+        self.assertEqual((backend.calls, backend.prompt_tokens, backend.completion_tokens), (1, 3, 5))
+
+    def test_static_prompt_prefix_is_registered_once_and_reused(self):
+        service = DebateAIService(backend=StubBackend())
+        backend = service.backend
+        uncached = StubBackend(prefix_cache=False)
+        for argument in ('Homework builds discipline', 'Practice makes perfect'):
+            reply = service.generate_response(argument, 'Homework should be banned', 'easy', [])
+            self.assertEqual(reply['content'], DebateAIService(backend=uncached).generate_response(argument, 'Homework should be banned', 'easy', [])['content'])
+
+        prompt = service._build_prompt('Practice makes perfect', 'Homework should be banned', 'easy', [])
+        prefix_tokens = backend.count_tokens(prompt.prefix.text)
+        self.assertEqual((backend.prefixes_registered, backend.prefix_hits), (1, 2))
+        self.assertEqual(backend.cached_prompt_tokens, 2 * prefix_tokens)
+        # Only the per-turn suffix went over the wire.
+        self.assertEqual(uncached.prompt_tokens - backend.prompt_tokens, 2 * prefix_tokens)
+
+        service.generate_response('Practice makes perfect', 'Homework should be banned', 'hard', [])
+        self.assertEqual(backend.prefixes_registered, 2)
+
+    def test_prefix_registration_failures_are_remembered(self):
+        backend = StubBackend()
+        with mock.patch.object(backend, 'cache_prefix', side_effect=AIBackendError('quota')) as cache_prefix:
+            self.assertIsNone(backend.prefix_handle('key', 'prefix text'))
+            self.assertIsNone(backend.prefix_handle('key', 'prefix text'))
+            self.assertEqual(cache_prefix.call_count, 1)
+            with mock.patch('myapp.ai_backends.time.monotonic', return_value=time.monotonic() + backend.prefix_retry_after):
+                backend.prefix_handle('key', 'prefix text')
+            self.assertEqual(cache_prefix.call_count, 2)
+
+        uncached = StubBackend(prefix_cache=False)
+        with mock.patch.object(uncached, 'cache_prefix', wraps=uncached.cache_prefix) as cache_prefix:
+            for _ in range(3):
+                self.assertIsNone(uncached.prefix_handle('key', 'prefix text'))
+            self.assertEqual(cache_prefix.call_count, 1)
+
+    def test_gemini_drops_models_of_expired_and_forgotten_prefixes(self):
+        with mock.patch.dict('os.environ', {'GEMINI_API_KEY': ''}):
+            backend = GeminiBackend(prefix_ttl=100)
+        registrations = iter(range(10))
+
+        def register(key, text):
+            handle = f'cachedContents/{next(registrations)}'
+            backend._cached_models[handle] = mock.Mock()
+            return handle
+
+        with mock.patch.object(backend, 'cache_prefix', side_effect=register):
+            first = backend.prefix_handle('key', 'prefix text').handle
+            with mock.patch('myapp.ai_backends.time.monotonic', return_value=time.monotonic() + 100):
+                second = backend.prefix_handle('key', 'prefix text').handle
+        self.assertEqual(list(backend._cached_models), [second])
+        with self.assertRaises(AIBackendError):
+            backend.generate('Hi', {}, cached_prefix=first)
+        backend.forget_prefix('key')
+        self.assertEqual(backend._cached_models, {})
+
+    def test_evicted_prefix_is_registered_again(self):
+        service = DebateAIService(backend=StubBackend(replies=['Noted.']))
+        backend = service.backend
+        service.generate_response('First', 'Topic', 'easy', [])
+        backend.registered_prefixes.clear()
+        # Resent whole rather than answered with the fallback.
+        self.assertEqual(service.generate_response('Second', 'Topic', 'easy', [])['content'], 'Noted.')
+        self.assertEqual(backend.prefixes_registered, 1)
+        self.assertEqual(service.generate_response('Third', 'Topic', 'easy', [])['content'], 'Noted.')
+        self.assertEqual(backend.prefixes_registered, 2)
+
+        backend.registered_prefixes.clear()
+        events = list(service.stream_response('Fourth', 'Topic', 'easy', []))
+        self.assertEqual(events[-1]['content'], 'Noted.')
+        reply = asyncio.run(service.agenerate_response('Fifth', 'Topic', 'easy', []))
+        self.assertEqual(reply['content'], 'Noted.')
+
+    def test_simulator_failures_become_fallback_replies(self):
+        service = DebateAIService(backend=SimulatorBackend(failure_rate=1.0))
+        reply = service.generate_response('Hi', 'Topic', 'easy', [])
+        self.assertIn('trouble', reply['content'])
+        # Resent once without the cached prefix, then retried up to
+        # AI_RESILIENCE['MAX_ATTEMPTS'] in all before falling back.
+        self.assertEqual(service.backend.failures, 4)
+
+    @override_settings(AI_BACKEND={'BACKEND': 'myapp.ai_backends.StubBackend', 'OPTIONS': {'replies': ['Configured.']}})
+    def test_ai_response_view_uses_configured_backend(self):
+        self.assertIsInstance(build_backend(), StubBackend)
+        user = User.objects.create_user(username='backend', password='secret123')
+        self.client.force_login(user)
+        topic = DebateTopic.objects.filter(is_active=True).first()
+        debate = Debate.objects.create(user=user, session_id='s', topic=topic, difficulty_level='hard', total_time_limit=5, reply_time_limit=45, status='active')
+        response = self.client.post(reverse('ai_response', args=[debate.id]), {'user_message': 'Hello'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['message']['content'], 'Configured.')
+
+
+class QueryInstrumentationTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        query_stats.clear()
+
+    @override_settings(QUERY_INSTRUMENTATION={'ENABLED': True, 'BUDGETS': {}})
+    def test_records_queries_and_server_timing(self):
+        response = self.client.get(reverse('debate_detail', args=[self.debate.id]))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", total;dur=[\d.]+')
+        stats = query_stats.summary()['debate_detail']
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreater(stats['max_queries'], 0)
+        self.assertIsNotNone(stats['slowest_sql'])
+
+    @override_settings(QUERY_INSTRUMENTATION={'ENABLED': True, 'BUDGETS': {'debate_detail': 1}, 'BUDGET_ACTION': 'raise'})
+    def test_budget_violation_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('debate_detail', args=[self.debate.id]))
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('debate_detail', args=[self.debate.id]))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(QUERY_INSTRUMENTATION={'ENABLED': True, 'BUDGETS': {}})
+    def test_stats_endpoint_is_staff_only(self):
+        self.client.get(reverse('debate_detail', args=[self.debate.id]))
+        self.assertEqual(self.client.get(reverse('query_stats')).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('query_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('debate_detail', response.json())
+
+
+class MetricsTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+
+    def test_metrics_endpoint_reports_ai_and_request_metrics(self):
+        with mock.patch('myapp.views.get_ai_service', return_value=DebateAIService(backend=SimulatorBackend(failure_rate=1.0))):
+            self.client.post(reverse('ai_response', args=[self.debate.id]), {'user_message': 'Hi'}, content_type='application/json')
+        body = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('debato_ai_response_seconds_count{difficulty="easy",source="error"} 1', body)
+        self.assertIn('debato_ai_errors_total{difficulty="easy"} 1', body)
+        self.assertIn('debato_ai_fallback_replies_total{reason="error"} 1', body)
+        self.assertIn('debato_http_request_seconds_bucket{view="ai_response",method="POST",le="+Inf"} 1', body)
+        self.assertIn('debato_active_debates 1', body)
+
+    def test_metrics_merge_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS={'MULTIPROCESS_DIR': directory}):
+            metrics.debates_completed_total.inc(winner='ai')
+            with open(os.path.join(directory, 'metrics-99999.json'), 'w') as fh:
+                json.dump({'debato_debates_completed_total': {'["ai"]': 2}}, fh)
+            body = metrics.registry.render()
+        self.assertIn('debato_debates_completed_total{winner="ai"} 3', body)
+
+    def test_guest_registration_counts_as_conversion(self):
+        self.client.logout()
+        self.client.get(reverse('dashboard'))
+        self.client.post(reverse('register'), {'username': 'convert', 'email': 'c@example.com', 'password': 'secret123', 'password_confirm': 'secret123'}, content_type='application/json')
+        self.assertIn('debato_guest_conversions_total 1', metrics.registry.render())
+
+    @override_settings(METRICS={'TOKEN': 'scrape-token'})
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+
+    def test_metrics_are_internal_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='8.8.8.8').status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='8.8.8.8', HTTP_X_FORWARDED_FOR='127.0.0.1').status_code, 403)
+        with self.settings(METRICS={'PUBLIC': True}):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='8.8.8.8').status_code, 200)
+
+
+class DebateTurnTests(DebateTestCase):
+    def post_turn(self, name='debate_turn', **data):
+        return self.client.post(reverse(name, args=[self.debate.id]), data, content_type='application/json')
+
+    def test_turn_stores_both_messages_and_counters(self):
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('Tests slow teams down.')):
+            response = self.post_turn(content='Tests catch bugs', turn_id='6f1c1f38-8d2b-4c35-9a43-6d1f0f6f2a10')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['user_message']['content'], 'Tests catch bugs')
+        self.assertEqual(response.data['message']['content'], 'Tests slow teams down.')
+        self.assertEqual(response.data['debate_status'], {'user_messages': 1, 'ai_messages': 1, 'total_messages': 2})
+        self.assertEqual(list(self.debate.messages.values_list('sender', flat=True)), ['user', 'ai'])
+
+    def test_retried_turn_is_not_stored_twice(self):
+        service = stub_service('Tests slow teams down.')
+        turn_id = '6f1c1f38-8d2b-4c35-9a43-6d1f0f6f2a10'
+        with mock.patch('myapp.views.get_ai_service', return_value=service):
+            first = self.post_turn(content='Tests catch bugs', turn_id=turn_id)
+            retry = self.post_turn(content='Tests catch bugs', turn_id=turn_id)
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(service.backend.calls, 1)
+        self.assertEqual(self.debate.messages.count(), 2)
+        self.debate.refresh_from_db()
+        self.assertEqual((self.debate.user_messages_count, self.debate.ai_messages_count), (1, 1))
+
+    def test_prompt_uses_summary_and_recent_history(self):
+        for i in range(10):
+            DebateMessage.objects.create(debate=self.debate, sender='user' if i % 2 == 0 else 'ai', content=f'Message {i}.')
+        service = stub_service('Noted.')
+        with mock.patch('myapp.views.get_ai_service', return_value=service), \
+                mock.patch.object(service, '_build_prompt', wraps=service._build_prompt) as build_prompt:
+            self.post_turn(content='Latest argument')
+
+        history, summary = build_prompt.call_args.args[3:5]
+        self.assertEqual([msg['content'] for msg in history], [f'Message {i}.' for i in range(4, 10)] + ['Latest argument'])
+        self.assertEqual(summary.splitlines(), ['- USER: Message 0.', '- AI: Message 1.', '- USER: Message 2.', '- AI: Message 3.'])
+        self.assertIn('- AI: Message 3.', service._build_prompt('Latest argument', 'Tests', 'easy', history, summary).text)
+
+    def test_stream_turn(self):
+        turn_id = '6f1c1f38-8d2b-4c35-9a43-6d1f0f6f2a10'
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('Tests slow teams down.', chunk_words=2)):
+            events = parse_sse(b"".join(self.post_turn('debate_turn_stream', content='Tests catch bugs', turn_id=turn_id).streaming_content).decode())
+            retried = parse_sse(b"".join(self.post_turn('debate_turn_stream', content='Tests catch bugs', turn_id=turn_id).streaming_content).decode())
+
+        self.assertEqual([event for event, _ in events], ['chunk', 'chunk', 'done'])
+        self.assertEqual(events[-1][1]['debate_status']['total_messages'], 2)
+        self.assertEqual(retried, [('done', events[-1][1])])
+
+    def test_turn_validation(self):
+        self.assertEqual(self.post_turn(content='').status_code, 400)
+        self.assertEqual(self.post_turn(content='x' * 1001).status_code, 400)
+        self.assertEqual(self.post_turn(content='Hi', turn_id='not-a-uuid').status_code, 400)
+        self.debate.status = 'completed'
+        self.debate.save()
+        self.assertEqual(self.post_turn(content='Hi').status_code, 400)
+        self.assertEqual(DebateMessage.objects.count(), 0)
+
+
+class DebateStateTransitionTests(DebateTestCase):
+    def patch(self, **data):
+        return self.client.patch(reverse('debate_detail', args=[self.debate.id]), data, content_type='application/json')
+
+    def test_end_updates_scoreboard_once(self):
+        response = self.patch(action='end', winner='user')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(self.patch(action='end', winner='user').status_code, 400)
+
+        profile = self.user.userprofile
+        profile.refresh_from_db()
+        self.assertEqual((profile.user_wins, profile.ai_wins, profile.total_debates), (1, 0, 1))
+
+    def test_transitions_are_guarded_by_current_status(self):
+        self.assertEqual(self.patch(action='start').status_code, 400)
+        self.assertEqual(self.patch(action='abandon').status_code, 200)
+        self.assertEqual(self.patch(action='end').status_code, 400)
+        self.debate.refresh_from_db()
+        self.assertEqual((self.debate.status, self.debate.winner), ('abandoned', 'ai'))
+
+    def test_guest_loss_uses_up_free_debate(self):
+        self.client.logout()
+        session = self.client.session
+        session.save()
+        GuestSession.objects.create(session_id=session.session_key, ip_address='127.0.0.1')
+        Debate.objects.filter(pk=self.debate.pk).update(user=None, session_id=session.session_key)
+
+        self.assertEqual(self.patch(action='end', winner='ai').status_code, 200)
+        self.assertTrue(GuestSession.objects.get(session_id=session.session_key).has_used_free_debate)
+
+
+class ConcurrentCounterTests(TransactionTestCase):
+    def test_concurrent_messages_keep_exact_counts(self):
+        user = User.objects.create_user(username='racer', password='secret123')
+        category = DebateCategory.objects.create(name='Racing')
+        topic = DebateTopic.objects.create(category=category, title='Locks are overrated', description='Contention')
+        debate = Debate.objects.create(user=user, session_id='race', topic=topic, difficulty_level='easy', total_time_limit=5, reply_time_limit=75, status='active')
+        url = reverse('debate_messages', args=[debate.id])
+        threads, per_thread = 8, 10
+
+        # raise_request_exception=False: the client's exception hook is a global
+        # signal, so another thread's failure would surface in this request.
+        clients = [Client(raise_request_exception=False) for _ in range(threads)]
+        for client in clients:
+            client.force_login(user)
+
+        def send(worker):
+            client = clients[worker]
+            try:
+                for i in range(per_thread):
+                    sender = 'user' if (worker + i) % 2 == 0 else 'ai'
+                    # The in-memory test database uses SQLite's shared cache, which
+                    # reports "table is locked" instead of waiting; every write is
+                    # atomic, so a failed attempt left nothing behind.
+                    for attempt in range(100):
+                        response = client.post(url, {'content': f'{worker}-{i}', 'sender': sender}, content_type='application/json')
+                        if response.status_code == 201:
+                            break
+                        time.sleep(0.005)
+                    else:
+                        self.fail('Message was never stored')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(send, range(threads)))
+
+        debate.refresh_from_db()
+        self.assertEqual(debate.user_messages_count, DebateMessage.objects.filter(debate=debate, sender='user').count())
+        self.assertEqual(debate.ai_messages_count, DebateMessage.objects.filter(debate=debate, sender='ai').count())
+        self.assertEqual(debate.user_messages_count + debate.ai_messages_count, threads * per_thread)
+
+
+class QueryPlanTests(DebateTestCase):
+    """The hot debate and message queries must be index searches, never table scans or sorts."""
+
+    def query_plans(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plans.append([row[-1] for row in cursor.fetchall()])
+        return plans
+
+    def assertIndexedPlan(self, run, index=None):
+        for plan in self.query_plans(run):
+            for step in plan:
+                self.assertFalse(step.startswith('SCAN'), plan)
+                self.assertNotIn('TEMP B-TREE', step, plan)
+            if index:
+                self.assertTrue(any(index in step for step in plan), plan)
+
+    def test_debate_lookup_by_owner_session(self):
+        self.assertIndexedPlan(lambda: Debate.objects.get(id=self.debate.id, session_id='session'), 'PRIMARY KEY')
+
+    def test_user_debates_newest_first(self):
+        self.assertIndexedPlan(lambda: list(Debate.objects.filter(user=self.user).order_by('-created_at')[:5]), 'debate_user_created_idx')
+
+    def test_completed_debate_count(self):
+        self.assertIndexedPlan(lambda: Debate.objects.filter(status='completed').count(), 'debate_status_idx')
+
+    def test_debate_transcript(self):
+        self.assertIndexedPlan(lambda: list(self.debate.messages.all().order_by('timestamp')), 'message_debate_ts_idx')
+
+    def test_recent_history_window(self):
+        self.assertIndexedPlan(lambda: list(self.debate.messages.order_by('-timestamp', '-id')[:3]), 'message_debate_ts_idx')
+
+    def test_history_page_after_cursor(self):
+        paginator = KeysetPagination()
+        request = Request(RequestFactory().get('/', {'status': 'completed', 'cursor': paginator.encode_cursor(self.debate)}))
+        self.assertIndexedPlan(lambda: paginator.paginate_queryset(Debate.objects.filter(user=self.user, status='completed'), request), 'debate_user_status_created_idx')
+
+    def test_last_user_message(self):
+        self.assertIndexedPlan(lambda: self.debate.messages.all().order_by('timestamp').filter(sender='user').last(), 'message_debate_sender_ts_idx')
+
+    def test_leaderboard_page_after_cursor(self):
+        entries = LeaderboardEntry.objects.order_by(*LeaderboardPagination.ordering)
+        self.assertIndexedPlan(lambda: LeaderboardPagination().fetch(entries, (10 ** 9, 1), 20), 'leaderboard_score_user_idx')
+
+    def test_leaderboard_rank(self):
+        self.assertIndexedPlan(lambda: leaderboard.rank_of_score(10 ** 9))
+
+
+class QueryCountTests(DebateTestCase):
+    """Listing endpoints run a fixed number of queries however many rows they return."""
+
+    def seed(self, count):
+        start = DebateCategory.objects.count()
+        for i in range(start, start + count):
+            category = DebateCategory.objects.create(name=f'Category {i}')
+            topic = DebateTopic.objects.create(category=category, title=f'Topic {i}', description='Seeded')
+            DebateTopic.objects.create(category=category, title=f'Retired topic {i}', description='Seeded', is_active=False)
+            debate = Debate.objects.create(user=self.user, session_id=f'seed-{i}', topic=topic, difficulty_level='medium', total_time_limit=5, reply_time_limit=60, status='completed')
+            DebateMessage.objects.create(debate=debate, sender='user', content='Seeded argument')
+            DebateMessage.objects.create(debate=self.debate, sender='ai', content=f'Reply {i}')
+
+    def assertConstantQueries(self, expected, url, **params):
+        self.seed(1)
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        self.seed(10)
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+
+    def test_categories(self):
+        self.assertConstantQueries(1, reverse('categories'))
+
+    def test_topics(self):
+        self.assertConstantQueries(1, reverse('topics'))
+
+    def test_dashboard(self):
+        self.assertConstantQueries(5, reverse('dashboard'))
+
+    def test_debate_history(self):
+        self.assertConstantQueries(3, reverse('debate_history'))
+
+    def test_debate_detail(self):
+        self.assertConstantQueries(4, reverse('debate_detail', args=[self.debate.id]))
+
+
+
+class DebateHistoryTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        Debate.objects.all().delete()
+        other = DebateCategory.objects.create(name='Other')
+        other_topic = DebateTopic.objects.create(category=other, title='Other topic', description='Elsewhere')
+        created = timezone.make_aware(datetime(2026, 3, 1, 12, 0))
+        self.debates = []
+        for i in range(25):
+            debate = Debate.objects.create(
+                user=self.user, session_id=f'history-{i}', topic=other_topic if i % 5 == 0 else self.topic,
+                difficulty_level='hard' if i % 2 else 'easy', total_time_limit=5, reply_time_limit=60,
+                status='completed' if i % 3 else 'abandoned', winner='user' if i % 4 == 0 else 'ai')
+            # Pairs of debates share a timestamp so the id tie-breaker matters.
+            Debate.objects.filter(pk=debate.pk).update(created_at=created + timedelta(days=i // 2))
+            self.debates.append(debate)
+        self.other_category = other
+
+    def fetch_all(self, **params):
+        ids, url = [], reverse('debate_history')
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url, params = response.data['next'], {}
+        return ids
+
+    def test_pages_cover_every_debate_once_newest_first(self):
+        ids = self.fetch_all(page_size=4)
+        expected = list(Debate.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(ids), 25)
+
+    def test_first_page_and_next_link(self):
+        response = self.client.get(reverse('debate_history'))
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertIn('cursor=', response.data['next'])
+        last = self.client.get(response.data['next'])
+        self.assertEqual(len(last.data['results']), 5)
+        self.assertIsNone(last.data['next'])
+
+    def test_filters(self):
+        def expected(**lookup):
+            return list(Debate.objects.filter(user=self.user, **lookup).order_by('-created_at', '-id').values_list('id', flat=True))
+
+        self.assertEqual(self.fetch_all(status='abandoned', page_size=3), expected(status='abandoned'))
+        self.assertEqual(self.fetch_all(winner='user'), expected(winner='user'))
+        self.assertEqual(self.fetch_all(difficulty='hard'), expected(difficulty_level='hard'))
+        self.assertEqual(self.fetch_all(category=self.other_category.id), expected(topic__category=self.other_category))
+        self.assertEqual(
+            self.fetch_all(created_after='2026-03-03', created_before='2026-03-04'),
+            expected(created_at__gte=timezone.make_aware(datetime(2026, 3, 3)), created_at__lt=timezone.make_aware(datetime(2026, 3, 5))))
+
+    def test_sparse_fieldset(self):
+        response = self.client.get(reverse('debate_history'), {'fields': 'id,topic_title,winner'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'topic_title', 'winner'})
+
+    def test_invalid_parameters(self):
+        url = reverse('debate_history')
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'page_size': '0'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'status': 'paused'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'fields': 'id,password'}).status_code, 400)
+
+
+class DebateSyncTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        self.messages = [
+            DebateMessage.objects.create(debate=self.debate, sender='user' if i % 2 == 0 else 'ai', content=f'Message {i}')
+            for i in range(4)
+        ]
+        Debate.objects.filter(pk=self.debate.pk).update(user_messages_count=2, ai_messages_count=2)
+        self.url = reverse('debate_detail', args=[self.debate.id])
+
+    def test_since_id_returns_only_newer_messages_and_status(self):
+        response = self.client.get(self.url, {'since_id': self.messages[1].id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['content'] for m in response.data['messages']], ['Message 2', 'Message 3'])
+        self.assertEqual(response.data['debate']['status'], 'active')
+        self.assertEqual(response.data['debate']['ai_messages_count'], 2)
+        self.assertNotIn('messages', response.data['debate'])
+
+    def test_unchanged_debate_returns_304_without_reading_messages(self):
+        etag = self.client.get(self.url, {'since_id': self.messages[-1].id})['ETag']
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'since_id': self.messages[-1].id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_changes_when_a_message_is_stored(self):
+        etag = self.client.get(self.url, {'since_id': self.messages[-1].id})['ETag']
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('A new reply.')):
+            self.client.post(reverse('debate_turn', args=[self.debate.id]), {'content': 'A new argument'}, content_type='application/json')
+
+        response = self.client.get(self.url, {'since_id': self.messages[-1].id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([m['content'] for m in response.data['messages']], ['A new argument', 'A new reply.'])
+
+    def test_full_representation_also_honours_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data['messages']), 4)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        # A delta request is a different representation with its own tag.
+        self.assertEqual(self.client.get(self.url, {'since_id': 0}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_invalid_since_id(self):
+        self.assertEqual(self.client.get(self.url, {'since_id': 'latest'}).status_code, 400)
+
+
+class CatalogCacheTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = self.topic.category
+        self.hard_topic = DebateTopic.objects.create(category=self.category, title='Hard topic', description='Tricky', difficulty_level='hard')
+        self.other = DebateCategory.objects.create(name='Other')
+        DebateTopic.objects.create(category=self.other, title='Other topic', description='Elsewhere')
+
+    def test_steady_state_runs_no_queries(self):
+        self.client.get(reverse('categories'))
+        self.client.get(reverse('topics'))
+        with self.assertNumQueries(0):
+            categories = self.client.get(reverse('categories'))
+            topics = self.client.get(reverse('topics'), {'category': self.category.id})
+        self.assertTrue({'Other', 'Testing'} <= {c['name'] for c in categories.data})
+        self.assertEqual([t['title'] for t in topics.data], ['Tests are worth writing', 'Hard topic'])
+
+    def test_filters(self):
+        response = self.client.get(reverse('topics'), {'category': self.category.id, 'difficulty': 'hard'})
+        self.assertEqual([t['title'] for t in response.data], ['Hard topic'])
+        self.assertEqual(self.client.get(reverse('topics'), {'category': 999}).data, [])
+
+    def test_saving_or_deleting_rows_invalidates(self):
+        self.client.get(reverse('topics'))
+        DebateTopic.objects.create(category=self.other, title='Fresh topic', description='New')
+        self.assertIn('Fresh topic', [t['title'] for t in self.client.get(reverse('topics')).data])
+
+        self.hard_topic.delete()
+        self.assertNotIn('Hard topic', [t['title'] for t in self.client.get(reverse('topics')).data])
+
+        self.other.is_active = False
+        self.other.save()
+        self.assertNotIn('Other', [c['name'] for c in self.client.get(reverse('dashboard')).data['available_categories']])
+
+    def test_etag_and_cache_control(self):
+        response = self.client.get(reverse('categories'))
+        self.assertTrue(response['Cache-Control'].startswith('public, max-age='))
+        self.assertFalse(response['ETag'].startswith('W/'))
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse('categories'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        # Each filter combination is its own representation.
+        filtered = self.client.get(reverse('topics'), {'difficulty': 'hard'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(filtered.status_code, 200)
+
+        DebateCategory.objects.create(name='Brand new')
+        self.assertEqual(self.client.get(reverse('categories'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_etag_follows_content_not_the_version(self):
+        first = self.client.get(reverse('categories'))['ETag']
+        # Even a version that failed to change must not reuse the tag for other content.
+        version = CatalogVersion.objects.get(pk=catalog.SINGLETON_PK).version
+        self.other.name = 'Renamed'
+        self.other.save()
+        CatalogVersion.objects.filter(pk=catalog.SINGLETON_PK).update(version=version)
+        self.assertNotEqual(self.client.get(reverse('categories'))['ETag'], first)
+
+        catalog.get_catalog().invalidate()
+        unchanged = self.client.get(reverse('categories'))['ETag']
+        catalog.get_catalog().invalidate()
+        self.assertEqual(self.client.get(reverse('categories'))['ETag'], unchanged)
+
+    def test_edits_by_other_processes_are_seen_after_the_check_interval(self):
+        cache = catalog.CatalogCache(check_interval=60)
+        self.assertIn('Other', [c['name'] for c in cache.categories()[1]])
+        # Another process's edit: the row changes, this process's signal handler does not run.
+        DebateCategory.objects.filter(pk=self.other.pk).update(is_active=False)
+        CatalogVersion.objects.filter(pk=catalog.SINGLETON_PK).update(version='edited-elsewhere')
+        with self.assertNumQueries(0):
+            self.assertIn('Other', [c['name'] for c in cache.categories()[1]])
+        cache.check_interval = 0
+        self.assertNotIn('Other', [c['name'] for c in cache.categories()[1]])
+
+
+
+class SiteStatisticsTests(DebateTestCase):
+    def assertStatsMatchTables(self):
+        stats = SiteStatistics.objects.get(pk=sitestats.SINGLETON_PK)
+        self.assertEqual({field: getattr(stats, field) for field in sitestats.COUNTER_FIELDS}, sitestats.true_counts())
+
+    def test_landing_page_reads_one_row(self):
+        self.client.logout()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('landing'))
+        self.assertEqual(response.context['active_users'], User.objects.count())
+        self.assertEqual(response.context['topics_count'], DebateTopic.objects.filter(is_active=True).count())
+
+    def test_counters_follow_writes(self):
+        self.assertStatsMatchTables()
+        self.client.patch(reverse('debate_detail', args=[self.debate.id]), {'action': 'end', 'winner': 'user'}, content_type='application/json')
+        # A second end is rejected and must not count twice.
+        self.client.patch(reverse('debate_detail', args=[self.debate.id]), {'action': 'end', 'winner': 'user'}, content_type='application/json')
+        User.objects.create_user(username='newcomer', password='secret123')
+        self.topic.is_active = False
+        self.topic.save()
+        self.assertStatsMatchTables()
+
+        self.debate.refresh_from_db()
+        self.debate.delete()
+        User.objects.get(username='newcomer').delete()
+        self.assertStatsMatchTables()
+
+    def test_missing_row_is_rebuilt(self):
+        SiteStatistics.objects.all().delete()
+        User.objects.create_user(username='newcomer', password='secret123')
+        self.assertStatsMatchTables()
+
+    def test_reconcile_command_corrects_drift(self):
+        SiteStatistics.objects.filter(pk=sitestats.SINGLETON_PK).update(completed_debates=99, registered_users=0)
+        call_command('reconcile_site_stats', stdout=open(os.devnull, 'w'))
+        self.assertStatsMatchTables()
+        self.assertIsNotNone(SiteStatistics.objects.get(pk=sitestats.SINGLETON_PK).reconciled_at)
+
+
+class LeaderboardTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        # (wins, total debates) per player; carol and dave tie.
+        records = {'alice': (9, 10), 'bob': (3, 10), 'carol': (6, 10), 'dave': (6, 10), 'erin': (1, 1)}
+        self.players = {}
+        for name, (wins, total) in records.items():
+            user = User.objects.create_user(username=name, password='secret123')
+            UserProfile.objects.filter(user=user).update(user_wins=wins, ai_wins=total - wins, total_debates=total)
+            # Reloaded so logging in does not save a stale cached profile.
+            self.players[name] = User.objects.get(pk=user.pk)
+        leaderboard.rebuild()
+
+    def ranking(self, **params):
+        response = self.client.get(reverse('leaderboard'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_migration_ranks_existing_players(self):
+        from importlib import import_module
+        from django.db.migrations.loader import MigrationLoader
+        migration = import_module('myapp.migrations.0011_populate_leaderboard')
+        state = MigrationLoader(connection).project_state(('myapp', '0011_populate_leaderboard'))
+        LeaderboardEntry.objects.all().delete()
+        LeaderboardScore.objects.all().delete()
+        migration.populate_leaderboard(state.apps, None)
+        self.assertEqual(LeaderboardEntry.objects.count(), 5)
+        self.assertEqual(LeaderboardScore.objects.get(score=leaderboard.compute_score(6, 10)).players, 2)
+        migrated = list(LeaderboardEntry.objects.order_by('user').values('user', 'score', 'win_rate'))
+        leaderboard.rebuild()
+        self.assertEqual(list(LeaderboardEntry.objects.order_by('user').values('user', 'score', 'win_rate')), migrated)
+
+    def test_ranks_by_win_rate_then_wins_with_shared_ranks(self):
+        results = self.ranking()['results']
+        self.assertEqual([(r['rank'], r['username']) for r in results],
+                         [(1, 'erin'), (2, 'alice'), (3, 'carol'), (3, 'dave'), (5, 'bob')])
+        self.assertEqual(results[1]['win_rate'], 90.0)
+
+    def test_pages_keep_ranks(self):
+        first = self.ranking(page_size=3)
+        self.assertEqual([r['rank'] for r in first['results']], [1, 2, 3])
+        cursor = first['next'].split('cursor=')[1].split('&')[0]
+        second = self.ranking(page_size=3, cursor=cursor)
+        self.assertEqual([(r['rank'], r['username']) for r in second['results']], [(3, 'dave'), (5, 'bob')])
+        self.assertIsNone(second['next'])
+
+    def test_my_rank(self):
+        self.client.force_login(self.players['dave'])
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('leaderboard_rank'))
+        self.assertEqual((response.data['rank'], response.data['username']), (3, 'dave'))
+
+        self.client.force_login(self.user)
+        self.assertIsNone(self.client.get(reverse('leaderboard_rank')).data['rank'])
+
+    def test_recorded_result_moves_player(self):
+        self.client.force_login(self.players['bob'])
+        for _ in range(2):
+            debate = Debate.objects.create(user=self.players['bob'], session_id='s', topic=self.topic, difficulty_level='easy', total_time_limit=5, reply_time_limit=60, status='active')
+            self.client.patch(reverse('debate_detail', args=[debate.id]), {'action': 'end', 'winner': 'user'}, content_type='application/json')
+        # bob is now 5/12 (41.67%), still behind carol and dave.
+        self.assertEqual(leaderboard.player_rank(self.players['bob'].id).rank, 5)
+
+        # The first result of a new player creates their entry.
+        self.client.force_login(self.user)
+        self.debate.refresh_from_db()
+        self.client.patch(reverse('debate_detail', args=[self.debate.id]), {'action': 'end', 'winner': 'user'}, content_type='application/json')
+        self.assertEqual(leaderboard.player_rank(self.user.id).rank, 1)
+        self.assertEqual(leaderboard.player_rank(self.players['erin'].id).rank, 1)
+        self.assertEqual(leaderboard.player_rank(self.players['alice'].id).rank, 3)
+        self.assertScoreCountsMatchEntries()
+
+    def test_deleting_a_player_updates_counts(self):
+        self.players['carol'].delete()
+        self.assertEqual(leaderboard.player_rank(self.players['bob'].id).rank, 4)
+        self.assertScoreCountsMatchEntries()
+
+    def assertScoreCountsMatchEntries(self):
+        counts = {}
+        for score in LeaderboardEntry.objects.values_list('score', flat=True):
+            counts[score] = counts.get(score, 0) + 1
+        stored = dict(LeaderboardScore.objects.exclude(players=0).values_list('score', 'players'))
+        self.assertEqual(stored, counts)
+
+
+class SQLiteTuningTests(SimpleTestCase):
+    def file_connection(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        wrapper = connections['default'].__class__({**connection.settings_dict, 'NAME': os.path.join(workdir, 'tuning.sqlite3')}, alias='tuning')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas_applied_on_connect(self):
+        pragmas = db.sqlite_settings(self.file_connection())
+        self.assertEqual(pragmas['journal_mode'], 'wal')
+        self.assertEqual(pragmas['busy_timeout'], 5000)
+        self.assertEqual(pragmas['synchronous'], 1)  # NORMAL
+        self.assertEqual(pragmas['temp_store'], 2)  # MEMORY
+        self.assertEqual(pragmas['cache_size'], -20000)
+
+    def test_disabled(self):
+        with override_settings(SQLITE_TUNING={'ENABLED': False, 'PRAGMAS': {'journal_mode': 'wal'}}):
+            pragmas = db.sqlite_settings(self.file_connection())
+        self.assertEqual(pragmas['journal_mode'], 'delete')
+
+    def test_rejects_unknown_pragmas_and_values(self):
+        with self.assertRaises(ImproperlyConfigured):
+            db.pragma_statements({'foreign_keys': 0})
+        with self.assertRaises(ImproperlyConfigured):
+            db.pragma_statements({'journal_mode': 'wal; DROP TABLE auth_user'})
+
+
+@override_settings(AI_CONTEXT={'TAIL_MESSAGES': 4, 'SUMMARIZE_EVERY': 4, 'SUMMARY_MAX_CHARS': 300, 'TOKEN_BUDGET': 200, 'CHARS_PER_TOKEN': 4})
+class ContextBuilderTests(DebateTestCase):
+    def add_messages(self, count, content='Argument {i}. With some supporting detail.'):
+        start = self.debate.messages.count()
+        for i in range(start, start + count):
+            DebateMessage.objects.create(debate=self.debate, sender='user' if i % 2 == 0 else 'ai', content=content.format(i=i))
+
+    def test_short_debate_is_sent_verbatim(self):
+        self.add_messages(3)
+        with self.assertNumQueries(1):
+            built = context.build_context(self.debate, pending_message='New point')
+        self.assertEqual(built.summary, '')
+        self.assertEqual([msg['content'] for msg in built.history][-1], 'New point')
+        self.assertEqual(len(built.history), 4)
+
+    def test_summary_rolls_forward_every_few_messages(self):
+        self.add_messages(8)
+        with self.assertNumQueries(2):
+            built = context.build_context(self.debate)
+        self.assertEqual(len(built.summary.splitlines()), 4)
+        self.assertEqual([msg['content'] for msg in built.history][0], 'Argument 4. With some supporting detail.')
+        self.debate.refresh_from_db()
+        self.assertEqual(self.debate.context_summary, built.summary)
+
+        # Nothing new to fold until another SUMMARIZE_EVERY messages arrive.
+        self.add_messages(3)
+        with self.assertNumQueries(1):
+            self.assertEqual(context.build_context(self.debate).summary, built.summary)
+        self.add_messages(1)
+        self.assertEqual(len(context.build_context(self.debate).summary.splitlines()), 8)
+
+    def test_cost_stays_constant_as_debates_grow(self):
+        sizes = []
+        for _ in range(6):
+            self.add_messages(20)
+            with CaptureQueriesContext(connection) as queries:
+                built = context.build_context(self.debate, pending_message='Next')
+            self.assertLessEqual(len(queries), 2)
+            sizes.append(sum(context.estimate_tokens(msg['content']) for msg in built.history) + context.estimate_tokens(built.summary))
+        self.assertLessEqual(max(sizes), 200)
+        self.assertLessEqual(len(self.debate.context_summary), 300)
+
+    def test_budget_trims_oldest_history_first(self):
+        self.add_messages(3, content='x' * 300)
+        built = context.build_context(self.debate, pending_message='Short and latest')
+        self.assertEqual([msg['content'] for msg in built.history], ['x' * 300, 'x' * 300, 'Short and latest'])
+
+    async def test_async_builder_matches(self):
+        for i in range(8):
+            await DebateMessage.objects.acreate(debate=self.debate, sender='user' if i % 2 == 0 else 'ai', content=f'Point {i}.')
+        built = await context.abuild_context(self.debate)
+        self.assertEqual(len(built.summary.splitlines()), 4)
+        self.assertEqual((await Debate.objects.aget(pk=self.debate.pk)).summary_through_id, built.summary_update['summary_through_id'])
+
+
+@override_settings(AI_JOB_QUEUE={'ENABLED': True, 'MAX_DEPTH': 3, 'PER_USER_LIMIT': 1, 'POLL_INTERVAL': 0.05})
+class AIJobQueueTests(DebateTestCase):
+    def new_debate(self, user=None, session_id='session'):
+        return Debate.objects.create(user=user, session_id=session_id, topic=self.topic, difficulty_level='easy', total_time_limit=5, reply_time_limit=75, status='active')
+
+    def request_reply(self, debate, message='Tests catch bugs'):
+        return self.client.post(reverse('ai_response', args=[debate.id]), {'user_message': message}, content_type='application/json')
+
+    def drain(self, reply='Queued replies keep the site up.'):
+        with mock.patch('myapp.jobs.get_ai_service', return_value=stub_service(reply)):
+            return jobs.work('test-worker', threading.Event(), drain=True)
+
+    def test_reply_is_queued_and_completed_by_a_worker(self):
+        response = self.request_reply(self.debate)
+        self.assertEqual(response.status_code, 202)
+        status_url = response.data['status_url']
+        self.assertEqual(response['Location'], status_url)
+        self.assertEqual(self.client.get(status_url).json()['status'], 'queued')
+        self.assertFalse(self.debate.messages.exists())
+
+        self.assertEqual(self.drain(), 1)
+        job = self.client.get(status_url).json()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['result']['message']['content'], 'Queued replies keep the site up.')
+        self.assertEqual(job['result']['debate_status']['ai_messages'], 1)
+        self.assertEqual(self.debate.messages.get().sender, 'ai')
+
+    def test_repeated_request_returns_the_outstanding_job(self):
+        first = self.request_reply(self.debate)
+        second = self.request_reply(self.debate)
+        self.assertEqual(second.status_code, 202)
+        self.assertEqual(second.data['job']['id'], first.data['job']['id'])
+        self.assertEqual(AIGenerationJob.objects.count(), 1)
+
+    def test_limits_push_back_instead_of_queueing(self):
+        self.request_reply(self.debate)
+        response = self.request_reply(self.new_debate(user=self.user))
+        self.assertEqual(response.status_code, 429)
+
+        for i in range(2):
+            other = User.objects.create_user(username=f'queued{i}', password='secret123')
+            jobs.enqueue(self.new_debate(user=other), 'Hi', user=other)
+        crowded = User.objects.create_user(username='crowded', password='secret123')
+        with self.assertRaises(jobs.QueueFull):
+            jobs.enqueue(self.new_debate(user=crowded), 'Hi', user=crowded)
+        self.client.force_login(User.objects.get(pk=crowded.pk))
+        response = self.request_reply(Debate.objects.get(user=crowded))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+    def test_registered_users_go_before_guests(self):
+        guest_job, _ = jobs.enqueue(self.new_debate(session_id='guest'), 'Hi', session_id='guest')
+        user_job, _ = jobs.enqueue(self.debate, 'Hi', user=self.user)
+        self.assertEqual(jobs.queue_position(guest_job), 1)
+        self.assertEqual(jobs.claim('w1').pk, user_job.pk)
+        self.assertEqual(jobs.claim('w2').pk, guest_job.pk)
+        self.assertIsNone(jobs.claim('w3'))
+
+    def test_long_poll_waits_for_the_job(self):
+        job, _ = jobs.enqueue(self.debate, 'Hi', user=self.user)
+        start = time.perf_counter()
+        response = self.client.get(reverse('ai_job_status', args=[job.pk]), {'wait': '0.2'})
+        self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+        self.assertEqual((response.json()['status'], response.json()['position']), ('queued', 0))
+
+        other = User.objects.create_user(username='other', password='secret123')
+        self.client.force_login(User.objects.get(pk=other.pk))
+        self.assertEqual(self.client.get(reverse('ai_job_status', args=[job.pk])).status_code, 404)
+
+    def test_reply_of_a_requeued_run_is_not_stored(self):
+        job, _ = jobs.enqueue(self.debate, 'Hi', user=self.user)
+        stale = jobs.claim('stalled')
+        service = stub_service('Late reply.')
+        generate = service.generate_response
+
+        def requeued_meanwhile(**kwargs):
+            AIGenerationJob.objects.filter(pk=job.pk).update(status='queued', worker='', started_at=None)
+            return generate(**kwargs)
+
+        with mock.patch('myapp.jobs.get_ai_service', return_value=service), mock.patch.object(service, 'generate_response', side_effect=requeued_meanwhile):
+            self.assertFalse(jobs.run(stale))
+        self.assertFalse(self.debate.messages.exists())
+        self.debate.refresh_from_db()
+        self.assertEqual(self.debate.ai_messages_count, 0)
+
+        self.assertEqual(self.drain(), 1)
+        self.assertEqual(self.debate.messages.filter(sender='ai').count(), 1)
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        job, _ = jobs.enqueue(self.debate, 'Hi', user=self.user)
+        jobs.claim('crashed')
+        long_ago = timezone.now() - timedelta(hours=1)
+        AIGenerationJob.objects.filter(pk=job.pk).update(started_at=long_ago)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+
+        AIGenerationJob.objects.filter(pk=job.pk).update(status='running', started_at=long_ago, attempts=3)
+        self.assertEqual(jobs.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+
+@override_settings(RATE_LIMITS={
+    'ENABLED': True,
+    'GROUPS': {'ai': {'user': (6, 2), 'session': (6, 2), 'ip': (60, 3)}, 'messages': {'user': (60, 2)}},
+    'ENDPOINTS': {'ai_response': 'ai', 'ai_response_stream': 'ai', 'debate_messages': 'messages'},
+    'DIFFICULTY_COST': {'ai': {'hard': 2}},
+    'CONCURRENCY': {'ai': 1},
+    'RETRY_AFTER': 3,
+})
+class AdmissionControlTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        # Debate ids are reused between tests, so forget remembered difficulties.
+        ratelimit.reset_admission_controller()
+
+    def post_message(self, client=None):
+        return (client or self.client).post(reverse('debate_messages', args=[self.debate.id]), {'content': 'Point', 'sender': 'user'}, content_type='application/json')
+
+    def request_reply(self, debate=None, client=None):
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('Reply.')):
+            return (client or self.client).post(reverse('ai_response', args=[(debate or self.debate).id]), {'user_message': 'Hi'}, content_type='application/json')
+
+    def test_token_bucket_returns_429_with_retry_after(self):
+        self.assertEqual([self.post_message().status_code for _ in range(3)], [201, 201, 429])
+        response = self.post_message()
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(response.json()['error'], 'Too many requests')
+        self.assertEqual(self.debate.messages.count(), 2)
+
+    def test_bucket_refills_over_time(self):
+        limiter = ratelimit.TokenBucketLimiter()
+        buckets = [('ratelimit:test:user:1', 6, 2)]
+        with mock.patch('myapp.ratelimit.time.time', return_value=1000.0):
+            self.assertEqual([limiter.take(buckets) for _ in range(2)], [0, 0])
+            self.assertAlmostEqual(limiter.take(buckets), 10.0)
+        with mock.patch('myapp.ratelimit.time.time', return_value=1010.0):
+            self.assertEqual(limiter.take(buckets), 0)
+            self.assertGreater(limiter.take(buckets), 0)
+
+    def test_guests_share_their_ip_bucket(self):
+        statuses = []
+        for i in range(4):
+            guest = Client(REMOTE_ADDR='203.0.113.9')
+            guest.get(reverse('auth_status'))
+            session = guest.session
+            session.save()
+            debate = Debate.objects.create(session_id=session.session_key, topic=self.topic, difficulty_level='easy', total_time_limit=5, reply_time_limit=75, status='active')
+            statuses.append(self.request_reply(debate, client=guest).status_code)
+        self.assertEqual(statuses, [201, 201, 201, 429])
+
+    def test_forwarded_for_is_only_trusted_behind_proxies(self):
+        factory = RequestFactory()
+        request = factory.get('/', REMOTE_ADDR='10.0.0.2', HTTP_X_FORWARDED_FOR='1.2.3.4, 198.51.100.7')
+        self.assertEqual(ratelimit.get_client_ip(request, 0), '10.0.0.2')
+        self.assertEqual(ratelimit.get_client_ip(request, 1), '198.51.100.7')
+        self.assertEqual(ratelimit.get_client_ip(request, 2), '1.2.3.4')
+        self.assertEqual(ratelimit.get_client_ip(request, 5), '1.2.3.4')
+
+        # Guests cannot leave their IP bucket by sending a made-up header.
+        statuses = []
+        for i in range(4):
+            guest = Client(REMOTE_ADDR='203.0.113.9', HTTP_X_FORWARDED_FOR=f'192.0.2.{i}')
+            guest.get(reverse('auth_status'))
+            session = guest.session
+            session.save()
+            debate = Debate.objects.create(session_id=session.session_key, topic=self.topic, difficulty_level='easy', total_time_limit=5, reply_time_limit=75, status='active')
+            statuses.append(self.request_reply(debate, client=guest).status_code)
+        self.assertEqual(statuses, [201, 201, 201, 429])
+
+    def test_process_local_cache_is_reported(self):
+        from .checks import check_rate_limit_cache
+        self.assertEqual([w.id for w in check_rate_limit_cache(None)], ['myapp.W001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+        with self.settings(CACHES=redis):
+            self.assertEqual(check_rate_limit_cache(None), [])
+        with self.settings(RATE_LIMITS={'ENABLED': False}):
+            self.assertEqual(check_rate_limit_cache(None), [])
+
+    def test_hard_debates_cost_more(self):
+        self.debate.difficulty_level = 'hard'
+        self.debate.save()
+        self.assertEqual([self.request_reply().status_code for _ in range(2)], [201, 429])
+
+    def test_concurrency_cap_sheds_load_until_slots_free(self):
+        controller = ratelimit.get_admission_controller()
+        self.assertTrue(controller.acquire_slot('ai'))
+        response = self.request_reply()
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '3'))
+        controller.release_slot('ai')
+
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('Streamed.')):
+            response = self.client.post(reverse('ai_response_stream', args=[self.debate.id]), {'user_message': 'Hi'}, content_type='application/json')
+            # The slot is held until the stream has been sent.
+            self.assertFalse(controller.acquire_slot('ai'))
+            b"".join(response.streaming_content)
+        self.assertTrue(controller.acquire_slot('ai'))
+        controller.release_slot('ai')
+
+    def test_unread_stream_frees_its_slot_when_closed(self):
+        controller = ratelimit.get_admission_controller()
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('Streamed.')):
+            response = self.client.post(reverse('ai_response_stream', args=[self.debate.id]), {'user_message': 'Hi'}, content_type='application/json')
+        self.assertFalse(controller.acquire_slot('ai'))
+        # The client went away before the first chunk.
+        response.close()
+        self.assertTrue(controller.acquire_slot('ai'))
+        controller.release_slot('ai')
+
+
+@override_settings(IDEMPOTENCY={'ENABLED': True})
+class IdempotencyTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+
+    def post_message(self, key, content='Point'):
+        return self.client.post(reverse('debate_messages', args=[self.debate.id]), {'content': content, 'sender': 'user'},
+                                content_type='application/json', headers={'Idempotency-Key': key})
+
+    def test_keyed_message_is_created_once_and_replayed(self):
+        first = self.post_message('abc')
+        second = self.post_message('abc')
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(self.debate.messages.count(), 1)
+        self.assertEqual(self.post_message('def').status_code, 201)
+
+    def test_rejects_reused_and_malformed_keys(self):
+        self.post_message('abc')
+        self.assertEqual(self.post_message('abc', content='Another point').status_code, 422)
+        self.assertEqual(self.post_message(' ').status_code, 400)
+        self.assertEqual(self.post_message('k' * 256).status_code, 400)
+        self.assertEqual(self.debate.messages.count(), 1)
+
+    def test_duplicate_reply_for_a_turn_is_generated_once(self):
+        service = stub_service('Only once.')
+        url = reverse('ai_response', args=[self.debate.id])
+        with mock.patch('myapp.views.get_ai_service', return_value=service):
+            first = self.client.post(url, {'user_message': 'Hi'}, content_type='application/json')
+            second = self.client.post(url, {'user_message': 'Hi'}, content_type='application/json')
+            stream = self.client.post(reverse('ai_response_stream', args=[self.debate.id]), {'user_message': 'Hi'}, content_type='application/json')
+            events = parse_sse(b"".join(stream.streaming_content).decode())
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(events, [('done', first.json())])
+        self.assertEqual(service.backend.calls, 1)
+        self.assertEqual(self.debate.messages.filter(sender='ai').count(), 1)
+
+    def test_waiting_requests_get_the_result_of_the_one_in_flight(self):
+        metrics.idempotent_requests_total.reset()
+        flight = idempotency.SingleFlight(wait_timeout=5, poll_interval=0.01)
+        stored, lease = flight.claim('turn', 'same')
+        self.assertIsNone(stored)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            waiters = [pool.submit(flight.claim, 'turn', 'same') for _ in range(3)]
+            time.sleep(0.05)
+            flight.complete('turn', lease, 'same', 201, {'reply': 'shared'})
+            results = [waiter.result() for waiter in waiters]
+        self.assertEqual(results, [({'fingerprint': 'same', 'status': 201, 'data': {'reply': 'shared'}}, None)] * 3)
+        self.assertEqual(metrics.idempotent_requests_total.snapshot(), {'["executed"]': 1, '["coalesced"]': 3})
+
+    def test_server_errors_and_abandoned_leases_are_retried(self):
+        flight = idempotency.SingleFlight(wait_timeout=0.05, poll_interval=0.01)
+        _, lease = flight.claim('turn', 'same')
+        with self.assertRaises(idempotency.StillInFlight):
+            flight.claim('turn', 'same')
+        flight.complete('turn', lease, 'same', 500, {'error': 'failed'})
+        stored, lease = flight.claim('turn', 'same')
+        self.assertIsNone(stored)
+        self.assertIsNotNone(lease)
+
+    def test_duplicate_in_flight_gets_the_first_response(self):
+        def claim(key):
+            request = mock.Mock(headers={'Idempotency-Key': key}, data={'content': 'Point', 'sender': 'user'}, user=self.user)
+            key, fingerprint = idempotency.flight_key(request, 'debate_messages')
+            flight = idempotency.get_single_flight()
+            return flight, key, fingerprint, flight.claim(key, fingerprint)[1]
+
+        flight, key, fingerprint, lease = claim('abc')
+        finisher = threading.Timer(0.2, flight.complete, (key, lease, fingerprint, 201, {'content': 'Point'}))
+        finisher.start()
+        response = self.post_message('abc')
+        finisher.join()
+        self.assertEqual((response.status_code, response.json()), (200, {'content': 'Point'}))
+
+        claim('def')
+        with self.settings(IDEMPOTENCY={'ENABLED': True, 'WAIT_TIMEOUT': 0}):
+            response = self.post_message('def')
+        self.assertEqual((response.status_code, response['Retry-After']), (409, '1'))
+        self.assertEqual(self.debate.messages.count(), 0)
+
+    @override_settings(IDEMPOTENCY={'ENABLED': True, 'DEGRADED_TTL': 0})
+    def test_fallback_replies_are_not_replayed_for_long(self):
+        url = reverse('ai_response', args=[self.debate.id])
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('Recovered.')):
+            with mock.patch.object(StubBackend, 'available', new_callable=mock.PropertyMock, return_value=False):
+                first = self.client.post(url, {'user_message': 'Hi'}, content_type='application/json')
+            second = self.client.post(url, {'user_message': 'Hi'}, content_type='application/json')
+        self.assertEqual(first.json()['message']['content'], UNAVAILABLE_MESSAGE)
+        self.assertEqual((second.status_code, second.json()['message']['content']), (201, 'Recovered.'))
+
+    def test_process_local_cache_is_reported(self):
+        from .checks import check_idempotency_cache
+        self.assertEqual([w.id for w in check_idempotency_cache(None)], ['myapp.W002'])
+        with self.settings(IDEMPOTENCY={'ENABLED': False}):
+            self.assertEqual(check_idempotency_cache(None), [])
+
+    @override_settings(IDEMPOTENCY={'ENABLED': True, 'WAIT_TIMEOUT': 0.05})
+    def test_streams_release_their_lease_when_never_read(self):
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('Streamed.')):
+            url = reverse('ai_response_stream', args=[self.debate.id])
+            self.client.post(url, {'user_message': 'Hi'}, content_type='application/json').close()
+            events = parse_sse(b"".join(self.client.post(url, {'user_message': 'Hi'}, content_type='application/json').streaming_content).decode())
+        self.assertEqual(events[-1][0], 'done')
+
+        turn = {'content': 'Tests catch bugs', 'turn_id': '00000000-0000-0000-0000-000000000001'}
+        url = reverse('debate_turn_stream', args=[self.debate.id])
+        with mock.patch('myapp.views.DebateTurnView.get_context', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.client.post(url, turn, content_type='application/json')
+        with mock.patch('myapp.views.get_ai_service', return_value=stub_service('Streamed.')):
+            events = parse_sse(b"".join(self.client.post(url, turn, content_type='application/json').streaming_content).decode())
+        self.assertEqual(events[-1][0], 'done')
+
+
+def resilience_config(**overrides):
+    return dict(settings.AI_RESILIENCE, BACKOFF=0, **overrides)
+
+
+class ResilienceTests(TestCase):
+    def setUp(self):
+        resilience.reset_resilience_policy()
+        metrics.registry.reset()
+
+    def test_breaker_opens_probes_and_closes(self):
+        now = [0.0]
+        breaker = resilience.CircuitBreaker('stub', window=4, min_calls=4, failure_rate=0.5, open_seconds=10, clock=lambda: now[0])
+        for failed in (False, True, False, True):
+            breaker.record_failure() if failed else breaker.record_success()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+        now[0] = 10
+        self.assertEqual((breaker.allow(), breaker.allow()), (True, False))
+        breaker.record_failure()
+        self.assertEqual(breaker.status()['retry_in'], 10)
+        now[0] = 20
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual([(t['from'], t['to']) for t in breaker.transitions],
+                         [('closed', 'open'), ('open', 'half_open'), ('half_open', 'open'), ('open', 'half_open'), ('half_open', 'closed')])
+        self.assertIn('debato_ai_circuit_transitions_total{backend="stub",from_state="half_open",to_state="closed"} 1', metrics.registry.render())
+
+    def test_deadline_is_a_share_of_the_reply_time_limit(self):
+        policy = resilience.ResiliencePolicy(resilience_config(DEADLINE_FRACTION={'hard': 0.5}, DEFAULT_DEADLINE=20, MAX_DEADLINE=30))
+        self.assertEqual(policy.deadline('hard', 40), 20)
+        self.assertEqual(policy.deadline('easy', 40), 30)
+        self.assertEqual(policy.deadline('hard'), 20)
+
+    def test_failed_attempts_are_retried(self):
+        policy = resilience.ResiliencePolicy(resilience_config(MAX_ATTEMPTS=3))
+        outcomes = iter([RuntimeError('flaky'), RuntimeError('flaky'), 'Recovered.'])
+
+        def call():
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(policy.call('stub', call, 'easy', 5), 'Recovered.')
+        self.assertIn('debato_ai_call_retries_total{difficulty="easy"} 2', metrics.registry.render())
+
+    def test_slow_call_is_hedged(self):
+        policy = resilience.ResiliencePolicy(resilience_config(HEDGE=True, HEDGE_MIN_SAMPLES=1, HEDGE_MIN_DELAY=0.01))
+        policy.latencies.observe('easy', 0.02)
+        calls = []
+
+        def call():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return 'Slow.'
+            return 'Fast.'
+
+        start = time.monotonic()
+        self.assertEqual(policy.call('stub', call, 'easy', 5), 'Fast.')
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertIn('debato_ai_hedged_requests_total{difficulty="easy",result="won"} 1', metrics.registry.render())
+
+    @override_settings(AI_RESILIENCE=resilience_config(MAX_DEADLINE=0.1))
+    def test_stuck_backend_call_falls_back_at_the_deadline(self):
+        service = DebateAIService(backend=SimulatorBackend(failure_rate=0, stall_rate=1.0, stall_latency=0.5))
+        start = time.monotonic()
+        reply = service.generate_response('Hi', 'Topic', 'easy', [], reply_time_limit=60)
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertIn('trouble', reply['content'])
+        self.assertIn('debato_ai_fallback_replies_total{reason="timeout"} 1', metrics.registry.render())
+
+        events = list(service.stream_response('Hi again', 'Topic', 'easy', [], reply_time_limit=60))
+        self.assertIn('trouble', events[-1]['content'])
+
+    @override_settings(AI_RESILIENCE=resilience_config(MAX_DEADLINE=0.1))
+    def test_async_call_falls_back_at_the_deadline(self):
+        service = DebateAIService(backend=SimulatorBackend(failure_rate=0, stall_rate=1.0, stall_latency=0.5))
+        reply = asyncio.run(service.agenerate_response('Hi', 'Topic', 'easy', []))
+        self.assertIn('trouble', reply['content'])
+
+    @override_settings(AI_RESILIENCE=resilience_config(MAX_ATTEMPTS=1, BREAKER={'WINDOW': 2, 'MIN_CALLS': 2}))
+    def test_open_circuit_serves_fallbacks_without_calling_the_backend(self):
+        service = DebateAIService(backend=SimulatorBackend(failure_rate=1.0, prefix_cache=False))
+        for _ in range(2):
+            service.generate_response('Hi', 'Topic', 'easy', [])
+        reply = service.generate_response('Hi', 'Topic', 'easy', [])
+        self.assertEqual(reply['content'], UNAVAILABLE_MESSAGE)
+        self.assertEqual(service.backend.failures, 2)
+        status = resilience.get_resilience_policy().status()['simulator']
+        self.assertEqual(status['state'], 'open')
+        self.assertEqual(status['transitions'][-1]['to'], 'open')
+        self.assertIn('debato_ai_fallback_replies_total{reason="circuit_open"} 1', metrics.registry.render())
@@ -3,6 +3,9 @@ from .views import (
     # Authentication Views
     UserRegistrationView, UserLoginView, UserLogoutView, check_auth_status,
     
+    # Health and Diagnostics
+    ai_readiness, QueryStatsView,
+    
     # Page Views
     landing_page, debate_setup_page, debate_room_page, login_page, register_page,
     
@@ -14,9 +17,10 @@ from .views import (
     
     # Debate Management
     DebateCreateView, DebateDetailView, DebateMessageView, DebateHistoryView,
+    LeaderboardView, LeaderboardRankView,
     
     # AI Response
-    AIResponseView
+    AIResponseView, AIResponseStreamView, DebateTurnView, DebateTurnStreamView
 )
 from . import views
 
@@ -48,5 +52,17 @@ urlpatterns = [
     path('api/debates/<int:debate_id>/', DebateDetailView.as_view(), name='debate_detail'),
     path('api/debates/<int:debate_id>/messages/', DebateMessageView.as_view(), name='debate_messages'),
     path('api/debates/<int:debate_id>/ai-response/', AIResponseView.as_view(), name='ai_response'),
+    path('api/debates/<int:debate_id>/ai-response/stream/', AIResponseStreamView.as_view(), name='ai_response_stream'),
+    path('api/debates/<int:debate_id>/ai-response/async/', views.ai_response_async, name='ai_response_async'),
+    path('api/debates/<int:debate_id>/turn/', DebateTurnView.as_view(), name='debate_turn'),
+    path('api/debates/<int:debate_id>/turn/stream/', DebateTurnStreamView.as_view(), name='debate_turn_stream'),
+    path('api/ai-jobs/<uuid:job_id>/', views.ai_job_status, name='ai_job_status'),
     path('api/debates/history/', DebateHistoryView.as_view(), name='debate_history'),
+    path('api/leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
+    path('api/leaderboard/me/', LeaderboardRankView.as_view(), name='leaderboard_rank'),
+    
+    # API endpoints for Health and Diagnostics
+    path('api/health/ai/', ai_readiness, name='ai_readiness'),
+    path('api/admin/query-stats/', QueryStatsView.as_view(), name='query_stats'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
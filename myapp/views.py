@@ -1,29 +1,47 @@
+import asyncio
+import hashlib
+import ipaddress
+import json
 import uuid
+from datetime import datetime, time, timedelta
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.db.models import Q
 from django.shortcuts import render, redirect, get_object_or_404
-from rest_framework import status, generics
+from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
 from .models import (
     UserProfile, DebateCategory, DebateTopic,
-    Debate, DebateMessage, GuestSession
+    Debate, DebateMessage, GuestSession, LeaderboardEntry, AIGenerationJob
 )
 from .serializers import (
     UserProfileSerializer, DebateCategorySerializer, DebateTopicSerializer,
     DebateSerializer, DebateCreateSerializer, DebateHistorySerializer,
     DebateMessageSerializer, UserRegistrationSerializer, UserLoginSerializer,
-    GuestSessionSerializer, DashboardSerializer
+    GuestSessionSerializer, DashboardSerializer, DebateHistoryFilterSerializer,
+    DebateStatusSerializer, LeaderboardEntrySerializer, AIGenerationJobSerializer
 )
-from .ai_service import DebateAIService
+from .pagination import KeysetPagination, LeaderboardPagination
+from .ai_service import ai_clients, get_ai_service, is_fallback
+from .catalog import get_catalog
+from .context import abuild_context, build_context
+from .middleware import query_stats
+from .ratelimit import get_client_ip
+from . import idempotency, jobs, leaderboard, metrics, sitestats
 import logging
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import parse_etags, quote_etag
+from django.core.serializers.json import DjangoJSONEncoder
+from asgiref.sync import sync_to_async
 
 logger = logging.getLogger(__name__)
 
@@ -36,14 +54,11 @@ def register_page(request):
     return render(request, 'register.html')
 
 def landing_page(request):
-    total_debates = Debate.objects.filter(status='completed').count()
-    active_users = User.objects.count()
-    topics_count = DebateTopic.objects.filter(is_active=True).count()
-
+    stats = sitestats.get_statistics()
     context = {
-        'total_debates': total_debates,
-        'active_users': active_users,
-        'topics_count': topics_count,
+        'total_debates': stats.completed_debates,
+        'active_users': stats.registered_users,
+        'topics_count': stats.active_topics,
     }
     return render(request, 'landing.html', context)
 
@@ -52,7 +67,11 @@ def dashboard_page(request):
     """Render the user's dashboard page."""
     try:
         profile = request.user.userprofile
-        recent_debates = Debate.objects.filter(user=request.user).order_by('-created_at')[:5]
+        recent_debates = (
+            Debate.objects.filter(user=request.user).select_related('topic')
+            .only('topic__title', 'difficulty_level', 'winner', 'ended_at', 'created_at')
+            .order_by('-created_at')[:5]
+        )
 
         context = {
             'profile': profile,
@@ -113,20 +132,15 @@ def debate_room_page(request, debate_id):
     }
     return render(request, 'debate_room.html', context)
 
-def get_client_ip(request):
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
-
 class UserRegistrationView(APIView):
     permission_classes = [AllowAny]
     def post(self, request):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
+            session_id = request.session.session_key
+            if session_id and GuestSession.objects.filter(session_id=session_id).exists():
+                metrics.guest_conversions_total.inc()
             login(request, user)
             return Response({'message': 'User registered successfully', 'user': {'id': user.id, 'username': user.username, 'email': user.email}}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -155,13 +169,12 @@ class DashboardView(APIView):
     permission_classes = [AllowAny]
     def get(self, request):
         data = {}
-        categories = DebateCategory.objects.filter(is_active=True)
-        data['available_categories'] = DebateCategorySerializer(categories, many=True).data
+        data['available_categories'] = get_catalog().categories()[1]
         if request.user.is_authenticated:
             try:
                 profile = request.user.userprofile
                 data['user_profile'] = UserProfileSerializer(profile).data
-                recent_debates = Debate.objects.filter(user=request.user).order_by('-created_at')[:5]
+                recent_debates = DebateHistorySerializer.setup_eager_loading(Debate.objects.filter(user=request.user)).order_by('-created_at')[:5]
                 data['recent_debates'] = DebateHistorySerializer(recent_debates, many=True).data
                 data['scoreboard'] = {'user_wins': profile.user_wins, 'ai_wins': profile.ai_wins, 'total_debates': profile.total_debates, 'win_rate': profile.win_rate()}
             except UserProfile.DoesNotExist:
@@ -195,23 +208,36 @@ class UserProfileView(APIView):
         except UserProfile.DoesNotExist:
             return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
-class DebateCategoryListView(generics.ListAPIView):
-    queryset = DebateCategory.objects.filter(is_active=True)
-    serializer_class = DebateCategorySerializer
+def catalog_response(request, digest, variant, data):
+    """Serves catalog data with a strong ETag built from its content digest.
+
+    The catalog views skip authentication, so the session is never loaded
+    and the responses stay cacheable by shared proxies.
+    """
+    etag = quote_etag(f"catalog-{hashlib.sha1(variant.encode()).hexdigest()[:12]}-{digest}")
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'CATALOG_CACHE', {}).get('MAX_AGE', 300)}"
+    return response
+
+class DebateCategoryListView(APIView):
+    authentication_classes = []
     permission_classes = [AllowAny]
+    def get(self, request):
+        digest, categories = get_catalog().categories()
+        return catalog_response(request, digest, 'categories', categories)
 
-class DebateTopicListView(generics.ListAPIView):
-    serializer_class = DebateTopicSerializer
+class DebateTopicListView(APIView):
+    authentication_classes = []
     permission_classes = [AllowAny]
-    def get_queryset(self):
-        queryset = DebateTopic.objects.filter(is_active=True)
-        category_id = self.request.query_params.get('category', None)
-        difficulty = self.request.query_params.get('difficulty', None)
-        if category_id:
-            queryset = queryset.filter(category_id=category_id)
-        if difficulty:
-            queryset = queryset.filter(difficulty_level=difficulty)
-        return queryset
+    def get(self, request):
+        category_id = request.query_params.get('category', None)
+        difficulty = request.query_params.get('difficulty', None)
+        digest, topics = get_catalog().topics(category_id, difficulty)
+        return catalog_response(request, digest, f"topics:{category_id or ''}:{difficulty or ''}", topics)
 
 class DebateCreateView(APIView):
     permission_classes = [AllowAny]
@@ -250,85 +276,120 @@ class DebateCreateView(APIView):
             logger.error(f"Error creating debate: {str(e)}")
             return Response({'error': 'Failed to create debate'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def debate_etag(debate, variant):
+    """Strong validator for one representation of a debate.
+
+    Built from the debate row alone: every stored message bumps a counter in
+    the same transaction, so the tag changes whenever the transcript or the
+    debate state does, and checking it needs no message query.
+    """
+    state = [debate.pk, debate.status, debate.winner, debate.started_at, debate.ended_at,
+             debate.user_messages_count, debate.ai_messages_count, variant]
+    return quote_etag(hashlib.sha1(json.dumps(state, cls=DjangoJSONEncoder).encode()).hexdigest()[:32])
+
 class DebateDetailView(APIView):
     permission_classes = [AllowAny]
-    def get_debate(self, debate_id, request):
+    def get_debate(self, debate_id, request, queryset=None):
+        debates = queryset if queryset is not None else DebateSerializer.setup_eager_loading(Debate.objects.all())
         try:
             if request.user.is_authenticated:
-                return Debate.objects.get(id=debate_id, user=request.user)
+                return debates.get(id=debate_id, user=request.user)
             else:
                 session_id = request.session.session_key
                 if not session_id:
                     return None
-                return Debate.objects.get(id=debate_id, session_id=session_id)
+                return debates.get(id=debate_id, session_id=session_id)
         except Debate.DoesNotExist:
             return None
     def get(self, request, debate_id):
-        debate = self.get_debate(debate_id, request)
+        """Returns the full debate or, with ``?since_id=``, only its compact
+        status and the messages stored after that id.
+
+        A matching ``If-None-Match`` gets a 304 before any message is read.
+        """
+        since_id = request.query_params.get('since_id')
+        if since_id is not None:
+            try:
+                since_id = int(since_id)
+            except ValueError:
+                return Response({'error': 'since_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            debate = self.get_debate(debate_id, request, Debate.objects.all())
+        else:
+            debate = self.get_debate(debate_id, request, Debate.objects.select_related('user', 'topic__category'))
         if not debate:
             return Response({'error': 'Debate not found'}, status=status.HTTP_404_NOT_FOUND)
-        return Response(DebateSerializer(debate).data)
+
+        etag = debate_etag(debate, 'full' if since_id is None else f'since:{since_id}')
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif since_id is None:
+            response = Response(DebateSerializer(debate).data)
+        else:
+            messages = debate.messages.filter(id__gt=since_id).order_by('timestamp', 'id')
+            response = Response({'debate': DebateStatusSerializer(debate).data, 'messages': DebateMessageSerializer(messages, many=True).data})
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     def patch(self, request, debate_id):
         logger.info(f"PATCH request for debate {debate_id}: {request.data}")
         debate = self.get_debate(debate_id, request)
         if not debate:
             return Response({'error': 'Debate not found'}, status=status.HTTP_404_NOT_FOUND)
         action = request.data.get('action')
+        # Each transition is a conditional UPDATE on the expected current
+        # status, so concurrent requests cannot both apply it and no row is
+        # read back and rewritten in full.
+        debates = Debate.objects.filter(pk=debate.pk)
         try:
             if action == 'start':
-                if debate.status != 'setup':
+                changes = {'status': 'active', 'started_at': timezone.now()}
+                if not debates.filter(status='setup').update(**changes):
                     return Response({'error': 'Debate is not in setup state'}, status=status.HTTP_400_BAD_REQUEST)
-                debate.status = 'active'
-                debate.started_at = timezone.now()
-                debate.save()
             elif action == 'end':
-                if debate.status not in ['active', 'setup']:
-                    return Response({'error': 'Debate cannot be ended from current state'}, status=status.HTTP_400_BAD_REQUEST)
-                debate.status = 'completed'
-                debate.ended_at = timezone.now()
                 winner = request.data.get('winner', 'ai')
-                debate.winner = winner
-                if winner == 'user' and debate.user:
-                    try:
-                        profile = debate.user.userprofile
-                        profile.user_wins += 1
-                        profile.total_debates += 1
-                        profile.save()
-                    except UserProfile.DoesNotExist:
-                        logger.error(f"UserProfile not found for user {debate.user.username}")
-                elif winner == 'ai':
-                    if debate.user:
-                        try:
-                            profile = debate.user.userprofile
-                            profile.ai_wins += 1
-                            profile.total_debates += 1
-                            profile.save()
-                        except UserProfile.DoesNotExist:
-                            logger.error(f"UserProfile not found for user {debate.user.username}")
-                    else:
-                        try:
-                            guest_session = GuestSession.objects.get(session_id=debate.session_id)
-                            guest_session.has_used_free_debate = True
-                            guest_session.save()
-                        except GuestSession.DoesNotExist:
-                            logger.error(f"GuestSession not found for session {debate.session_id}")
-                debate.save()
+                changes = {'status': 'completed', 'ended_at': timezone.now(), 'winner': winner}
+                with transaction.atomic():
+                    if not debates.filter(status__in=['active', 'setup']).update(**changes):
+                        return Response({'error': 'Debate cannot be ended from current state'}, status=status.HTTP_400_BAD_REQUEST)
+                    self.record_result(debate, winner)
+                    sitestats.increment(completed_debates=1)
+                metrics.debates_completed_total.inc(winner=winner)
             elif action == 'abandon':
-                debate.status = 'abandoned'
-                debate.ended_at = timezone.now()
-                debate.winner = 'ai'
-                debate.save()
+                changes = {'status': 'abandoned', 'ended_at': timezone.now(), 'winner': 'ai'}
+                if not debates.filter(status__in=['active', 'setup']).update(**changes):
+                    return Response({'error': 'Debate cannot be abandoned from current state'}, status=status.HTTP_400_BAD_REQUEST)
             else:
                 return Response({'error': 'Invalid action'}, status=status.HTTP_400_BAD_REQUEST)
+            for field, value in changes.items():
+                setattr(debate, field, value)
             return Response(DebateSerializer(debate).data)
         except Exception as e:
             logger.error(f"Error updating debate {debate_id}: {str(e)}")
             return Response({'error': 'Failed to update debate'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def record_result(self, debate, winner):
+        """Updates the owner's scoreboard, or uses up a guest's free debate, with atomic increments."""
+        if debate.user_id:
+            wins_field = {'user': 'user_wins', 'ai': 'ai_wins'}.get(winner)
+            if wins_field is None:
+                return
+            increments = {wins_field: F(wins_field) + 1, 'total_debates': F('total_debates') + 1}
+            if not UserProfile.objects.filter(user_id=debate.user_id).update(**increments):
+                logger.error(f"UserProfile not found for user {debate.user_id}")
+                return
+            leaderboard.update_player(debate.user_id)
+        elif winner == 'ai':
+            if not GuestSession.objects.filter(session_id=debate.session_id).update(has_used_free_debate=True):
+                logger.error(f"GuestSession not found for session {debate.session_id}")
+
 class DebateMessageView(APIView):
     permission_classes = [AllowAny]
     def post(self, request, debate_id):
         logger.info(f"User message for debate {debate_id}: {request.data}")
+        return idempotency.run_once(request, 'debate_messages', lambda: self.create_message(request, debate_id))
+
+    def create_message(self, request, debate_id):
         if request.user.is_authenticated:
             try:
                 debate = Debate.objects.get(id=debate_id, user=request.user)
@@ -351,12 +412,10 @@ class DebateMessageView(APIView):
             message_data = {'debate': debate.id, 'sender': request.data.get('sender', 'user'), 'content': content, 'response_time': request.data.get('response_time')}
             serializer = DebateMessageSerializer(data=message_data)
             if serializer.is_valid():
-                message = serializer.save(debate=debate)
-                if message.sender == 'user':
-                    debate.user_messages_count += 1
-                else:
-                    debate.ai_messages_count += 1
-                debate.save()
+                with transaction.atomic():
+                    message = serializer.save(debate=debate)
+                    counter = 'user_messages_count' if message.sender == 'user' else 'ai_messages_count'
+                    Debate.objects.filter(pk=debate.pk).update(**{counter: F(counter) + 1})
                 return Response(DebateMessageSerializer(message).data, status=status.HTTP_201_CREATED)
             else:
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -365,11 +424,95 @@ class DebateMessageView(APIView):
             return Response({'error': 'Failed to create message'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class DebateHistoryView(APIView):
+    """A user's debates, newest first, one keyset-paginated page at a time.
+
+    Accepts ``status``, ``winner``, ``difficulty``, ``category`` and a
+    ``created_after``/``created_before`` date range (both inclusive), plus
+    ``fields`` to return only a comma-separated subset of the columns.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    def get(self, request):
+        filters = DebateHistoryFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+        debates = Debate.objects.filter(user=request.user)
+        if 'status' in params:
+            debates = debates.filter(status=params['status'])
+        if 'winner' in params:
+            debates = debates.filter(winner=params['winner'])
+        if 'difficulty' in params:
+            debates = debates.filter(difficulty_level=params['difficulty'])
+        if 'category' in params:
+            debates = debates.filter(topic__category_id=params['category'])
+        # Compare against day boundaries rather than created_at__date so the
+        # range stays a plain index range.
+        if 'created_after' in params:
+            debates = debates.filter(created_at__gte=timezone.make_aware(datetime.combine(params['created_after'], time.min)))
+        if 'created_before' in params:
+            debates = debates.filter(created_at__lt=timezone.make_aware(datetime.combine(params['created_before'] + timedelta(days=1), time.min)))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(DebateHistorySerializer.setup_eager_loading(debates), request, view=self)
+        serializer = DebateHistorySerializer(page, many=True, fields=params.get('fields'))
+        return paginator.get_paginated_response(serializer.data)
+
+class LeaderboardView(APIView):
+    """Players ranked by win rate, then wins, one keyset-paginated page at a time."""
+    permission_classes = [AllowAny]
+    pagination_class = LeaderboardPagination
+    def get(self, request):
+        paginator = self.pagination_class()
+        entries = LeaderboardEntrySerializer.setup_eager_loading(LeaderboardEntry.objects.all())
+        page = leaderboard.assign_ranks(paginator.paginate_queryset(entries, request, view=self))
+        return paginator.get_paginated_response(LeaderboardEntrySerializer(page, many=True).data)
+
+class LeaderboardRankView(APIView):
+    """The requesting user's leaderboard rank, or null before their first result."""
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        debates = Debate.objects.filter(user=request.user).order_by('-created_at')
-        serializer = DebateHistorySerializer(debates, many=True)
-        return Response(serializer.data)
+        entry = leaderboard.player_rank(request.user.id)
+        return Response(LeaderboardEntrySerializer(entry).data if entry else {'rank': None})
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def ai_readiness(request):
+    """Reports whether this worker's AI client is initialized and warm."""
+    ai_status = ai_clients.status()
+    http_status = status.HTTP_200_OK if ai_status['initialized'] else status.HTTP_503_SERVICE_UNAVAILABLE
+    return Response(ai_status, status=http_status)
+
+def internal_address(ip):
+    """Whether ``ip`` is a loopback or private network address."""
+    try:
+        address = ipaddress.ip_address(ip or '')
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of the app metrics, merged across worker
+    processes. Scrapers authenticate with the METRICS token; without one
+    configured, only internal addresses may scrape unless METRICS is PUBLIC.
+    """
+    config = getattr(settings, 'METRICS', {})
+    token = config.get('TOKEN')
+    if token:
+        allowed = request.headers.get('Authorization') == f'Bearer {token}'
+    else:
+        allowed = config.get('PUBLIC', False) or internal_address(get_client_ip(request))
+    if not allowed:
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class QueryStatsView(APIView):
+    """Staff-only view of the per-endpoint query samples kept by QueryInstrumentationMiddleware."""
+    permission_classes = [IsAdminUser]
+    def get(self, request):
+        return Response(query_stats.summary(include_samples=request.query_params.get('samples') == '1'))
+    def delete(self, request):
+        query_stats.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -381,39 +524,387 @@ def check_auth_status(request):
 
 class AIResponseView(APIView):
     permission_classes = [AllowAny]
-    def post(self, request, debate_id):
-        logger.info(f"AI response request for debate {debate_id}")
-        ai_service = DebateAIService()
+    def get_turn_context(self, request, debate_id):
+        """Loads the debate, its prompt context and the user message this turn answers.
+
+        Returns ``(debate, context, user_message, error_response)``; only
+        ``error_response`` is set when the turn cannot proceed.
+        """
+        debates = Debate.objects.select_related('topic')
         if request.user.is_authenticated:
             try:
-                debate = Debate.objects.get(id=debate_id, user=request.user)
+                debate = debates.get(id=debate_id, user=request.user)
             except Debate.DoesNotExist:
-                return Response({'error': 'Debate not found'}, status=status.HTTP_404_NOT_FOUND)
+                return None, None, None, Response({'error': 'Debate not found'}, status=status.HTTP_404_NOT_FOUND)
         else:
             session_id = request.session.session_key
             if not session_id:
-                return Response({'error': 'Session not found'}, status=status.HTTP_400_BAD_REQUEST)
+                return None, None, None, Response({'error': 'Session not found'}, status=status.HTTP_400_BAD_REQUEST)
             try:
-                debate = Debate.objects.get(id=debate_id, session_id=session_id)
+                debate = debates.get(id=debate_id, session_id=session_id)
             except Debate.DoesNotExist:
-                return Response({'error': 'Debate not found'}, status=status.HTTP_404_NOT_FOUND)
+                return None, None, None, Response({'error': 'Debate not found'}, status=status.HTTP_404_NOT_FOUND)
         if debate.status != 'active':
-            return Response({'error': 'Debate is not active'}, status=status.HTTP_400_BAD_REQUEST)
-        messages = debate.messages.all().order_by('timestamp')
-        conversation_history = [{'sender': msg.sender, 'content': msg.content, 'timestamp': msg.timestamp.isoformat()} for msg in messages]
+            return None, None, None, Response({'error': 'Debate is not active'}, status=status.HTTP_400_BAD_REQUEST)
+        context = build_context(debate)
         user_message = request.data.get('user_message', '')
         if not user_message:
-            last_user_message = messages.filter(sender='user').last()
-            if last_user_message:
-                user_message = last_user_message.content
+            user_messages = [msg['content'] for msg in context.history if msg['sender'] == 'user']
+            if user_messages:
+                user_message = user_messages[-1]
+            else:
+                last_user_message = debate.messages.filter(sender='user').order_by('timestamp').last()
+                user_message = last_user_message.content if last_user_message else ''
         if not user_message:
-            return Response({'error': 'No user message found'}, status=status.HTTP_400_BAD_REQUEST)
+            return None, None, None, Response({'error': 'No user message found'}, status=status.HTTP_400_BAD_REQUEST)
+        return debate, context, user_message, None
+
+    def turn_key(self, debate, user_message):
+        """Identifies the turn a reply answers, so duplicate requests for it share one generation."""
+        return debate.pk, debate.created_at.isoformat(), debate.user_messages_count, user_message
+
+    def save_ai_message(self, debate, ai_response):
+        return jobs.record_ai_reply(debate, ai_response)
+
+    def enqueue(self, request, debate, user_message):
+        """Queues the reply for a background worker and answers 202 with the job to poll."""
+        retry_after = str(jobs.queue_settings()['RETRY_AFTER'])
+        user = request.user if request.user.is_authenticated else None
+        try:
+            job, created = jobs.enqueue(debate, user_message, user=user, session_id=request.session.session_key)
+        except jobs.QueueFull:
+            return Response({'error': 'AI is busy, please try again shortly'}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': retry_after})
+        except jobs.TooManyJobs:
+            return Response({'error': 'Too many AI replies in progress'}, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': retry_after})
+        status_url = reverse('ai_job_status', args=[job.pk])
+        data = {'job': AIGenerationJobSerializer(job).data, 'status_url': status_url}
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+
+    def post(self, request, debate_id):
+        logger.info(f"AI response request for debate {debate_id}")
+        debate, context, user_message, error_response = self.get_turn_context(request, debate_id)
+        if error_response:
+            return error_response
+        if jobs.queue_settings()['ENABLED']:
+            # The queue already keeps one job per debate; only an explicit Idempotency-Key applies.
+            return idempotency.run_once(request, 'ai_response', lambda: self.enqueue(request, debate, user_message))
+        return idempotency.run_once(request, 'ai_response', lambda: self.generate(debate, context, user_message), turn=self.turn_key(debate, user_message), degraded=fallback_reply)
+
+    def generate(self, debate, context, user_message):
+        try:
+            ai_response = get_ai_service().generate_response(user_message=user_message, topic=debate.topic.title, difficulty=debate.difficulty_level, conversation_history=context.history, summary=context.summary, reply_time_limit=debate.reply_time_limit)
+            return Response(self.save_ai_message(debate, ai_response), status=status.HTTP_201_CREATED)
+        except Exception as e:
+            logger.error(f"Error generating AI response for debate {debate.pk}: {str(e)}")
+            return Response({'error': 'Failed to generate AI response', 'details': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def sse_event(event, data):
+    """Formats a single Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+def fallback_reply(payload) -> bool:
+    """Whether a stored AI reply or turn is a canned fallback, which is only replayed briefly."""
+    return is_fallback(payload.get('message', {}).get('content', ''))
+
+def sse_response(event_stream, ticket=None):
+    """
+    An event stream response. The lease of a ``ticket`` is released when the
+    server closes the response, which it does even if the client went away
+    before the stream was ever read.
+    """
+    response = StreamingHttpResponse(event_stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    if ticket is not None:
+        response._resource_closers.append(ticket.release)
+    return response
+
+def replayed_sse_response(response):
+    """A stored result of a deduplicated request as a lone ``done`` event; errors stay plain responses."""
+    if response.status_code >= 400:
+        return response
+    replay = sse_response(iter([sse_event('done', response.data)]))
+    replay['Idempotent-Replayed'] = 'true'
+    return replay
+
+class AIResponseStreamView(AIResponseView):
+    """Server-Sent Events variant of AIResponseView.
+
+    Emits a ``chunk`` event for every piece of generated text and a final
+    ``done`` event with the persisted message once generation finishes. A
+    duplicate of a reply already generated, or being generated, gets just
+    the ``done`` event.
+    """
+    def post(self, request, debate_id):
+        logger.info(f"Streaming AI response request for debate {debate_id}")
+        ai_service = get_ai_service()
+        debate, context, user_message, error_response = self.get_turn_context(request, debate_id)
+        if error_response:
+            return error_response
+        ticket, replayed = idempotency.begin(request, 'ai_response', turn=self.turn_key(debate, user_message))
+        if replayed is not None:
+            return replayed_sse_response(replayed)
+
+        def event_stream():
+            try:
+                for event in ai_service.stream_response(user_message=user_message, topic=debate.topic.title, difficulty=debate.difficulty_level, conversation_history=context.history, summary=context.summary, reply_time_limit=debate.reply_time_limit):
+                    if event['type'] == 'chunk':
+                        yield sse_event('chunk', {'content': event['content']})
+                    else:
+                        payload = self.save_ai_message(debate, event)
+                        if ticket is not None:
+                            ticket.complete(status.HTTP_201_CREATED, payload, fallback_reply(payload))
+                        yield sse_event('done', payload)
+            except Exception as e:
+                logger.error(f"Error streaming AI response for debate {debate_id}: {str(e)}")
+                yield sse_event('error', {'error': 'Failed to generate AI response'})
+            finally:
+                if ticket is not None:
+                    ticket.release()
+
+        return sse_response(event_stream(), ticket)
+
+class DebateTurnView(APIView):
+    """One round trip per debate turn.
+
+    Validates the user's argument, generates the AI reply from the recent
+    history and stores both messages and both counter updates in a single
+    transaction. A client-generated ``turn_id`` makes the request safe to
+    retry: a turn that was already stored is returned as-is rather than
+    generated and saved a second time.
+    """
+    permission_classes = [AllowAny]
+
+    def get_debate(self, request, debate_id):
+        """Returns ``(debate, error_response)`` for an active debate owned by the requester."""
+        debates = Debate.objects.select_related('topic')
+        try:
+            if request.user.is_authenticated:
+                debate = debates.get(id=debate_id, user=request.user)
+            else:
+                session_id = request.session.session_key
+                if not session_id:
+                    return None, Response({'error': 'Session not found'}, status=status.HTTP_400_BAD_REQUEST)
+                debate = debates.get(id=debate_id, session_id=session_id)
+        except Debate.DoesNotExist:
+            return None, Response({'error': 'Debate not found'}, status=status.HTTP_404_NOT_FOUND)
+        if debate.status != 'active':
+            return None, Response({'error': 'Debate is not active'}, status=status.HTTP_400_BAD_REQUEST)
+        return debate, None
+
+    def parse_turn(self, request):
+        """Returns ``(content, turn_id, error_response)`` from the request body."""
+        content = str(request.data.get('content', '')).strip()
+        if not content:
+            return None, None, Response({'error': 'Message content is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(content) > 1000:
+            return None, None, Response({'error': 'Message too long (max 1000 characters)'}, status=status.HTTP_400_BAD_REQUEST)
+        turn_id = request.data.get('turn_id')
+        if turn_id:
+            try:
+                turn_id = uuid.UUID(str(turn_id))
+            except ValueError:
+                return None, None, Response({'error': 'turn_id must be a UUID'}, status=status.HTTP_400_BAD_REQUEST)
+        return content, turn_id or None, None
+
+    def get_context(self, debate, content):
+        """The prompt context: the debate summary, recent messages and this turn's argument."""
+        return build_context(debate, pending_message=content)
+
+    def get_saved_turn(self, debate, turn_id):
+        """Returns the payload of an already stored turn, or None."""
+        if turn_id is None:
+            return None
+        saved = {message.sender: message for message in debate.messages.filter(turn_id=turn_id)}
+        if 'user' not in saved or 'ai' not in saved:
+            return None
+        debate.refresh_from_db(fields=['user_messages_count', 'ai_messages_count'])
+        return self.turn_payload(debate, saved['user'], saved['ai'])
+
+    def save_turn(self, debate, content, turn_id, ai_response):
+        """Stores both messages and bumps both counters atomically; returns ``(payload, created)``."""
         try:
-            ai_response = ai_service.generate_response(user_message=user_message, topic=debate.topic.title, difficulty=debate.difficulty_level, conversation_history=conversation_history)
-            ai_message = DebateMessage.objects.create(debate=debate, sender='ai', content=ai_response['content'], response_time=ai_response['response_time'])
-            debate.ai_messages_count += 1
-            debate.save()
-            return Response({'message': DebateMessageSerializer(ai_message).data, 'debate_status': {'user_messages': debate.user_messages_count, 'ai_messages': debate.ai_messages_count, 'total_messages': debate.user_messages_count + debate.ai_messages_count}}, status=status.HTTP_201_CREATED)
+            with transaction.atomic():
+                user_message = DebateMessage.objects.create(debate=debate, sender='user', content=content, turn_id=turn_id)
+                ai_message = DebateMessage.objects.create(debate=debate, sender='ai', content=ai_response['content'], response_time=ai_response['response_time'], time_to_first_token=ai_response.get('time_to_first_token'), turn_id=turn_id)
+                Debate.objects.filter(pk=debate.pk).update(user_messages_count=F('user_messages_count') + 1, ai_messages_count=F('ai_messages_count') + 1)
+                debate.refresh_from_db(fields=['user_messages_count', 'ai_messages_count'])
+        except IntegrityError:
+            # A concurrent retry of the same turn stored it first.
+            payload = self.get_saved_turn(debate, turn_id)
+            if payload is None:
+                raise
+            return payload, False
+        return self.turn_payload(debate, user_message, ai_message), True
+
+    def turn_payload(self, debate, user_message, ai_message):
+        return {
+            'user_message': DebateMessageSerializer(user_message).data,
+            'message': DebateMessageSerializer(ai_message).data,
+            'debate_status': {'user_messages': debate.user_messages_count, 'ai_messages': debate.ai_messages_count, 'total_messages': debate.user_messages_count + debate.ai_messages_count},
+        }
+
+    def post(self, request, debate_id):
+        logger.info(f"Turn request for debate {debate_id}")
+        debate, error_response = self.get_debate(request, debate_id)
+        if error_response:
+            return error_response
+        content, turn_id, error_response = self.parse_turn(request)
+        if error_response:
+            return error_response
+        saved = self.get_saved_turn(debate, turn_id)
+        if saved is not None:
+            return Response(saved, status=status.HTTP_200_OK)
+        return idempotency.run_once(request, 'debate_turn', lambda: self.complete_turn(debate, content, turn_id), turn=self.turn_key(debate, turn_id), degraded=fallback_reply)
+
+    def turn_key(self, debate, turn_id):
+        return (debate.pk, debate.created_at.isoformat(), turn_id) if turn_id is not None else None
+
+    def complete_turn(self, debate, content, turn_id):
+        try:
+            context = self.get_context(debate, content)
+            ai_response = get_ai_service().generate_response(user_message=content, topic=debate.topic.title, difficulty=debate.difficulty_level, conversation_history=context.history, summary=context.summary, reply_time_limit=debate.reply_time_limit)
+            payload, created = self.save_turn(debate, content, turn_id, ai_response)
+            return Response(payload, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
         except Exception as e:
-            logger.error(f"Error generating AI response for debate {debate_id}: {str(e)}")
-            return Response({'error': 'Failed to generate AI response', 'details': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            logger.error(f"Error completing turn for debate {debate.pk}: {str(e)}")
+            return Response({'error': 'Failed to generate AI response', 'details': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class DebateTurnStreamView(DebateTurnView):
+    """Server-Sent Events variant of DebateTurnView.
+
+    Emits ``chunk`` events while the reply is generated and a ``done`` event
+    with the stored turn; a retried turn that was already stored gets just
+    the ``done`` event.
+    """
+    def post(self, request, debate_id):
+        logger.info(f"Streaming turn request for debate {debate_id}")
+        debate, error_response = self.get_debate(request, debate_id)
+        if error_response:
+            return error_response
+        content, turn_id, error_response = self.parse_turn(request)
+        if error_response:
+            return error_response
+        saved = self.get_saved_turn(debate, turn_id)
+        if saved is not None:
+            return sse_response(iter([sse_event('done', saved)]))
+        ticket, replayed = idempotency.begin(request, 'debate_turn', turn=self.turn_key(debate, turn_id))
+        if replayed is not None:
+            return replayed_sse_response(replayed)
+        try:
+            context = self.get_context(debate, content)
+            ai_service = get_ai_service()
+        except BaseException:
+            if ticket is not None:
+                ticket.release()
+            raise
+
+        def event_stream():
+            try:
+                for event in ai_service.stream_response(user_message=content, topic=debate.topic.title, difficulty=debate.difficulty_level, conversation_history=context.history, summary=context.summary, reply_time_limit=debate.reply_time_limit):
+                    if event['type'] == 'chunk':
+                        yield sse_event('chunk', {'content': event['content']})
+                    else:
+                        payload = self.save_turn(debate, content, turn_id, event)[0]
+                        if ticket is not None:
+                            ticket.complete(status.HTTP_201_CREATED, payload, fallback_reply(payload))
+                        yield sse_event('done', payload)
+            except Exception as e:
+                logger.error(f"Error streaming turn for debate {debate_id}: {str(e)}")
+                yield sse_event('error', {'error': 'Failed to generate AI response'})
+            finally:
+                if ticket is not None:
+                    ticket.release()
+
+        return sse_response(event_stream(), ticket)
+
+async def ai_response_async(request, debate_id):
+    """Async variant of AIResponseView for ASGI deployments.
+
+    The debate lookup and history read use the async ORM and the model call
+    is awaited, so a single process can hold many in-flight turns without
+    tying up a thread per turn. The reply is stored as the sync view stores
+    it, in one transaction with the counter update.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    logger.info(f"Async AI response request for debate {debate_id}")
+    user = await request.auser()
+    debates = Debate.objects.select_related('topic')
+    try:
+        if user.is_authenticated:
+            debate = await debates.aget(id=debate_id, user=user)
+        else:
+            session_id = request.session.session_key
+            if not session_id:
+                return JsonResponse({'error': 'Session not found'}, status=status.HTTP_400_BAD_REQUEST)
+            debate = await debates.aget(id=debate_id, session_id=session_id)
+    except Debate.DoesNotExist:
+        return JsonResponse({'error': 'Debate not found'}, status=status.HTTP_404_NOT_FOUND)
+    if debate.status != 'active':
+        return JsonResponse({'error': 'Debate is not active'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+    context = await abuild_context(debate)
+    user_message = data.get('user_message', '')
+    if not user_message:
+        user_messages = [msg['content'] for msg in context.history if msg['sender'] == 'user']
+        if user_messages:
+            user_message = user_messages[-1]
+        else:
+            last_user_message = await debate.messages.filter(sender='user').order_by('timestamp').alast()
+            user_message = last_user_message.content if last_user_message else ''
+    if not user_message:
+        return JsonResponse({'error': 'No user message found'}, status=status.HTTP_400_BAD_REQUEST)
+    # Claiming may wait for a duplicate in flight; do it off the event loop.
+    turn = (debate.pk, debate.created_at.isoformat(), debate.user_messages_count, user_message)
+    ticket, replayed = await sync_to_async(idempotency.begin, thread_sensitive=False)(request, 'ai_response', turn=turn, data=data, user=user)
+    if replayed is not None:
+        headers = {header: value for header, value in replayed.headers.items() if header != 'Content-Type'}
+        return JsonResponse(replayed.data, status=replayed.status_code, headers=headers)
+    try:
+        ai_response = await get_ai_service().agenerate_response(user_message=user_message, topic=debate.topic.title, difficulty=debate.difficulty_level, conversation_history=context.history, summary=context.summary, reply_time_limit=debate.reply_time_limit)
+        payload = await sync_to_async(jobs.record_ai_reply)(debate, ai_response)
+        if ticket is not None:
+            await sync_to_async(ticket.complete, thread_sensitive=False)(status.HTTP_201_CREATED, payload, fallback_reply(payload))
+        return JsonResponse(payload, status=status.HTTP_201_CREATED)
+    except Exception as e:
+        logger.error(f"Error generating async AI response for debate {debate_id}: {str(e)}")
+        return JsonResponse({'error': 'Failed to generate AI response', 'details': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    finally:
+        if ticket is not None:
+            await sync_to_async(ticket.release, thread_sensitive=False)()
+
+async def ai_job_status(request, job_id):
+    """Status of a queued AI reply, with the stored message once it is done.
+
+    ``?wait=<seconds>`` long-polls: the response is held until the job
+    finishes or the wait, capped at LONG_POLL_TIMEOUT, runs out.
+    """
+    config = jobs.queue_settings()
+    user = await request.auser()
+    session_id = request.session.session_key
+    if not user.is_authenticated and not session_id:
+        return JsonResponse({'error': 'Session not found'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        wait = min(max(float(request.GET.get('wait', 0)), 0), config['LONG_POLL_TIMEOUT'])
+    except ValueError:
+        return JsonResponse({'error': 'wait must be a number of seconds'}, status=status.HTTP_400_BAD_REQUEST)
+    owned = AIGenerationJob.objects.filter(**jobs.owner_filter(user if user.is_authenticated else None, session_id))
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        try:
+            job = await owned.aget(pk=job_id)
+        except AIGenerationJob.DoesNotExist:
+            return JsonResponse({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        remaining = deadline - loop.time()
+        if job.status not in jobs.ACTIVE_STATUSES or remaining <= 0:
+            break
+        await asyncio.sleep(min(config['POLL_INTERVAL'], remaining))
+    data = AIGenerationJobSerializer(job).data
+    if job.status == 'queued':
+        data['position'] = await sync_to_async(jobs.queue_position)(job)
+    return JsonResponse(data)
@@ -16,6 +16,12 @@ class DebateRoom {
         this.totalSeconds = this.debate.total_time_limit * 60;
         this.replySeconds = this.debate.reply_time_limit;
 
+        //SYNC STATE
+        this.lastMessageId = 0;
+        this.syncETag = null;
+        this.syncing = false;
+        this.turnInFlight = false;
+
         //DOM ELEMENTS
         this.elements = {
             startButton: document.getElementById('start-debate-btn'),
@@ -35,6 +41,9 @@ class DebateRoom {
 
     initialize() {
         this.addEventListeners();
+        if (this.debate.status !== 'setup') {
+            this.resync();
+        }
     }
 
     addEventListeners() {
@@ -55,6 +64,40 @@ class DebateRoom {
                 }
             });
         }
+        // Catch up on anything missed while offline or in a background tab.
+        window.addEventListener('online', () => this.resync());
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'visible') this.resync();
+        });
+    }
+
+    async resync() {
+        if (this.turnInFlight || this.syncing) return;
+        this.syncing = true;
+        try {
+            const headers = this.syncETag ? { 'If-None-Match': this.syncETag } : {};
+            const response = await fetch(`/api/debates/${this.debate.id}/?since_id=${this.lastMessageId}`, { headers });
+            if (response.status === 304 || !response.ok) return;
+            this.syncETag = response.headers.get('ETag');
+            const data = await response.json();
+            data.messages.forEach((message) => {
+                this.addMessageToUI(message);
+                this.lastMessageId = Math.max(this.lastMessageId, message.id);
+            });
+            if (data.messages.length && this.elements.welcomeMessage) {
+                this.elements.welcomeMessage.style.display = 'none';
+            }
+            if (['completed', 'abandoned'].includes(data.debate.status) && this.debate.status !== data.debate.status) {
+                this.debate.status = data.debate.status;
+                this.stopTimers();
+                this.elements.messageInput.disabled = true;
+                this.elements.sendButton.disabled = true;
+            }
+        } catch (error) {
+            // Still offline; the next online/visibility event retries.
+        } finally {
+            this.syncing = false;
+        }
     }
 
     async startDebate() {
@@ -83,24 +126,41 @@ class DebateRoom {
         this.addMessageToUI({ sender: 'user', content });
         this.showTypingIndicator();
         this.stopReplyTimer();
+        this.turnInFlight = true;
 
         try {
-            await fetch(`/api/debates/${this.debate.id}/messages/`, {
+            // One request per turn; the turn id lets a dropped request be
+            // retried without storing the argument or the reply twice.
+            const turnId = crypto.randomUUID();
+            const sendTurn = () => fetch(`/api/debates/${this.debate.id}/turn/stream/`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json', 'X-CSRFToken': this.csrfToken },
-                body: JSON.stringify({ content: content, sender: 'user' }),
+                body: JSON.stringify({ content: content, turn_id: turnId }),
             });
+            let aiResponse;
+            try {
+                aiResponse = await sendTurn();
+            } catch (networkError) {
+                aiResponse = await sendTurn();
+            }
+            if (!aiResponse.ok || !aiResponse.body) throw new Error('Failed to get AI response.');
 
-            const aiResponse = await fetch(`/api/debates/${this.debate.id}/ai-response/`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json', 'X-CSRFToken': this.csrfToken },
-                body: JSON.stringify({ user_message: content }),
+            let messageText = null;
+            await this.readEventStream(aiResponse, (event, data) => {
+                if (event === 'error') throw new Error(data.error);
+                if (!messageText) {
+                    this.hideTypingIndicator();
+                    messageText = this.addMessageToUI({ sender: 'ai', content: '' }).querySelector('.message-text');
+                }
+                if (event === 'chunk') {
+                    messageText.textContent += data.content;
+                } else if (event === 'done') {
+                    messageText.textContent = data.message.content;
+                    this.lastMessageId = Math.max(this.lastMessageId, data.user_message.id, data.message.id);
+                }
+                this.elements.messagesContainer.scrollTop = this.elements.messagesContainer.scrollHeight;
             });
-            if (!aiResponse.ok) throw new Error('Failed to get AI response.');
-
-            const aiData = await aiResponse.json();
-            this.hideTypingIndicator();
-            this.addMessageToUI(aiData.message);
+            if (!messageText) throw new Error('AI response stream ended early.');
             
             this.elements.sendButton.disabled = false;
             this.startReplyTimer();
@@ -109,6 +169,32 @@ class DebateRoom {
             this.hideTypingIndicator();
             this.addMessageToUI({ sender: 'system', content: 'An error occurred. Please try again.' });
             this.elements.sendButton.disabled = false;
+        } finally {
+            this.turnInFlight = false;
+        }
+    }
+    
+    async readEventStream(response, onEvent) {
+        // Minimal Server-Sent Events parser for fetch() response bodies.
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let data = '';
+                frame.split('\n').forEach((line) => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                if (data) onEvent(event, JSON.parse(data));
+            }
         }
     }
     
@@ -194,6 +280,7 @@ class DebateRoom {
         messageElement.innerHTML = `<div class="message-avatar">${avatar}</div><div class="message-content"><div class="message-header"><span class="sender-name">${message.sender === 'user' ? 'You' : 'Debato AI'}</span></div><div class="message-text">${message.content}</div></div>`;
         this.elements.messagesContainer.appendChild(messageElement);
         this.elements.messagesContainer.scrollTop = this.elements.messagesContainer.scrollHeight;
+        return messageElement;
     }
     showTypingIndicator() {
         if (!this.elements.typingIndicator) {